@@ -0,0 +1,44 @@
+"""Daily sales rollup
+
+Revision ID: 1c7a8f3e5d20
+Revises: 9e3d5a61c2b8
+Create Date: 2026-10-18 12:21:07.553904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c7a8f3e5d20'
+down_revision: Union[str, None] = '9e3d5a61c2b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('daily_sales',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('payment_type', sa.String(), nullable=False),
+    sa.Column('receipt_count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Numeric(), nullable=False),
+    sa.Column('change_given', sa.Numeric(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'payment_type')
+    )
+    # Backfill from the existing receipts
+    op.execute("""
+        INSERT INTO daily_sales (user_id, day, payment_type, receipt_count, total, change_given)
+        SELECT user_id, date(created_at), coalesce(payment_type, ''), count(*),
+               coalesce(sum(total), 0), coalesce(sum(change_given), 0)
+        FROM receipts
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, date(created_at), coalesce(payment_type, '')
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('daily_sales')
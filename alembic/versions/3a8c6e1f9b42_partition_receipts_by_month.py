@@ -0,0 +1,167 @@
+"""Partition receipts and receipt_items by month
+
+Revision ID: 3a8c6e1f9b42
+Revises: 6f2d9b4e7a13
+Create Date: 2026-10-18 14:12:36.804172
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a8c6e1f9b42'
+down_revision: Union[str, None] = '6f2d9b4e7a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+# Receipts stored without a creation time are moved to this point in time, which lands in the default partition
+MISSING_CREATED_AT = "timestamp '1970-01-01'"
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partitions(table: str, first_month: date, last_month: date) -> None:
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    month = first_month
+    while month <= last_month:
+        op.execute(f"CREATE TABLE {table}_y{month.year}m{month.month:02d} PARTITION OF {table} "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        month = add_months(month, 1)
+
+
+def upgrade() -> None:
+    # Partitioned tables cannot be created by altering existing ones: the old tables are renamed,
+    # copied into their partitioned replacements and dropped
+    op.drop_constraint('idempotency_keys_receipt_id_fkey', 'idempotency_keys', type_='foreignkey')
+    op.drop_constraint('receipt_items_receipt_id_fkey', 'receipt_items', type_='foreignkey')
+    for table in ('receipts', 'receipt_items'):
+        op.rename_table(table, f'{table}_unpartitioned')
+        op.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_unpartitioned_pkey")
+    op.drop_index('ix_receipts_user_id_created_at_id', table_name='receipts_unpartitioned')
+    op.drop_index('ix_receipts_user_id_payment_type_created_at_id', table_name='receipts_unpartitioned')
+    op.drop_index('ix_receipt_items_receipt_id', table_name='receipt_items_unpartitioned')
+    op.drop_index('ix_receipt_items_product_id', table_name='receipt_items_unpartitioned')
+
+    op.create_table('receipts',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('receipts_id_seq'::regclass)"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('total', sa.Numeric(), nullable=True),
+    sa.Column('payment_type', sa.String(), nullable=True),
+    sa.Column('payment_amount', sa.Numeric(), nullable=True),
+    sa.Column('change_given', sa.Numeric(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index('ix_receipts_user_id_created_at_id', 'receipts', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_receipts_user_id_payment_type_created_at_id', 'receipts',
+                    ['user_id', 'payment_type', 'created_at', 'id'], unique=False)
+    op.create_table('receipt_items',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('receipt_items_id_seq'::regclass)"),
+              nullable=False),
+    sa.Column('receipt_id', sa.Integer(), nullable=True),
+    sa.Column('receipt_created_at', sa.DateTime(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Numeric(), nullable=True),
+    sa.Column('total_price', sa.Numeric(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['receipt_id', 'receipt_created_at'], ['receipts.id', 'receipts.created_at'],
+                            name='fk_receipt_items_receipt'),
+    sa.PrimaryKeyConstraint('id', 'receipt_created_at'),
+    postgresql_partition_by='RANGE (receipt_created_at)'
+    )
+    op.create_index(op.f('ix_receipt_items_receipt_id'), 'receipt_items', ['receipt_id'], unique=False)
+    op.create_index(op.f('ix_receipt_items_product_id'), 'receipt_items', ['product_id'], unique=False)
+
+    # One partition per month from the oldest receipt to a few months ahead
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM receipts_unpartitioned")).scalar()
+    current_month = date.today().replace(day=1)
+    first_month = min(oldest.date().replace(day=1), current_month) if oldest is not None else current_month
+    for table in ('receipts', 'receipt_items'):
+        create_partitions(table, first_month, add_months(current_month, MONTHS_AHEAD))
+
+    op.execute(f"""
+        INSERT INTO receipts (id, user_id, created_at, total, payment_type, payment_amount, change_given)
+        SELECT id, user_id, coalesce(created_at, {MISSING_CREATED_AT}), total, payment_type, payment_amount,
+               change_given
+        FROM receipts_unpartitioned
+    """)
+    op.execute(f"""
+        INSERT INTO receipt_items (id, receipt_id, receipt_created_at, product_id, quantity, total_price)
+        SELECT i.id, i.receipt_id, coalesce(r.created_at, {MISSING_CREATED_AT}), i.product_id, i.quantity,
+               i.total_price
+        FROM receipt_items_unpartitioned AS i
+        LEFT JOIN receipts_unpartitioned AS r ON r.id = i.receipt_id
+    """)
+
+    # Keep the sequences when the old tables go away
+    op.execute("ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id")
+    op.execute("ALTER SEQUENCE receipt_items_id_seq OWNED BY receipt_items.id")
+    op.drop_table('receipt_items_unpartitioned')
+    op.drop_table('receipts_unpartitioned')
+
+
+def downgrade() -> None:
+    op.drop_constraint('fk_receipt_items_receipt', 'receipt_items', type_='foreignkey')
+    for table in ('receipts', 'receipt_items'):
+        op.rename_table(table, f'{table}_partitioned')
+        op.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_partitioned_pkey")
+    op.drop_index('ix_receipts_user_id_created_at_id', table_name='receipts_partitioned')
+    op.drop_index('ix_receipts_user_id_payment_type_created_at_id', table_name='receipts_partitioned')
+    op.drop_index('ix_receipt_items_receipt_id', table_name='receipt_items_partitioned')
+    op.drop_index('ix_receipt_items_product_id', table_name='receipt_items_partitioned')
+
+    op.create_table('receipts',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('receipts_id_seq'::regclass)"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('total', sa.Numeric(), nullable=True),
+    sa.Column('payment_type', sa.String(), nullable=True),
+    sa.Column('payment_amount', sa.Numeric(), nullable=True),
+    sa.Column('change_given', sa.Numeric(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_receipts_user_id_created_at_id', 'receipts', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_receipts_user_id_payment_type_created_at_id', 'receipts',
+                    ['user_id', 'payment_type', 'created_at', 'id'], unique=False)
+    op.create_table('receipt_items',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('receipt_items_id_seq'::regclass)"),
+              nullable=False),
+    sa.Column('receipt_id', sa.Integer(), nullable=True),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Numeric(), nullable=True),
+    sa.Column('total_price', sa.Numeric(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.ForeignKeyConstraint(['receipt_id'], ['receipts.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_receipt_items_receipt_id'), 'receipt_items', ['receipt_id'], unique=False)
+    op.create_index(op.f('ix_receipt_items_product_id'), 'receipt_items', ['product_id'], unique=False)
+
+    # Partitions detached by the retention command are not brought back
+    op.execute("""
+        INSERT INTO receipts (id, user_id, created_at, total, payment_type, payment_amount, change_given)
+        SELECT id, user_id, created_at, total, payment_type, payment_amount, change_given FROM receipts_partitioned
+    """)
+    op.execute("""
+        INSERT INTO receipt_items (id, receipt_id, product_id, quantity, total_price)
+        SELECT id, receipt_id, product_id, quantity, total_price FROM receipt_items_partitioned
+    """)
+
+    op.execute("ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id")
+    op.execute("ALTER SEQUENCE receipt_items_id_seq OWNED BY receipt_items.id")
+    # Dropping the partitioned parents drops their partitions
+    op.drop_table('receipt_items_partitioned')
+    op.drop_table('receipts_partitioned')
+    op.create_foreign_key('idempotency_keys_receipt_id_fkey', 'idempotency_keys', 'receipts',
+                          ['receipt_id'], ['id'])
@@ -0,0 +1,41 @@
+"""Unique product names
+
+Revision ID: 4b1f0e2c9a7d
+Revises: cd6cbdbf7653
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b1f0e2c9a7d'
+down_revision: Union[str, None] = 'cd6cbdbf7653'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Collapse duplicated product names onto the oldest product before enforcing uniqueness
+    op.execute("""
+        UPDATE receipt_items AS ri
+        SET product_id = keep.id
+        FROM products AS p
+        JOIN (SELECT name, min(id) AS id FROM products GROUP BY name) AS keep ON keep.name = p.name
+        WHERE ri.product_id = p.id AND p.id <> keep.id
+    """)
+    op.execute("""
+        DELETE FROM products AS p
+        USING products AS keep
+        WHERE p.name = keep.name AND p.id > keep.id
+    """)
+    op.drop_index(op.f('ix_products_name'), table_name='products')
+    op.create_index(op.f('ix_products_name'), 'products', ['name'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_name'), table_name='products')
+    op.create_index(op.f('ix_products_name'), 'products', ['name'], unique=False)
@@ -0,0 +1,32 @@
+"""Product name search indexes
+
+Revision ID: 7d4e2b9c1f60
+Revises: 3a8c6e1f9b42
+Create Date: 2026-10-18 15:02:47.391605
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d4e2b9c1f60'
+down_revision: Union[str, None] = '3a8c6e1f9b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_products_name_trgm', 'products', ['name'], unique=False, postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_products_name_tsv', 'products', [sa.text("to_tsvector('simple'::regconfig, name)")],
+                    unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    # The extension may be used by other objects and is left in place
+    op.drop_index('ix_products_name_tsv', table_name='products')
+    op.drop_index('ix_products_name_trgm', table_name='products')
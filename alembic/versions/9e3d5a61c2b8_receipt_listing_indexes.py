@@ -0,0 +1,38 @@
+"""Receipt listing indexes
+
+Revision ID: 9e3d5a61c2b8
+Revises: 4b1f0e2c9a7d
+Create Date: 2026-10-18 11:04:52.118730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e3d5a61c2b8'
+down_revision: Union[str, None] = '4b1f0e2c9a7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_receipts_user_id_created_at_id', 'receipts', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_receipts_user_id_payment_type_created_at_id', 'receipts',
+                    ['user_id', 'payment_type', 'created_at', 'id'], unique=False)
+    op.create_index(op.f('ix_receipt_items_receipt_id'), 'receipt_items', ['receipt_id'], unique=False)
+    op.create_index(op.f('ix_receipt_items_product_id'), 'receipt_items', ['product_id'], unique=False)
+    # The primary keys are already indexed, the extra indexes only slow down inserts
+    op.drop_index(op.f('ix_receipts_id'), table_name='receipts')
+    op.drop_index(op.f('ix_receipt_items_id'), table_name='receipt_items')
+
+
+def downgrade() -> None:
+    op.create_index(op.f('ix_receipt_items_id'), 'receipt_items', ['id'], unique=False)
+    op.create_index(op.f('ix_receipts_id'), 'receipts', ['id'], unique=False)
+    op.drop_index(op.f('ix_receipt_items_product_id'), table_name='receipt_items')
+    op.drop_index(op.f('ix_receipt_items_receipt_id'), table_name='receipt_items')
+    op.drop_index('ix_receipts_user_id_payment_type_created_at_id', table_name='receipts')
+    op.drop_index('ix_receipts_user_id_created_at_id', table_name='receipts')
@@ -0,0 +1,41 @@
+"""Money columns as numeric(12, 2)
+
+Revision ID: b5c81e4d2a97
+Revises: 7d4e2b9c1f60
+Create Date: 2026-10-18 15:48:09.527713
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5c81e4d2a97'
+down_revision: Union[str, None] = '7d4e2b9c1f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONEY_COLUMNS = [
+    ('products', 'price'),
+    ('receipts', 'total'),
+    ('receipts', 'payment_amount'),
+    ('receipts', 'change_given'),
+    ('receipt_items', 'total_price'),
+    ('daily_sales', 'total'),
+    ('daily_sales', 'change_given'),
+]
+
+
+def upgrade() -> None:
+    # Existing amounts with more than two decimals are rounded half away from zero, like app.money does;
+    # altering a partitioned table alters all of its partitions
+    for table, column in MONEY_COLUMNS:
+        op.alter_column(table, column, existing_type=sa.Numeric(), type_=sa.Numeric(12, 2),
+                        postgresql_using=f'round({column}, 2)')
+
+
+def downgrade() -> None:
+    for table, column in MONEY_COLUMNS:
+        op.alter_column(table, column, existing_type=sa.Numeric(12, 2), type_=sa.Numeric())
@@ -0,0 +1,33 @@
+"""Receipt item unit price
+
+Revision ID: f61b3d8e2c45
+Revises: e2a9c4d7f318
+Create Date: 2026-10-18 19:12:44.806213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f61b3d8e2c45'
+down_revision: Union[str, None] = 'e2a9c4d7f318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('receipt_items', sa.Column('unit_price', sa.Numeric(12, 2), nullable=True))
+    # products.price is the first price a product was seen at, so existing items get theirs back from
+    # their own total; items without a quantity fall back to the product's price
+    op.execute(
+        "UPDATE receipt_items SET unit_price = COALESCE("
+        "round(total_price / NULLIF(quantity, 0), 2), "
+        "(SELECT price FROM products WHERE products.id = receipt_items.product_id))"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('receipt_items', 'unit_price')
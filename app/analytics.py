@@ -0,0 +1,160 @@
+"""
+Grouped receipt aggregations behind `GET /analytics/receipts`.
+
+The database does the grouping, so a report costs one query whatever the number of receipts, and only
+the aggregated rows travel back. Two reports exist:
+
+- sales: receipt count, total and change given per period (day, week starting on Monday, or month)
+  and/or payment type;
+- products: the top products by revenue, through `receipt_items`.
+
+Rows are returned as typed tuples (dates, ints, `Decimal` amounts with two decimals) and encoded as
+a list of objects, as columns (one JSON array per column), or as an Arrow IPC stream when pyarrow
+is installed.
+"""
+from datetime import date, datetime
+from typing import List, Sequence, Tuple
+
+import orjson
+from sqlalchemy import func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.filters import ReceiptFilters
+from app.models import Product, Receipt, ReceiptItem
+from app.money import from_minor, to_minor
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+TIME_GRAINS = ("day", "week", "month")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# How every report column is converted and typed
+COLUMN_KINDS = {
+    "period": "date",
+    "payment_type": "text",
+    "product": "text",
+    "receipt_count": "int",
+    "quantity": "decimal",
+    "total": "decimal",
+    "change_given": "decimal",
+    "revenue": "decimal",
+}
+
+
+def period_column(db: AsyncSession, grain: str):
+    """
+    The first day of the day, week or month a receipt was created in.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        # The grain is inlined so the SELECT and GROUP BY expressions are identical
+        return func.date_trunc(literal_column(f"'{grain}'"), Receipt.created_at)
+    if grain == "day":
+        return func.date(Receipt.created_at)
+    if grain == "week":
+        return func.date(Receipt.created_at, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m-01', Receipt.created_at)
+
+
+def sales_query(db: AsyncSession, filters: ReceiptFilters, user_id: int, group_by: Sequence[str]):
+    """
+    Aggregates the user's filtered receipts by the requested time grain and/or payment type.
+
+    Args:
+    group_by (Sequence[str]): At most one of `TIME_GRAINS`, and optionally 'payment_type'.
+    """
+    dimensions = []
+    for dimension in group_by:
+        if dimension in TIME_GRAINS:
+            dimensions.append(period_column(db, dimension).label("period"))
+        elif dimension == "payment_type":
+            dimensions.append(Receipt.payment_type.label("payment_type"))
+
+    query = select(
+        *dimensions,
+        func.count().label("receipt_count"),
+        func.coalesce(func.sum(Receipt.total), 0).label("total"),
+        func.coalesce(func.sum(Receipt.change_given), 0).label("change_given"),
+    ).select_from(Receipt)
+    query = filters.apply(query, user_id)
+    if dimensions:
+        query = query.group_by(*dimensions).order_by(*dimensions)
+    return query
+
+
+def top_products_query(filters: ReceiptFilters, user_id: int, top: int):
+    """
+    The `top` products of the user's filtered receipts by revenue, with the quantity sold and
+    the number of receipts they appear on.
+    """
+    revenue = func.sum(ReceiptItem.total_price)
+    query = select(
+        Product.name.label("product"),
+        func.sum(ReceiptItem.quantity).label("quantity"),
+        revenue.label("revenue"),
+        func.count(Receipt.id.distinct()).label("receipt_count"),
+    ).select_from(Receipt).join(
+        ReceiptItem, (ReceiptItem.receipt_id == Receipt.id) & (ReceiptItem.receipt_created_at == Receipt.created_at)
+    ).join(Product, Product.id == ReceiptItem.product_id)
+    query = filters.apply(query, user_id)
+    return query.group_by(Product.id, Product.name).order_by(revenue.desc(), Product.name).limit(top)
+
+
+def _convert(kind: str, value):
+    if value is None:
+        return None
+    if kind == "date":
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, str):
+            return date.fromisoformat(value)
+        return value
+    if kind == "int":
+        return int(value)
+    if kind == "decimal":
+        return from_minor(to_minor(value))
+    return value
+
+
+async def run_report(db: AsyncSession, query) -> Tuple[List[str], List[tuple]]:
+    """
+    Executes a report query. Returns its column names and its rows with typed values.
+    """
+    result = await db.execute(query)
+    names = list(result.keys())
+    kinds = [COLUMN_KINDS[name] for name in names]
+    rows = [tuple(_convert(kind, value) for kind, value in zip(kinds, row)) for row in result]
+    return names, rows
+
+
+def encode_rows(names: List[str], rows: List[tuple]) -> bytes:
+    return orjson.dumps([dict(zip(names, row)) for row in rows], default=str)
+
+
+def encode_columns(names: List[str], rows: List[tuple]) -> bytes:
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    return orjson.dumps({name: list(column) for name, column in zip(names, columns)}, default=str)
+
+
+def encode_arrow(names: List[str], rows: List[tuple]) -> bytes:
+    """
+    Encodes the rows as an Arrow IPC stream holding one record batch. Requires pyarrow.
+    """
+    arrow_types = {
+        "date": pyarrow.date32(),
+        "text": pyarrow.string(),
+        "int": pyarrow.int64(),
+        "decimal": pyarrow.decimal128(18, 2),
+    }
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    arrays = [pyarrow.array(list(column), type=arrow_types[COLUMN_KINDS[name]])
+              for name, column in zip(names, columns)]
+    table = pyarrow.Table.from_arrays(arrays, names=names)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,100 @@
+"""
+Maintenance commands, run as `python -m app.commands <command>`.
+"""
+import argparse
+import asyncio
+from datetime import date, datetime
+from typing import Optional, Sequence
+
+from app.database import async_session_maker
+from app.idempotency import prune_idempotency_keys
+from app.jobs import create_job_runner
+from app.partitions import add_months, create_month_partitions, detach_partitions, month_start, \
+    supports_partitions
+from app.rollups import rebuild_daily_sales
+
+
+async def rebuild_daily_sales_command(args: argparse.Namespace) -> None:
+    async with async_session_maker() as db:
+        rows = await rebuild_daily_sales(db, user_id=args.user_id)
+        await db.commit()
+    print(f"Rebuilt {rows} daily sales rows")
+
+
+async def prune_idempotency_keys_command(args: argparse.Namespace) -> None:
+    async with async_session_maker() as db:
+        rows = await prune_idempotency_keys(db)
+        await db.commit()
+    print(f"Pruned {rows} expired idempotency keys")
+
+
+async def create_partitions_command(args: argparse.Namespace) -> None:
+    async with async_session_maker() as db:
+        if not supports_partitions(db):
+            raise SystemExit("Partitions are only supported on PostgreSQL")
+        created = await create_month_partitions(db, args.first_month, args.months_ahead + 1)
+        await db.commit()
+    print(f"Created {len(created)} partitions: {', '.join(created) or '-'}")
+
+
+async def detach_partitions_command(args: argparse.Namespace) -> None:
+    before = add_months(month_start(date.today()), -args.keep_months)
+    async with async_session_maker() as db:
+        if not supports_partitions(db):
+            raise SystemExit("Partitions are only supported on PostgreSQL")
+        detached = await detach_partitions(db, before, drop=args.drop)
+        await db.commit()
+    action = "Dropped" if args.drop else "Detached"
+    print(f"{action} {len(detached)} partitions older than {before}: {', '.join(detached) or '-'}")
+
+
+async def run_jobs_command(args: argparse.Namespace) -> None:
+    runner = create_job_runner(async_session_maker)
+    if args.concurrency is not None:
+        runner.concurrency = args.concurrency
+    runner.start()
+    print(f"Running jobs, {runner.concurrency} at a time; stop with Ctrl+C")
+    try:
+        # Until interrupted
+        await asyncio.Event().wait()
+    finally:
+        await runner.stop()
+
+
+def month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-daily-sales", help="Backfill or rebuild the daily sales rollup")
+    rebuild.add_argument("--user-id", type=int, default=None, help="Only rebuild the rows of this user")
+    rebuild.set_defaults(handler=rebuild_daily_sales_command)
+
+    prune = subparsers.add_parser("prune-idempotency-keys", help="Delete expired idempotency keys")
+    prune.set_defaults(handler=prune_idempotency_keys_command)
+
+    partitions = subparsers.add_parser("create-partitions", help="Create monthly receipt partitions ahead of time")
+    partitions.add_argument("--first-month", type=month, default=month_start(date.today()),
+                            help="First month to create, as YYYY-MM (default: the current month)")
+    partitions.add_argument("--months-ahead", type=int, default=3, help="Months to create after the first one")
+    partitions.set_defaults(handler=create_partitions_command)
+
+    detach = subparsers.add_parser("detach-partitions", help="Detach monthly receipt partitions past retention")
+    detach.add_argument("--keep-months", type=int, required=True,
+                        help="Full months to keep before the current one; older partitions are detached")
+    detach.add_argument("--drop", action="store_true", help="Drop the detached partitions instead of keeping them")
+    detach.set_defaults(handler=detach_partitions_command)
+
+    jobs = subparsers.add_parser("run-jobs", help="Run queued background jobs in this process")
+    jobs.add_argument("--concurrency", type=int, default=None, help="Jobs run at once (default: JOB_CONCURRENCY)")
+    jobs.set_defaults(handler=run_jobs_command)
+
+    args = parser.parse_args(argv)
+    asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
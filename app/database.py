@@ -1,18 +1,157 @@
-from typing import AsyncGenerator
+import itertools
+import time
+from typing import AsyncGenerator, Dict, List, Optional, Sequence
 
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from config import DB_NAME, DB_PASS, DB_USER, DB_HOST, DB_PORT
+from app.cache import TTLCache
+from config import DATABASE_URL, DatabaseSettings, db_settings
 
-DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 Base: DeclarativeMeta = declarative_base()
 
-engine = create_async_engine(DATABASE_URL)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long checkouts wait for a connection, including connection setup.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            if waited > self.max_wait_seconds:
+                self.max_wait_seconds = waited
+
+    def recreate(self):
+        # Keep the statistics when the pool is recreated after an invalidation
+        pool = super().recreate()
+        pool.checkouts, pool.wait_seconds, pool.max_wait_seconds = \
+            self.checkouts, self.wait_seconds, self.max_wait_seconds
+        return pool
+
+
+def engine_options(url: str, settings: DatabaseSettings) -> dict:
+    """
+    Translates the database settings into `create_async_engine` keyword arguments for `url`.
+    """
+    options = {
+        "echo": settings.echo,
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.pool_size,
+        "max_overflow": settings.max_overflow,
+        "pool_timeout": settings.pool_timeout,
+        "pool_recycle": settings.pool_recycle,
+        "pool_pre_ping": settings.pool_pre_ping,
+    }
+    if url.startswith("postgresql+asyncpg"):
+        connect_args = {"prepared_statement_cache_size": settings.prepared_statement_cache_size}
+        if settings.statement_timeout_ms:
+            connect_args["server_settings"] = {"statement_timeout": str(settings.statement_timeout_ms)}
+        if settings.command_timeout is not None:
+            connect_args["command_timeout"] = settings.command_timeout
+        options["connect_args"] = connect_args
+    elif url.startswith("sqlite"):
+        # SQLite allows a single writer; wait for the lock as long as we would wait for a pooled connection
+        options["connect_args"] = {"timeout": settings.pool_timeout}
+    return options
+
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL, db_settings))
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+class ReadRouter:
+    """
+    Spreads read-only sessions over the replicas round-robin, falling back to the primary when there
+    are no replicas or when the user wrote within the last `window` seconds (read-your-writes).
+
+    Recent writes are tracked per worker process; a user's follow-up reads landing on another worker
+    are only covered by replication lag staying below the window.
+    """
+
+    def __init__(self, primary: async_sessionmaker, replicas: Sequence[async_sessionmaker] = (),
+                 window: float = 5.0, max_tracked_users: int = 100000):
+        self.primary = primary
+        self.replicas: List[async_sessionmaker] = list(replicas)
+        self._next_replica = itertools.cycle(self.replicas)
+        self._recent_writes = TTLCache(maxsize=max_tracked_users, ttl=window)
+
+    def mark_write(self, user_id: int) -> None:
+        self._recent_writes.set(user_id, True)
+
+    def session_maker_for(self, user_id: Optional[int] = None) -> async_sessionmaker:
+        if not self.replicas:
+            return self.primary
+        if user_id is not None and self._recent_writes.get(user_id):
+            return self.primary
+        return next(self._next_replica)
+
+
+def replica_session_makers(urls: str, settings: DatabaseSettings) -> List[async_sessionmaker]:
+    makers = []
+    for url in filter(None, (url.strip() for url in urls.split(","))):
+        replica = create_async_engine(url, **engine_options(url, settings))
+        makers.append(async_sessionmaker(replica, expire_on_commit=False))
+    return makers
+
+
+read_router = ReadRouter(async_session_maker, replica_session_makers(db_settings.replica_urls, db_settings),
+                         window=db_settings.read_your_writes_seconds)
+
+
+async def get_read_session(user_id: int) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for read-only endpoints taking a `user_id` path parameter. Endpoints of the authenticated user
+    use `app.services.get_user_read_session`, which routes by the current user instead.
+    """
+    async with read_router.session_maker_for(user_id)() as session:
+        yield session
+
+
+def pool_status(pool=None) -> Dict[str, float]:
+    """
+    Returns a snapshot of the connection pool: size, connections checked in and out, overflow in use
+    and the accumulated checkout wait time.
+    """
+    pool = pool or engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update({
+            "checkouts": pool.checkouts,
+            "wait_seconds": pool.wait_seconds,
+            "max_wait_seconds": pool.max_wait_seconds,
+        })
+    return status
+
+
+def upsert_insert(db: AsyncSession, model):
+    """
+    Returns a dialect-specific INSERT construct for `model` that supports ON CONFLICT clauses.
+    """
+    if db.get_bind().dialect.name == 'sqlite':
+        return sqlite.insert(model)
+    return postgresql.insert(model)
@@ -0,0 +1,97 @@
+import csv
+import io
+from typing import AsyncIterator, Iterable, List, Sequence
+
+import orjson
+from sqlalchemy import func
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.future import select
+
+from app.filters import ReceiptFilters
+from app.models import Product, Receipt, ReceiptItem
+from app.money import format_amount, line_amount
+from app.serializers import receipt_dict
+
+EXPORT_BATCH_SIZE = 1000
+
+CSV_HEADER = ["receipt_id", "created_at", "payment_type", "payment_amount", "total", "change_given",
+              "product", "price", "quantity", "line_total"]
+
+
+def export_query(filters: ReceiptFilters, user_id: int):
+    """
+    Selects one row per item of the user's filtered receipts, receipts without items producing
+    a single row with empty item columns. Rows of the same receipt are always adjacent.
+    """
+    query = select(
+        Receipt.id, Receipt.created_at, Receipt.payment_type, Receipt.payment_amount, Receipt.total,
+        Receipt.change_given, Product.name, func.coalesce(ReceiptItem.unit_price, Product.price), ReceiptItem.quantity,
+        ReceiptItem.total_price
+    ).outerjoin(ReceiptItem, (ReceiptItem.receipt_id == Receipt.id)
+                & (ReceiptItem.receipt_created_at == Receipt.created_at)).outerjoin(
+        Product, Product.id == ReceiptItem.product_id
+    )
+    return filters.apply(query, user_id).order_by(Receipt.created_at, Receipt.id, ReceiptItem.id)
+
+
+def _receipt_record(head: Row, items: List[Row]) -> dict:
+    return receipt_dict(head[0], head[1], head[2], head[3], head[4], head[5], (item[6:] for item in items))
+
+
+async def _stream_rows(session_maker: async_sessionmaker, query) -> AsyncIterator[Sequence[Row]]:
+    # Responses stream after the request's dependencies are closed, so the server-side cursor gets a session
+    # of its own, closed once exhausted
+    async with session_maker() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def stream_ndjson(session_maker: async_sessionmaker, query) -> AsyncIterator[bytes]:
+    """
+    Streams one JSON document per receipt, shaped like `ReceiptDisplay`, one batch of rows at a time.
+    """
+    head = None
+    items: List[Row] = []
+    async for partition in _stream_rows(session_maker, query):
+        chunk = []
+        for row in partition:
+            if head is not None and row[0] != head[0]:
+                chunk.append(orjson.dumps(_receipt_record(head, items)))
+                items = []
+            head = row
+            if row[6] is not None:
+                items.append(row)
+        if chunk:
+            chunk.append(b"")
+            yield b"\n".join(chunk)
+    if head is not None:
+        yield orjson.dumps(_receipt_record(head, items)) + b"\n"
+
+
+def _csv_lines(rows: Iterable[Row]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for (receipt_id, created_at, payment_type, payment_amount, total, change_given, name, price, quantity,
+         line_total) in rows:
+        if line_total is None and quantity is not None:
+            line_total = line_amount(price, quantity)
+        writer.writerow([
+            receipt_id, created_at.isoformat(), payment_type, format_amount(payment_amount), format_amount(total),
+            "" if change_given is None else format_amount(change_given),
+            "" if name is None else name,
+            "" if price is None else format_amount(price),
+            "" if quantity is None else format_amount(quantity),
+            "" if line_total is None else format_amount(line_total),
+        ])
+    return buffer.getvalue().encode()
+
+
+async def stream_csv(session_maker: async_sessionmaker, query) -> AsyncIterator[bytes]:
+    """
+    Streams a CSV document with one line per receipt item, one batch of rows at a time.
+    """
+    yield (",".join(CSV_HEADER) + "\n").encode()
+    async for partition in _stream_rows(session_maker, query):
+        yield _csv_lines(partition)
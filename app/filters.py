@@ -0,0 +1,52 @@
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import Query
+
+from app.models import Receipt
+
+
+class ReceiptFilters:
+    """
+    Query parameters shared by every endpoint that lists the authenticated user's receipts.
+    Used as `filters: ReceiptFilters = Depends()`.
+    """
+
+    def __init__(
+            self,
+            receipt_id: Optional[int] = Query(None, description="Filter by specific receipt ID"),
+            start_date: Optional[date] = Query(None, description="Start date for filtering receipts"),
+            end_date: Optional[date] = Query(None, description="End date for filtering receipts"),
+            min_total: Optional[Decimal] = Query(None, description="Minimum total amount for filtering receipts"),
+            max_total: Optional[Decimal] = Query(None, description="Maximum total amount for filtering receipts"),
+            payment_type: Optional[str] = Query(None, description="Filter receipts by payment type"),
+    ):
+        self.receipt_id = receipt_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.min_total = min_total
+        self.max_total = max_total
+        self.payment_type = payment_type
+
+    def apply(self, query, user_id: int):
+        """
+        Restricts a query selecting from `receipts` to the user's receipts matching the filters.
+        """
+        query = query.where(Receipt.user_id == user_id)
+
+        # Apply filtering by receipt ID if provided
+        if self.receipt_id:
+            query = query.filter(Receipt.id == self.receipt_id)
+
+        if self.start_date:
+            query = query.filter(Receipt.created_at >= self.start_date)
+        if self.end_date:
+            query = query.filter(Receipt.created_at <= self.end_date)
+        if self.min_total:
+            query = query.filter(Receipt.total >= self.min_total)
+        if self.max_total:
+            query = query.filter(Receipt.total <= self.max_total)
+        if self.payment_type:
+            query = query.filter(Receipt.payment_type == self.payment_type)
+        return query
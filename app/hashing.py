@@ -0,0 +1,97 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from config import PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY, BCRYPT_ROUNDS
+
+# Hashes with fewer rounds than configured are flagged for an upgrade on the next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a bounded worker pool instead of on the event loop.
+
+    At most `max_concurrency` operations are handed to the pool at once, the rest wait on a semaphore,
+    so the queue depth is observable through `stats()` and cancelled requests never reach the pool.
+    """
+
+    def __init__(self, executor: str = 'thread', max_workers: int = 4, max_concurrency: int = 4):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Unknown password hash executor: {executor}")
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._pool: Optional[Executor] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.executor == 'process':
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._pool
+
+    async def _run(self, func, *args):
+        self.waiting += 1
+        queued = True
+        try:
+            async with self._semaphore:
+                self.waiting -= 1
+                queued = False
+                self.running += 1
+                started = time.perf_counter()
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self._get_pool(), func, *args)
+                finally:
+                    self.running -= 1
+                    self.completed += 1
+                    self.busy_seconds += time.perf_counter() - started
+        finally:
+            if queued:
+                self.waiting -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifies the password and returns a new hash when the stored one uses outdated parameters.
+        """
+        return await self._run(_verify_and_update, plain_password, hashed_password)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "busy_seconds": self.busy_seconds,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_CONCURRENCY)
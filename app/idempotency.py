@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from app.cache import TTLCache
+from app.database import upsert_insert
+from app.models import IdempotencyKey
+from app.schemas import ReceiptDisplay
+from config import IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_SWEEP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# In-process front for the idempotency_keys table, keyed by (user_id, key)
+idempotent_responses = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_KEY_TTL)
+
+
+def _expired_before(now: datetime) -> datetime:
+    return now - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+
+
+async def find_receipt_response(db: AsyncSession, user_id: int, key: str) -> Optional[ReceiptDisplay]:
+    """
+    Returns the response stored for an idempotency key, or None if the key is unknown or expired.
+
+    Args:
+        db: Session on the primary database.
+        user_id: The user that sent the key; keys are scoped per user.
+        key: The `Idempotency-Key` header value.
+    """
+    cached = idempotent_responses.get((user_id, key))
+    if cached is not None:
+        return cached
+
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(IdempotencyKey.response, IdempotencyKey.created_at)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key,
+               IdempotencyKey.created_at >= _expired_before(now))
+    )
+    row = result.first()
+    if row is None:
+        return None
+
+    receipt_display = ReceiptDisplay.model_validate_json(row.response)
+    remaining = IDEMPOTENCY_KEY_TTL - (now - row.created_at).total_seconds()
+    idempotent_responses.set((user_id, key), receipt_display, ttl=remaining)
+    return receipt_display
+
+
+async def claim_idempotency_key(db: AsyncSession, user_id: int, key: str,
+                                receipt_display: ReceiptDisplay) -> bool:
+    """
+    Records the response for an idempotency key in the current transaction.
+
+    An expired row for the same key is taken over. Returns False when a live row already exists,
+    i.e. a concurrent request with the same key committed first; the caller should then roll back.
+    """
+    now = datetime.utcnow()
+    insert = upsert_insert(db, IdempotencyKey).values(
+        user_id=user_id,
+        key=key,
+        receipt_id=receipt_display.id,
+        created_at=now,
+        response=receipt_display.model_dump_json(),
+    )
+    insert = insert.on_conflict_do_update(
+        index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+        set_={
+            "receipt_id": insert.excluded.receipt_id,
+            "created_at": insert.excluded.created_at,
+            "response": insert.excluded.response,
+        },
+        where=IdempotencyKey.created_at < _expired_before(now),
+    ).returning(IdempotencyKey.key)
+    result = await db.execute(insert)
+    return result.first() is not None
+
+
+def cache_receipt_response(user_id: int, key: str, receipt_display: ReceiptDisplay) -> None:
+    idempotent_responses.set((user_id, key), receipt_display)
+
+
+async def prune_idempotency_keys(db: AsyncSession, now: Optional[datetime] = None) -> int:
+    """
+    Deletes the idempotency keys older than `IDEMPOTENCY_KEY_TTL`. Returns the number of deleted rows.
+    """
+    result = await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < _expired_before(now or datetime.utcnow()))
+    )
+    return result.rowcount
+
+
+class IdempotencyKeySweeper:
+    """
+    Background task that prunes expired idempotency keys every `interval` seconds.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, interval: float = 300):
+        self.session_maker = session_maker
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def sweep(self) -> int:
+        async with self.session_maker() as db:
+            deleted = await prune_idempotency_keys(db)
+            await db.commit()
+        return deleted
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                deleted = await self.sweep()
+            except Exception:
+                logger.exception("Failed to prune expired idempotency keys")
+                continue
+            if deleted:
+                logger.info("Pruned %d expired idempotency keys", deleted)
+
+
+def create_idempotency_sweeper(session_maker: async_sessionmaker) -> IdempotencyKeySweeper:
+    return IdempotencyKeySweeper(session_maker, interval=IDEMPOTENCY_SWEEP_INTERVAL)
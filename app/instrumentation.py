@@ -0,0 +1,224 @@
+"""
+Opt-in per-request instrumentation: SQL query counts and timings, named phase timers, a `Server-Timing`
+response header, one structured log line per request and sampled cProfile dumps.
+
+Nothing here is installed unless `INSTRUMENTATION_ENABLED` is set; `phase()` then costs one context variable
+lookup, so it can stay in the request handlers.
+"""
+import cProfile
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import PROFILE_SAMPLE_RATE, PROFILE_ON_HEADER, PROFILE_DIR
+
+logger = logging.getLogger("app.requests")
+
+PROFILE_HEADER = b"x-profile"
+
+
+@dataclass
+class RequestMetrics:
+    started: float = field(default_factory=time.perf_counter)
+    sql_queries: int = 0
+    sql_seconds: float = 0.0
+    phases: Dict[str, float] = field(default_factory=dict)
+
+    def server_timing(self) -> str:
+        total = (time.perf_counter() - self.started) * 1000
+        parts = [f"total;dur={total:.1f}",
+                 f'sql;desc="{self.sql_queries} queries";dur={self.sql_seconds * 1000:.1f}']
+        parts.extend(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items())
+        return ", ".join(parts)
+
+
+_current_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+class _Phase:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics: RequestMetrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.phases[self.name] = self.metrics.phases.get(self.name, 0.0) + elapsed
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name: str):
+    """
+    Times the enclosed block as `name` in the current request's metrics; a no-op when not instrumented.
+
+        with phase("serialize"):
+            ...
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return _NO_PHASE
+    return _Phase(metrics, name)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.sql_queries += 1
+        metrics.sql_seconds += time.perf_counter() - started
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute, its start time is dropped here instead
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+_SQL_HOOKS = (
+    ("before_cursor_execute", _before_cursor_execute),
+    ("after_cursor_execute", _after_cursor_execute),
+    ("handle_error", _handle_error),
+)
+
+
+def install_sql_hooks() -> None:
+    """
+    Times every statement executed by any engine. The async engines run the sync events inside
+    greenlets that share the caller's context, so the timings land on the current request.
+    """
+    for name, hook in _SQL_HOOKS:
+        if not event.contains(Engine, name, hook):
+            event.listen(Engine, name, hook)
+
+
+def uninstall_sql_hooks() -> None:
+    """
+    Removes the listeners added by `install_sql_hooks`.
+    """
+    for name, hook in _SQL_HOOKS:
+        if event.contains(Engine, name, hook):
+            event.remove(Engine, name, hook)
+
+
+class InstrumentationMiddleware:
+    """
+    ASGI middleware collecting `RequestMetrics` for every HTTP request.
+
+    The `Server-Timing` header is added when the response starts, the log line is written once the body
+    has been sent. A request is profiled when it is sampled by `sample_rate`, or when it sends `X-Profile: 1`
+    and `profile_on_header` is set. cProfile sees everything the event loop runs meanwhile, so only one
+    request is profiled at a time and the dump also contains concurrent requests' work.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, profile_on_header: bool = PROFILE_ON_HEADER,
+                 profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.profile_on_header = profile_on_header
+        self.profile_dir = Path(profile_dir)
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = self._start_profiler(scope)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            profile_path = self._stop_profiler(profiler, scope)
+            _current_metrics.reset(token)
+            self._log(scope, status, metrics, profile_path)
+
+    def _wants_profile(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return self.profile_on_header and (PROFILE_HEADER, b"1") in scope.get("headers", [])
+
+    def _start_profiler(self, scope) -> Optional[cProfile.Profile]:
+        if self._profiling or not self._wants_profile(scope):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return None
+        self._profiling = True
+        return profiler
+
+    def _stop_profiler(self, profiler: Optional[cProfile.Profile], scope) -> Optional[str]:
+        if profiler is None:
+            return None
+        profiler.disable()
+        self._profiling = False
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        route = scope["path"].strip("/").replace("/", "_") or "root"
+        path = self.profile_dir / f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{scope['method']}-{route}.prof"
+        profiler.dump_stats(path)
+        return str(path)
+
+    @staticmethod
+    def _log(scope, status: int, metrics: RequestMetrics, profile_path: Optional[str]) -> None:
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        route = scope.get("route")
+        record = {
+            "method": scope["method"],
+            "path": scope["path"],
+            "route": getattr(route, "path", None),
+            "status": status,
+            "duration_ms": round((time.perf_counter() - metrics.started) * 1000, 3),
+            "sql_queries": metrics.sql_queries,
+            "sql_ms": round(metrics.sql_seconds * 1000, 3),
+            "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in metrics.phases.items()},
+        }
+        if profile_path is not None:
+            record["profile"] = profile_path
+        logger.info(orjson.dumps(record).decode())
@@ -0,0 +1,402 @@
+"""
+In-process background jobs.
+
+Exports, rollup rebuilds and bulk imports are submitted with `POST /jobs` and run on the event loop of a worker,
+off the request path and without any external broker:
+
+- every job is a row of the `jobs` table, so its status, progress and outcome can be read from any worker and
+  survive the request that created it;
+- every worker runs a `JobRunner` that claims the oldest queued job of a kind it knows (`FOR UPDATE SKIP LOCKED`
+  on PostgreSQL), runs at most `concurrency` jobs at once and heartbeats the running ones on every poll;
+- a running job whose heartbeat is older than `stale_after` seconds belonged to a worker that died, and is failed;
+- cancelling a queued job is immediate. A running job is cancelled by its runner at the next heartbeat, or at once
+  when the cancel request reaches the worker running it. A worker shutting down fails the jobs it was running.
+
+Job kinds are registered on `job_registry` together with a pydantic model of their parameters, validated when the
+job is submitted. Handlers should be written so that cancellation leaves no half-done transaction behind: work in
+transactions of their own and let `asyncio.CancelledError` propagate.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Type
+
+import orjson
+from pydantic import BaseModel
+from sqlalchemy import func, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from app.database import async_session_maker, read_router
+from app.export import EXPORT_BATCH_SIZE, export_query, stream_csv, stream_ndjson
+from app.filters import ReceiptFilters
+from app.metrics import receipts_created
+from app.models import Job
+from app.rollups import rebuild_daily_sales
+from app.schemas import ExportReceiptsParams, ImportReceiptsParams, JobDisplay, RebuildDailySalesParams
+from app.services import INSUFFICIENT_PAYMENT, calculate_receipt_totals, insert_receipts
+from config import JOBS_ENABLED, JOB_CONCURRENCY, JOB_POLL_INTERVAL, JOB_STALE_AFTER, JOB_RESULT_DIR
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobContext:
+    """
+    What a running job knows about itself: its ID, its owner, a session maker for its own transactions
+    and `report_progress` to publish how far it got.
+    """
+
+    def __init__(self, job_id: int, user_id: int, session_maker: async_sessionmaker):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.session_maker = session_maker
+        self.progress = 0
+
+    async def report_progress(self, done: int, total: int) -> None:
+        """
+        Records `done` out of `total` as a percentage. Only increases are written, so reporting every item
+        costs at most a hundred updates. 100 is reserved for the job's success.
+        """
+        percent = min(99, done * 100 // total) if total > 0 else 0
+        if percent <= self.progress:
+            return
+        self.progress = percent
+        async with self.session_maker() as db:
+            await db.execute(update(Job).where(Job.id == self.job_id).values(progress=percent)
+                             .execution_options(synchronize_session=False))
+            await db.commit()
+
+
+JobHandler = Callable[[JobContext, Any], Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class JobKind:
+    name: str
+    handler: JobHandler
+    params: Type[BaseModel]
+
+
+class JobRegistry:
+    """
+    The job kinds a runner can run, by name. Handlers are registered with a decorator:
+
+        @job_registry.register("rebuild_daily_sales", RebuildDailySalesParams)
+        async def rebuild_daily_sales_job(context: JobContext, params: RebuildDailySalesParams) -> dict:
+            ...
+
+    A handler receives the validated parameters and returns a JSON-serializable result, or None.
+    """
+
+    def __init__(self):
+        self._kinds: Dict[str, JobKind] = {}
+
+    def register(self, name: str, params: Type[BaseModel]) -> Callable[[JobHandler], JobHandler]:
+        def decorator(handler: JobHandler) -> JobHandler:
+            if name in self._kinds:
+                raise ValueError(f"Job kind {name!r} is already registered")
+            self._kinds[name] = JobKind(name, handler, params)
+            return handler
+        return decorator
+
+    def get(self, name: str) -> Optional[JobKind]:
+        return self._kinds.get(name)
+
+    def names(self) -> List[str]:
+        return sorted(self._kinds)
+
+
+job_registry = JobRegistry()
+
+
+def new_job(user_id: int, kind: JobKind, params: BaseModel) -> Job:
+    """
+    Builds the queued `jobs` row of a job. The caller adds and commits it, then notifies the runner.
+    """
+    return Job(user_id=user_id, kind=kind.name, params=orjson.dumps(params.model_dump(mode="json")).decode(),
+               status=QUEUED, progress=0, cancel_requested=False, created_at=datetime.utcnow())
+
+
+def job_display(job: Job) -> JobDisplay:
+    return JobDisplay(
+        id=job.id, kind=job.kind, status=job.status, progress=job.progress, cancel_requested=job.cancel_requested,
+        result=orjson.loads(job.result) if job.result is not None else None, error=job.error,
+        created_at=job.created_at, started_at=job.started_at, finished_at=job.finished_at,
+    )
+
+
+async def request_cancel(db: AsyncSession, job_id: int) -> None:
+    """
+    Cancels a queued job, or flags a running one for its runner to cancel. Finished jobs are left alone.
+    The caller commits.
+    """
+    result = await db.execute(
+        update(Job).where(Job.id == job_id, Job.status == QUEUED)
+        .values(status=CANCELLED, cancel_requested=True, finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return
+    await db.execute(update(Job).where(Job.id == job_id, Job.status == RUNNING).values(cancel_requested=True)
+                     .execution_options(synchronize_session=False))
+
+
+class JobRunner:
+    """
+    Background task claiming queued jobs and running up to `concurrency` of them at once, each in a task
+    of its own. Queued jobs are looked for every `poll_interval` seconds, when `notify` is called and
+    whenever a job finishes.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, registry: JobRegistry, concurrency: int = 2,
+                 poll_interval: float = 1.0, stale_after: float = 60.0):
+        self.session_maker = session_maker
+        self.registry = registry
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._jobs: Dict[int, asyncio.Task] = {}
+        self._cancelling: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops claiming jobs and interrupts the running ones, which are recorded as failed.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+
+    def notify(self) -> None:
+        """
+        Looks for queued jobs now rather than at the next poll.
+        """
+        self._wakeup.set()
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancels a job if this runner is running it. Returns False otherwise.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        self._cancelling.add(job_id)
+        job.cancel()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._heartbeat()
+                while len(self._jobs) < self.concurrency:
+                    job = await self._claim()
+                    if job is None:
+                        break
+                    self._jobs[job.id] = asyncio.create_task(self._execute(job))
+            except Exception:
+                logger.exception("Failed to poll the jobs table")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self) -> None:
+        now = datetime.utcnow()
+        async with self.session_maker() as db:
+            if self._jobs:
+                result = await db.execute(
+                    update(Job).where(Job.id.in_(list(self._jobs)), Job.status == RUNNING).values(heartbeat_at=now)
+                    .returning(Job.id, Job.cancel_requested).execution_options(synchronize_session=False)
+                )
+                for job_id, cancel_requested in result.all():
+                    if cancel_requested:
+                        self.cancel(job_id)
+            result = await db.execute(
+                update(Job).where(Job.status == RUNNING, Job.heartbeat_at < now - timedelta(seconds=self.stale_after))
+                .values(status=FAILED, error="Interrupted: its worker stopped", finished_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.warning("Failed %d jobs left running by a stopped worker", result.rowcount)
+
+    async def _claim(self) -> Optional[Row]:
+        now = datetime.utcnow()
+        next_job = select(Job.id).where(Job.status == QUEUED, Job.kind.in_(self.registry.names())) \
+            .order_by(Job.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+        async with self.session_maker() as db:
+            result = await db.execute(
+                update(Job).where(Job.id == next_job, Job.status == QUEUED)
+                .values(status=RUNNING, started_at=now, heartbeat_at=now)
+                .returning(Job.id, Job.user_id, Job.kind, Job.params).execution_options(synchronize_session=False)
+            )
+            job = result.first()
+            await db.commit()
+        return job
+
+    async def _execute(self, job: Row) -> None:
+        kind = self.registry.get(job.kind)
+        try:
+            # Parameters can hold up to a hundred thousand receipts, too many to validate on the event loop
+            params = await asyncio.to_thread(kind.params.model_validate_json, job.params)
+            result = await kind.handler(JobContext(job.id, job.user_id, self.session_maker), params)
+        except asyncio.CancelledError:
+            if job.id in self._cancelling:
+                await self._finish(job.id, CANCELLED)
+            else:
+                await self._finish(job.id, FAILED, error="Interrupted: the worker shut down")
+        except Exception as exc:
+            logger.exception("Job %d (%s) failed", job.id, job.kind)
+            await self._finish(job.id, FAILED, error=str(exc) or exc.__class__.__name__)
+        else:
+            await self._finish(job.id, SUCCEEDED, result=result)
+        finally:
+            self._jobs.pop(job.id, None)
+            self._cancelling.discard(job.id)
+            self._wakeup.set()
+
+    async def _finish(self, job_id: int, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        values = {"status": status, "error": error, "finished_at": datetime.utcnow()}
+        if status == SUCCEEDED:
+            values["progress"] = 100
+            values["result"] = orjson.dumps(result).decode() if result is not None else None
+        try:
+            async with self.session_maker() as db:
+                await db.execute(update(Job).where(Job.id == job_id, Job.status == RUNNING).values(**values)
+                                 .execution_options(synchronize_session=False))
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to record the outcome of job %d", job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": len(self._jobs), "concurrency": self.concurrency}
+
+
+def create_job_runner(session_maker: async_sessionmaker) -> JobRunner:
+    return JobRunner(session_maker, job_registry, concurrency=JOB_CONCURRENCY, poll_interval=JOB_POLL_INTERVAL,
+                     stale_after=JOB_STALE_AFTER)
+
+
+job_runner = create_job_runner(async_session_maker) if JOBS_ENABLED else None
+
+
+# Built-in jobs
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_path(job_id: int, export_format: str) -> str:
+    return os.path.join(JOB_RESULT_DIR, f"receipts-{job_id}.{export_format}")
+
+
+@job_registry.register("export_receipts", ExportReceiptsParams)
+async def export_receipts_job(context: JobContext, params: ExportReceiptsParams) -> dict:
+    """
+    Writes the filtered receipts of the job's owner to a file under `JOB_RESULT_DIR`, in the format of
+    `GET /receipts/export`. Progress follows the rows read, one batch at a time.
+    """
+    filters = ReceiptFilters(receipt_id=params.receipt_id, start_date=params.start_date, end_date=params.end_date,
+                             min_total=params.min_total, max_total=params.max_total,
+                             payment_type=params.payment_type)
+    query = export_query(filters, context.user_id)
+    async with context.session_maker() as db:
+        rows = (await db.execute(select(func.count()).select_from(query.order_by(None).subquery()))).scalar()
+
+    os.makedirs(JOB_RESULT_DIR, exist_ok=True)
+    path = export_path(context.job_id, params.format)
+    partial = path + ".partial"
+    stream = stream_csv if params.format == "csv" else stream_ndjson
+    try:
+        with open(partial, "wb") as file:
+            # Both streams yield about once per batch of rows
+            batches = 0
+            async for chunk in stream(context.session_maker, query):
+                await asyncio.to_thread(file.write, chunk)
+                batches += 1
+                await context.report_progress(batches * EXPORT_BATCH_SIZE, rows)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return {"format": params.format, "size": os.path.getsize(path), "download": f"/jobs/{context.job_id}/result"}
+
+
+@job_registry.register("import_receipts", ImportReceiptsParams)
+async def import_receipts_job(context: JobContext, params: ImportReceiptsParams) -> dict:
+    """
+    Stores many receipts of the job's owner like `POST /receipts/bulk`, one transaction per chunk of
+    receipts. Chunks committed before a cancellation are kept. Receipts are totalled one chunk at a time
+    too, so the event loop is never held for more than a chunk.
+    """
+    receipts = params.receipts
+    errors = []
+    created = 0
+    created_at = datetime.utcnow()
+    for start in range(0, len(receipts), IMPORT_CHUNK_SIZE):
+        chunk = []
+        for index, receipt_data in enumerate(receipts[start:start + IMPORT_CHUNK_SIZE], start):
+            total, rest = calculate_receipt_totals(receipt_data)
+            if rest < 0:
+                errors.append({"index": index, "error": INSUFFICIENT_PAYMENT})
+                continue
+            chunk.append((index, receipt_data, (total, rest)))
+
+        if chunk:
+            async with context.session_maker() as db:
+                try:
+                    receipt_ids = await insert_receipts(db, context.user_id, [receipt for _, receipt, _ in chunk],
+                                                        [totals for _, _, totals in chunk], created_at)
+                    await db.commit()
+                except SQLAlchemyError:
+                    await db.rollback()
+                    errors.extend({"index": index, "error": "Failed to store receipt"} for index, _, _ in chunk)
+                else:
+                    read_router.mark_write(context.user_id)
+                    receipts_created.inc(len(receipt_ids))
+                    created += len(receipt_ids)
+        await context.report_progress(start + IMPORT_CHUNK_SIZE, len(receipts))
+        # Progress is only written when it grows, yield to the other tasks between chunks regardless
+        await asyncio.sleep(0)
+
+    return {"created": created, "errors": sorted(errors, key=lambda error: error["index"])}
+
+
+@job_registry.register("rebuild_daily_sales", RebuildDailySalesParams)
+async def rebuild_daily_sales_job(context: JobContext, params: RebuildDailySalesParams) -> dict:
+    """
+    Recomputes the `daily_sales` rollup rows of the job's owner.
+    """
+    async with context.session_maker() as db:
+        rows = await rebuild_daily_sales(db, user_id=context.user_id)
+        await db.commit()
+    return {"rows": rows}
@@ -0,0 +1,368 @@
+"""
+Prometheus metrics kept in plain per-process dictionaries and rendered in the text exposition format.
+
+Every uvicorn worker is a separate process with its own event loop, so updates need no locking. With
+`METRICS_MULTIPROC_DIR` set, each worker periodically writes a snapshot of its metrics to `<dir>/<pid>.json`
+and `/metrics` adds up the snapshots of all workers, whichever worker serves the scrape. Snapshots of
+workers that exited still count towards counters and histograms but not gauges. Empty the directory
+before starting the server.
+"""
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+
+from app.database import pool_status
+from app.hashing import password_hasher
+from app.tokens import token_cache
+from config import METRICS_MULTIPROC_DIR, METRICS_WRITE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "values": [[list(key), value] for key, value in self._values.items()],
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Per-bucket (non-cumulative) counts with a final +Inf bucket, then sum and count
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+class CallbackMetric(Metric):
+    """
+    A counter or gauge read from `callback` when metrics are collected, for values owned by other objects.
+    """
+
+    def __init__(self, name: str, documentation: str, type: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.type = type
+        self.callback = callback
+
+    def snapshot(self) -> dict:
+        self._values[()] = float(self.callback())
+        return super().snapshot()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, type: str, callback: Callable[[], float]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, type, callback))
+
+    def snapshot(self) -> Dict[str, dict]:
+        snapshot = {}
+        for name, metric in self._metrics.items():
+            try:
+                snapshot[name] = metric.snapshot()
+            except Exception:
+                logger.exception("Failed to collect metric %s", name)
+        return snapshot
+
+
+def merge_snapshots(snapshots: Iterable[Tuple[Dict[str, dict], bool]]) -> Dict[str, dict]:
+    """
+    Adds up metric snapshots of several processes. Each snapshot comes with a flag telling whether its
+    process is still alive; gauges of exited processes are left out.
+    """
+    merged: Dict[str, dict] = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            values = target["values"]
+            for labelvalues, value in metric["values"]:
+                key = tuple(labelvalues)
+                if metric["type"] != "histogram":
+                    values[key] = values.get(key, 0.0) + value
+                elif key not in values:
+                    values[key] = [list(value[0]), value[1], value[2]]
+                else:
+                    state = values[key]
+                    state[0] = [a + b for a, b in zip(state[0], value[0])]
+                    state[1] += value[1]
+                    state[2] += value[2]
+    for metric in merged.values():
+        metric["values"] = [[list(key), value] for key, value in metric["values"].items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render(snapshot: Dict[str, dict]) -> str:
+    lines: List[str] = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labelvalues, value in metric["values"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric["buckets"]) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labelvalues)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labelvalues)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code",
+    ["method", "route", "status"])
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template", ["method", "route"])
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being processed")
+receipts_created = registry.counter("receipts_created_total", "Receipts created")
+password_verify_duration = registry.histogram(
+    "password_verify_duration_seconds", "Password verification time at login, including the hashing queue",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+registry.callback("db_pool_size", "Configured size of the primary connection pool", "gauge",
+                  lambda: pool_status()["size"])
+registry.callback("db_pool_checked_out", "Connections of the primary pool in use", "gauge",
+                  lambda: pool_status()["checked_out"])
+registry.callback("db_pool_checked_in", "Idle connections of the primary pool", "gauge",
+                  lambda: pool_status()["checked_in"])
+registry.callback("db_pool_overflow", "Overflow connections of the primary pool in use", "gauge",
+                  lambda: pool_status()["overflow"])
+registry.callback("db_pool_checkouts_total", "Connection checkouts from the primary pool", "counter",
+                  lambda: pool_status().get("checkouts", 0))
+registry.callback("db_pool_wait_seconds_total", "Time spent waiting for primary pool connections", "counter",
+                  lambda: pool_status().get("wait_seconds", 0.0))
+registry.callback("password_hash_waiting", "Password hashing operations waiting for a worker", "gauge",
+                  lambda: password_hasher.waiting)
+registry.callback("password_hash_running", "Password hashing operations in progress", "gauge",
+                  lambda: password_hasher.running)
+registry.callback("password_hash_busy_seconds_total", "Time spent hashing and verifying passwords", "counter",
+                  lambda: password_hasher.busy_seconds)
+
+
+def register_cache_metrics(name: str, stats: Callable[[], Dict[str, int]]) -> None:
+    """
+    Exposes the hits, misses, evictions and size of a `TTLCache` as `<name>_cache_*` metrics. `stats` returns
+    the cache's `stats()`, or an empty dict while the cache is disabled.
+    """
+    registry.callback(f"{name}_cache_hits_total", f"Lookups answered by the {name} cache", "counter",
+                      lambda: stats().get("hits", 0))
+    registry.callback(f"{name}_cache_misses_total", f"Lookups the {name} cache could not answer", "counter",
+                      lambda: stats().get("misses", 0))
+    registry.callback(f"{name}_cache_evictions_total", f"Entries evicted from the full {name} cache", "counter",
+                      lambda: stats().get("evictions", 0))
+    registry.callback(f"{name}_cache_size", f"Entries in the {name} cache", "gauge",
+                      lambda: stats().get("size", 0))
+
+
+register_cache_metrics("token", token_cache.stats)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latencies and in-flight requests, labelled with the
+    matched route template so path parameters do not multiply the series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(method=scope["method"], route=route_path, status=str(status))
+            http_request_duration.observe(elapsed, method=scope["method"], route=route_path)
+
+
+class MultiprocessMetrics:
+    """
+    Shares the metrics of uvicorn workers through snapshot files in `directory`.
+    """
+
+    def __init__(self, directory: str, interval: float = 5.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def write(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        temporary = path.with_suffix(".tmp")
+        temporary.write_bytes(orjson.dumps(registry.snapshot()))
+        os.replace(temporary, path)
+
+    def collect(self) -> Dict[str, dict]:
+        own_pid = os.getpid()
+        snapshots = [(registry.snapshot(), True)]
+        for path in self.directory.glob("*.json"):
+            pid = int(path.stem)
+            if pid == own_pid:
+                continue
+            try:
+                snapshots.append((orjson.loads(path.read_bytes()), _process_alive(pid)))
+            except (OSError, orjson.JSONDecodeError):
+                logger.warning("Skipping unreadable metrics snapshot %s", path)
+        return merge_snapshots(snapshots)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.write()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                self.write()
+            except OSError:
+                logger.exception("Failed to write the metrics snapshot")
+            await asyncio.sleep(self.interval)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+multiprocess_metrics = MultiprocessMetrics(METRICS_MULTIPROC_DIR, METRICS_WRITE_INTERVAL) \
+    if METRICS_MULTIPROC_DIR else None
+
+
+def collect_metrics() -> str:
+    if multiprocess_metrics is not None:
+        return render(multiprocess_metrics.collect())
+    return render(registry.snapshot())
@@ -1,6 +1,10 @@
 from datetime import datetime
+from decimal import Decimal
 
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, DateTime, Date, Index, Text, Boolean, \
+    ForeignKeyConstraint, PrimaryKeyConstraint, DDL, event, func, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -8,39 +12,93 @@ Base = declarative_base()
 
 class Product(Base):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Substring and typo-tolerant name search (ILIKE, %>) through pg_trgm
+        Index('ix_products_name_trgm', 'name', postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    price = Column(Numeric)
+    name = Column(String, unique=True, index=True)
+    price = Column(Numeric(12, 2))
+
+
+def product_name_tsvector():
+    """
+    The full-text document of a product name. Queries must use this exact expression to hit its index.
+    """
+    return func.to_tsvector(text("'simple'::regconfig"), Product.name)
+
+
+# Whole-word name search in any word order
+Index('ix_products_name_tsv', product_name_tsvector(), postgresql_using='gin').ddl_if(dialect='postgresql')
+event.listen(Product.__table__, 'before_create',
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql'))
 
 
 class Receipt(Base):
+    """
+    On PostgreSQL receipts are range-partitioned by the month of `created_at` (see `app.partitions`),
+    so the partition key is part of the primary key. IDs come from one sequence and stay unique on their own,
+    which is what the ORM identity relies on.
+    """
     __tablename__ = 'receipts'
-
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        # Listing, keyset pagination and date ranges of one user's receipts
+        Index('ix_receipts_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        # The same access pattern narrowed down to one payment type
+        Index('ix_receipts_user_id_payment_type_created_at_id', 'user_id', 'payment_type', 'created_at', 'id'),
+        {'postgresql_partition_by': 'RANGE (created_at)', 'info': {'partition_key': 'created_at'}},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    total = Column(Numeric)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    # Money columns hold hryvnias with two decimals, see `app.money`
+    total = Column(Numeric(12, 2))
     payment_type = Column(String)
-    payment_amount = Column(Numeric)
-    change_given = Column(Numeric)
+    payment_amount = Column(Numeric(12, 2))
+    change_given = Column(Numeric(12, 2))
 
     user = relationship("User", back_populates="receipts")
     items = relationship("ReceiptItem", back_populates="receipt")
 
+    __mapper_args__ = {'primary_key': [id]}
+
 
 class ReceiptItem(Base):
+    """
+    Partitioned like `Receipt`, by the creation time of the receipt the item belongs to.
+    """
     __tablename__ = 'receipt_items'
-
-    id = Column(Integer, primary_key=True, index=True)
-    receipt_id = Column(Integer, ForeignKey('receipts.id'))
-    product_id = Column(Integer, ForeignKey('products.id'))
+    __table_args__ = (
+        ForeignKeyConstraint(['receipt_id', 'receipt_created_at'], ['receipts.id', 'receipts.created_at'],
+                             name='fk_receipt_items_receipt'),
+        {'postgresql_partition_by': 'RANGE (receipt_created_at)', 'info': {'partition_key': 'receipt_created_at'}},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    receipt_id = Column(Integer, index=True)
+    receipt_created_at = Column(DateTime, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), index=True)
     quantity = Column(Numeric)
-    total_price = Column(Numeric)
+    # The price paid per unit on this receipt; `products.price` only keeps the first price a product was seen at.
+    # Items written without one fall back to `products.price`, see `item_price`
+    unit_price = Column(Numeric(12, 2))
+    total_price = Column(Numeric(12, 2))
 
     receipt = relationship("Receipt", back_populates="items")
     product = relationship("Product")
 
+    __mapper_args__ = {'primary_key': [id]}
+
+
+def item_price(item: ReceiptItem) -> Decimal:
+    """
+    The unit price an item was sold at, the product's price for items stored without one.
+    """
+    return item.unit_price if item.unit_price is not None else item.product.price
+
 
 class User(Base):
     __tablename__ = 'users'
@@ -51,3 +109,84 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
 
     receipts = relationship("Receipt", back_populates="user")
+
+
+class DailySales(Base):
+    """Per-user sales totals by day and payment type, maintained incrementally as receipts are stored."""
+    __tablename__ = 'daily_sales'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    receipt_count = Column(Integer, nullable=False, default=0)
+    total = Column(Numeric(12, 2), nullable=False, default=0)
+    change_given = Column(Numeric(12, 2), nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    """Remembers the receipt created for a client-supplied `Idempotency-Key` so retries return it again."""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # Not a foreign key: receipts.id is only unique together with the partition key
+    receipt_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    response = Column(Text, nullable=False)
+
+
+class Job(Base):
+    """A unit of background work run by `app.jobs.JobRunner`, with its progress and outcome."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Runners claim the oldest queued job and watch the running ones
+        Index('ix_jobs_status_id', 'status', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    kind = Column(String(64), nullable=False)
+    # JSON documents: the validated parameters and the handler's result
+    params = Column(Text, nullable=False)
+    result = Column(Text)
+    # queued, running, succeeded, failed or cancelled
+    status = Column(String(16), nullable=False, default='queued')
+    progress = Column(Integer, nullable=False, default=0)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # Refreshed by the runner while the job runs, so jobs of a dead worker can be told apart
+    heartbeat_at = Column(DateTime)
+
+
+for partitioned_table in (Receipt.__table__, ReceiptItem.__table__):
+    # Rows outside every monthly partition land here instead of failing the insert
+    event.listen(partitioned_table, 'after_create', DDL(
+        f"CREATE TABLE {partitioned_table.name}_default PARTITION OF {partitioned_table.name} DEFAULT"
+    ).execute_if(dialect='postgresql'))
+
+
+# SQLite has no partitions: partitioned tables keep `id` as their only primary key column there,
+# so it stays an auto-incrementing rowid alias
+@compiles(PrimaryKeyConstraint, 'sqlite')
+def _sqlite_primary_key(constraint, compiler, **kw):
+    partition_key = constraint.table.info.get('partition_key')
+    if partition_key is None:
+        return compiler.visit_primary_key_constraint(constraint, **kw)
+    columns = ", ".join(compiler.preparer.quote(column.name) for column in constraint.columns
+                        if column.name != partition_key)
+    return f"PRIMARY KEY ({columns})"
+
+
+@compiles(CreateColumn, 'sqlite')
+def _sqlite_create_column(create, compiler, **kw):
+    column = create.element
+    if column.autoincrement is not True or 'partition_key' not in column.table.info:
+        return compiler.visit_create_column(create, **kw)
+    column_type = compiler.dialect.type_compiler_instance.process(column.type, type_expression=column)
+    return f"{compiler.preparer.format_column(column)} {column_type} NOT NULL"
@@ -0,0 +1,85 @@
+"""
+Money arithmetic with explicit rounding.
+
+Validated amounts are `Decimal`s with at most two decimals. Every line total (price x quantity) is rounded
+to the kopeck on its own, half away from zero, which C decimal does in one `quantize` (`line_amount`).
+Receipt totals and changes are then scaled once into integer kopecks (`receipt_totals`, `to_minor`), exact to
+add, subtract and compare, and turned back into `Decimal` with `from_minor`. Stored amounts are rendered with
+`format_amount`.
+
+Rounding rules:
+- an amount with more than two decimals is rounded to the kopeck, half away from zero;
+- every line total (price x quantity) is rounded the same way, on its own;
+- a receipt total is the sum of its rounded line totals, exactly as printed on the receipt, and the
+  change is the payment minus that total.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, Tuple, Union
+
+from app.schemas import ProductInfo
+
+MINOR_UNITS = 100
+HUNDRED = Decimal(MINOR_UNITS)
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+Amount = Union[Decimal, str, int]
+
+
+def to_minor(amount: Amount) -> int:
+    """
+    Converts an amount in hryvnias into kopecks. Floats are refused, they cannot hold most amounts exactly.
+    """
+    if amount.__class__ is not Decimal:
+        if isinstance(amount, float):
+            raise TypeError("Money amounts must be Decimal, str or int, not float")
+        amount = Decimal(amount)
+    scaled = amount * HUNDRED
+    minor = int(scaled)
+    # Amounts with at most two decimals, i.e. nearly all of them, need no rounding
+    if minor == scaled:
+        return minor
+    return int(scaled.to_integral_value(ROUND_HALF_UP))
+
+
+def from_minor(minor: int) -> Decimal:
+    """
+    Converts kopecks back into a `Decimal` amount with exactly two decimals.
+    """
+    return Decimal(minor).scaleb(-2)
+
+
+def format_amount(amount: Amount) -> str:
+    """
+    Renders an amount with two decimals, rounded half away from zero. Text that already has two decimals,
+    such as a numeric(12, 2) column read as text, is returned as it is.
+    """
+    if amount.__class__ is not Decimal:
+        if amount.__class__ is str and amount[-3:-2] == ".":
+            return amount
+        amount = Decimal(amount)
+    return str(amount.quantize(CENT, ROUND_HALF_UP))
+
+
+def line_amount(price: Decimal, quantity: Decimal) -> Decimal:
+    """
+    The total of a receipt line, rounded to the kopeck.
+    """
+    return (price * quantity).quantize(CENT, ROUND_HALF_UP)
+
+
+def receipt_totals(items: Iterable[ProductInfo], payment: Decimal) -> Tuple[int, int]:
+    """
+    Returns the total and the change of a receipt in kopecks, the change being negative when the payment
+    does not cover the total.
+
+    Args:
+    items (Iterable[ProductInfo]): The validated receipt items.
+    payment (Decimal): The validated amount paid.
+    """
+    total = ZERO
+    for item in items:
+        total += (item.price * item.quantity).quantize(CENT, ROUND_HALF_UP)
+    # Both the sum of rounded lines and a validated payment are whole kopecks, no rounding is left to do
+    total = int(total * HUNDRED)
+    return total, int(payment * HUNDRED) - total
@@ -0,0 +1,156 @@
+"""
+Monthly range partitions of `receipts` and `receipt_items` on PostgreSQL.
+
+Partitions are named `<table>_y<year>m<month>` and cover one calendar month of the partition key;
+rows outside every monthly partition go to `<table>_default`, which should stay empty. Upcoming months
+are created ahead of time by `PartitionMaintainer`, old months are detached (and optionally dropped)
+by `detach_partitions`, so date-bounded queries only scan the months they ask for.
+"""
+import asyncio
+import logging
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import PARTITION_MONTHS_AHEAD, PARTITION_MAINTENANCE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Parents before children: receipt_items partitions reference receipts
+PARTITIONED_TABLES = ("receipts", "receipt_items")
+ITEMS_FOREIGN_KEY = "fk_receipt_items_receipt"
+PARTITION_NAME = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def supports_partitions(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name == 'postgresql'
+
+
+async def list_partitions(db: AsyncSession, table: str) -> List[Tuple[str, date]]:
+    """
+    Returns the monthly partitions attached to `table` with their months, oldest first.
+    """
+    result = await db.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = :table"
+    ), {"table": table})
+    partitions = []
+    for name in result.scalars():
+        match = PARTITION_NAME.match(name)
+        if match and match["table"] == table:
+            partitions.append((name, date(int(match["year"]), int(match["month"]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def create_month_partitions(db: AsyncSession, first_month: date, months: int) -> List[str]:
+    """
+    Creates the missing monthly partitions of every partitioned table for `months` months starting
+    with `first_month`. Returns the names of the created partitions. The caller commits.
+
+    Creating a month whose rows already sit in the default partition fails; move them out first.
+    """
+    # Several workers may run this at once
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('receipt_partitions'))"))
+    created = []
+    for table in PARTITIONED_TABLES:
+        existing = {name for name, _ in await list_partitions(db, table)}
+        for offset in range(months):
+            month = add_months(month_start(first_month), offset)
+            name = partition_name(table, month)
+            if name in existing:
+                continue
+            await db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+    return created
+
+
+async def detach_partitions(db: AsyncSession, before: date, drop: bool = False) -> List[str]:
+    """
+    Detaches the monthly partitions lying entirely before `before`, items first. Detached partitions
+    become standalone tables that can be archived with pg_dump, or are dropped when `drop` is set.
+    Returns the names of the detached partitions. The caller commits.
+    """
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('receipt_partitions'))"))
+    detached = []
+    for table in reversed(PARTITIONED_TABLES):
+        for name, month in await list_partitions(db, table):
+            if add_months(month, 1) > before:
+                continue
+            await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if table == "receipt_items":
+                # The detached table keeps a copy of the foreign key, which would pin the receipts partition
+                await db.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {ITEMS_FOREIGN_KEY}"))
+            if drop:
+                await db.execute(text(f"DROP TABLE {name}"))
+            detached.append(name)
+    return detached
+
+
+class PartitionMaintainer:
+    """
+    Background task creating the partitions of the current and the next `months_ahead` months
+    at startup and then every `interval` seconds. Does nothing on databases without partitions.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, months_ahead: int = 3, interval: float = 43200):
+        self.session_maker = session_maker
+        self.months_ahead = months_ahead
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def ensure_partitions(self) -> List[str]:
+        async with self.session_maker() as db:
+            if not supports_partitions(db):
+                return []
+            created = await create_month_partitions(db, date.today(), self.months_ahead + 1)
+            await db.commit()
+        return created
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                created = await self.ensure_partitions()
+                if created:
+                    logger.info("Created partitions %s", ", ".join(created))
+            except Exception:
+                logger.exception("Failed to create upcoming partitions")
+            await asyncio.sleep(self.interval)
+
+
+def create_partition_maintainer(session_maker: async_sessionmaker) -> PartitionMaintainer:
+    return PartitionMaintainer(session_maker, months_ahead=PARTITION_MONTHS_AHEAD,
+                               interval=PARTITION_MAINTENANCE_INTERVAL)
@@ -0,0 +1,69 @@
+from typing import List
+
+from sqlalchemy import JSON, String, cast, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from app.models import Product, Receipt, ReceiptItem, item_price
+from app.serializers import receipt_dict
+
+
+def uses_projection(db: AsyncSession) -> bool:
+    """
+    The projected listing relies on PostgreSQL JSON aggregates, other databases use the ORM path.
+    """
+    return db.get_bind().dialect.name == 'postgresql'
+
+
+def receipt_items_json():
+    """
+    Correlated subquery aggregating the items of the outer receipt into a JSON array of
+    [name, unit price, quantity, line total] arrays, with numbers kept as text to preserve their precision.
+    Items stored without a unit price show the product's.
+    """
+    item = func.json_build_array(Product.name, cast(func.coalesce(ReceiptItem.unit_price, Product.price), String),
+                                 cast(ReceiptItem.quantity, String), cast(ReceiptItem.total_price, String))
+    items = select(func.json_agg(aggregate_order_by(item, ReceiptItem.id))).select_from(ReceiptItem).join(
+        Product, Product.id == ReceiptItem.product_id
+    ).where(ReceiptItem.receipt_id == Receipt.id,
+            ReceiptItem.receipt_created_at == Receipt.created_at).scalar_subquery()
+    return func.coalesce(items, literal_column("'[]'::json"), type_=JSON).label("items")
+
+
+def receipt_listing_query(db: AsyncSession):
+    """
+    Selects the receipts of a listing page: one round trip returning plain rows on PostgreSQL,
+    full `Receipt` objects with their items and products otherwise.
+    """
+    if uses_projection(db):
+        return select(Receipt.id, Receipt.created_at, Receipt.payment_type, Receipt.payment_amount,
+                      Receipt.total, Receipt.change_given, receipt_items_json())
+    return select(Receipt).options(selectinload(Receipt.items).selectinload(ReceiptItem.product))
+
+
+async def fetch_receipt_listing(db: AsyncSession, query) -> list:
+    """
+    Executes a query built on `receipt_listing_query` and returns rows that expose at least
+    `id` and `created_at`, ready for `receipt_listing_dicts`.
+    """
+    result = await db.execute(query)
+    if uses_projection(db):
+        return result.all()
+    return result.scalars().all()
+
+
+def receipt_listing_dicts(db: AsyncSession, rows: list) -> List[dict]:
+    if not uses_projection(db):
+        return [
+            receipt_dict(receipt.id, receipt.created_at, receipt.payment_type, receipt.payment_amount, receipt.total,
+                         receipt.change_given,
+                         [(item.product.name, item_price(item), item.quantity, item.total_price)
+                          for item in receipt.items])
+            for receipt in rows
+        ]
+    return [
+        receipt_dict(receipt_id, created_at, payment_type, payment_amount, total, change_given, items)
+        for receipt_id, created_at, payment_type, payment_amount, total, change_given, items in rows
+    ]
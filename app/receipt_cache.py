@@ -0,0 +1,70 @@
+import hashlib
+from typing import Optional, Protocol, Tuple
+
+from app.cache import TTLCache
+from config import RENDERED_RECEIPT_CACHE_SIZE
+
+
+class RenderedReceiptBackend(Protocol):
+    """
+    A cache shared between workers (Redis, memcached, ...) holding rendered receipts by receipt ID.
+    """
+
+    async def get(self, receipt_id: int) -> Optional[bytes]:
+        ...
+
+    async def set(self, receipt_id: int, body: bytes) -> None:
+        ...
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+class RenderedReceiptCache:
+    """
+    Rendered text receipts with their ETag, in an in-process LRU in front of an optional shared backend.
+    Persisted receipts never change, so entries are never invalidated, only evicted.
+    """
+
+    def __init__(self, maxsize: int, backend: Optional[RenderedReceiptBackend] = None):
+        self.local = TTLCache(maxsize=maxsize)
+        self.backend = backend
+
+    async def get(self, receipt_id: int) -> Optional[Tuple[bytes, str]]:
+        cached = self.local.get(receipt_id)
+        if cached is not None:
+            return cached
+        if self.backend is None:
+            return None
+        body = await self.backend.get(receipt_id)
+        if body is None:
+            return None
+        cached = (body, make_etag(body))
+        self.local.set(receipt_id, cached)
+        return cached
+
+    async def set(self, receipt_id: int, body: bytes) -> Tuple[bytes, str]:
+        cached = (body, make_etag(body))
+        self.local.set(receipt_id, cached)
+        if self.backend is not None:
+            await self.backend.set(receipt_id, body)
+        return cached
+
+    def clear(self) -> None:
+        """
+        Drops the in-process entries; the shared backend is left alone.
+        """
+        self.local.clear()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak validators are fine for a GET, compare the opaque part only
+    return "*" in candidates or etag in (candidate[2:] if candidate.startswith("W/") else candidate
+                                         for candidate in candidates)
+
+
+rendered_receipts = RenderedReceiptCache(RENDERED_RECEIPT_CACHE_SIZE)
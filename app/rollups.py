@@ -0,0 +1,74 @@
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.database import upsert_insert
+from app.models import DailySales, Receipt
+
+
+async def accumulate_daily_sales(db: AsyncSession, receipt_rows: Iterable[dict]) -> None:
+    """
+    Adds freshly inserted receipts to the `daily_sales` rollup with one upsert.
+    Runs in the caller's transaction, so the rollup commits together with the receipts.
+
+    Args:
+    db (AsyncSession): The database session.
+    receipt_rows (Iterable[dict]): Receipt rows with user_id, created_at, payment_type, total and change_given.
+    """
+    groups: Dict[Tuple[int, date, str], list] = {}
+    for row in receipt_rows:
+        key = (row["user_id"], row["created_at"].date(), row["payment_type"] or '')
+        group = groups.setdefault(key, [0, Decimal('0.00'), Decimal('0.00')])
+        group[0] += 1
+        group[1] += row["total"]
+        group[2] += row["change_given"] or 0
+    if not groups:
+        return
+
+    statement = upsert_insert(db, DailySales).values([
+        {"user_id": user_id, "day": day, "payment_type": payment_type,
+         "receipt_count": count, "total": total, "change_given": change_given}
+        for (user_id, day, payment_type), (count, total, change_given) in sorted(groups.items())
+    ])
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[DailySales.user_id, DailySales.day, DailySales.payment_type],
+        set_={
+            "receipt_count": DailySales.receipt_count + statement.excluded.receipt_count,
+            "total": DailySales.total + statement.excluded.total,
+            "change_given": DailySales.change_given + statement.excluded.change_given,
+        },
+    ))
+
+
+async def rebuild_daily_sales(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """
+    Recomputes the `daily_sales` rollup from `receipts`, for one user or for everybody.
+    Nothing is committed.
+
+    Returns:
+    int: The number of rollup rows written.
+    """
+    clear = delete(DailySales)
+    receipts = select(
+        Receipt.user_id,
+        func.date(Receipt.created_at),
+        func.coalesce(Receipt.payment_type, literal('')),
+        func.count(),
+        func.coalesce(func.sum(Receipt.total), 0),
+        func.coalesce(func.sum(Receipt.change_given), 0),
+    ).where(Receipt.user_id.is_not(None)).group_by(
+        Receipt.user_id, func.date(Receipt.created_at), func.coalesce(Receipt.payment_type, literal(''))
+    )
+    if user_id is not None:
+        clear = clear.where(DailySales.user_id == user_id)
+        receipts = receipts.where(Receipt.user_id == user_id)
+
+    await db.execute(clear)
+    result = await db.execute(insert(DailySales).from_select(
+        ["user_id", "day", "payment_type", "receipt_count", "total", "change_given"], receipts
+    ))
+    return result.rowcount
@@ -0,0 +1,52 @@
+from typing import List, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import Response
+
+from app import analytics
+from app.analytics import TIME_GRAINS, ARROW_MEDIA_TYPE, sales_query, top_products_query, run_report, \
+    encode_rows, encode_columns, encode_arrow
+from app.filters import ReceiptFilters
+from app.schemas import CurrentUser
+from app.services import get_current_user, get_user_read_session
+
+router = APIRouter()
+
+
+@router.get("/analytics/receipts")
+async def get_receipt_analytics(
+        filters: ReceiptFilters = Depends(),
+        report: Literal["sales", "products"] = Query("sales", description="Sales per group, or top products"),
+        group_by: List[Literal["day", "week", "month", "payment_type"]] = Query(
+            ["day"], description="Grouping of the sales report: one time grain and/or payment_type"),
+        top: int = Query(10, ge=1, le=1000, description="Number of products in the products report"),
+        output_format: Literal["json", "columns", "arrow"] = Query("json", alias="format",
+                                                                   description="Result format"),
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_user_read_session)
+):
+    """
+    Aggregates the authenticated user's receipts matching the same filters as `GET /receipts/` in the database.
+    The sales report returns the receipt count, total and change given per day, week or month and/or
+    payment type; the products report returns the `top` products by revenue with the quantity sold.
+    `format=json` returns one object per row, `format=columns` one array per column and `format=arrow`
+    an Arrow IPC stream, the last two being compact enough for dashboards.
+    """
+    group_by = list(dict.fromkeys(group_by))
+    if sum(dimension in TIME_GRAINS for dimension in group_by) > 1:
+        raise HTTPException(status_code=400, detail="Group by at most one of day, week and month")
+    if output_format == "arrow" and analytics.pyarrow is None:
+        raise HTTPException(status_code=400, detail="Arrow output is not available, pyarrow is not installed")
+
+    if report == "products":
+        query = top_products_query(filters, user.id, top)
+    else:
+        query = sales_query(db, filters, user.id, group_by)
+    names, rows = await run_report(db, query)
+
+    if output_format == "arrow":
+        return Response(encode_arrow(names, rows), media_type=ARROW_MEDIA_TYPE)
+    if output_format == "columns":
+        return Response(encode_columns(names, rows), media_type="application/json")
+    return Response(encode_rows(names, rows), media_type="application/json")
@@ -0,0 +1,94 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import FileResponse
+
+from app.database import get_async_session, read_router
+from app.jobs import job_registry, job_runner, new_job, job_display, request_cancel, export_path, \
+    EXPORT_MEDIA_TYPES, FINISHED, SUCCEEDED
+from app.models import Job
+from app.schemas import CurrentUser, JobCreate, JobDisplay
+from app.services import get_current_user, get_user_read_session
+
+router = APIRouter()
+
+
+async def _user_job(db: AsyncSession, job_id: int, user: CurrentUser) -> Job:
+    job = await db.get(Job, job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs", response_model=JobDisplay, status_code=202)
+async def create_job(job_data: JobCreate, db: AsyncSession = Depends(get_async_session),
+                     user: CurrentUser = Depends(get_current_user)):
+    """
+        Queues a background job for the authenticated user and returns it at once, before it runs.
+        `kind` is one of the registered job kinds (export_receipts, import_receipts, rebuild_daily_sales)
+        and `params` its parameters, validated now. Follow the job with `GET /jobs/{job_id}`.
+    """
+    kind = job_registry.get(job_data.kind)
+    if kind is None:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown job kind, expected one of: {', '.join(job_registry.names())}")
+    try:
+        params = kind.params.model_validate(job_data.params)
+    except ValidationError as exc:
+        raise RequestValidationError([{**error, "loc": ("body", "params", *error["loc"])} for error in exc.errors()])
+
+    job = new_job(user.id, kind, params)
+    db.add(job)
+    await db.commit()
+    read_router.mark_write(user.id)
+    if job_runner is not None:
+        job_runner.notify()
+    return job_display(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobDisplay)
+async def get_job(job_id: int, user: CurrentUser = Depends(get_current_user),
+                  db: AsyncSession = Depends(get_user_read_session)):
+    """
+        Returns the status, progress percentage and, once finished, the result or error of a job
+        of the authenticated user.
+    """
+    return job_display(await _user_job(db, job_id, user))
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobDisplay)
+async def cancel_job(job_id: int, db: AsyncSession = Depends(get_async_session),
+                     user: CurrentUser = Depends(get_current_user)):
+    """
+        Cancels a job of the authenticated user. A queued job is cancelled at once; a running one is flagged
+        with `cancel_requested` and stopped by the worker running it within a poll interval.
+    """
+    job = await _user_job(db, job_id, user)
+    if job.status in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    await request_cancel(db, job_id)
+    await db.commit()
+    read_router.mark_write(user.id)
+    if job_runner is not None:
+        job_runner.cancel(job_id)
+    await db.refresh(job)
+    return job_display(job)
+
+
+@router.get("/jobs/{job_id}/result", response_class=FileResponse)
+async def get_job_result(job_id: int, user: CurrentUser = Depends(get_current_user),
+                         db: AsyncSession = Depends(get_user_read_session)):
+    """
+        Downloads the file written by a succeeded `export_receipts` job.
+    """
+    job = await _user_job(db, job_id, user)
+    if job.kind != "export_receipts" or job.status != SUCCEEDED:
+        raise HTTPException(status_code=404, detail="Job has no file to download")
+    export_format = job_display(job).result["format"]
+    path = export_path(job.id, export_format)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Job has no file to download")
+    return FileResponse(path, media_type=EXPORT_MEDIA_TYPES[export_format], filename=f"receipts.{export_format}")
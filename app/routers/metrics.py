@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from starlette.responses import Response
+
+from app.metrics import CONTENT_TYPE, collect_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Serves the Prometheus metrics of this worker, or of all workers when METRICS_MULTIPROC_DIR is set.
+    """
+    return Response(collect_metrics(), media_type=CONTENT_TYPE)
@@ -1,163 +1,358 @@
-from decimal import Decimal
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from starlette.responses import PlainTextResponse
+import orjson
+from pydantic import ValidationError
+from fastapi.responses import ORJSONResponse
+from starlette.responses import PlainTextResponse, StreamingResponse
 
 from app.models import Receipt, ReceiptItem
-from sqlalchemy.orm import selectinload
-from app.services import get_current_user, format_receipt
-from app.schemas import ReceiptCreate, ProductDisplay, PaymentInfo, ReceiptDisplay
-from datetime import datetime, date
-from fastapi import Depends, Query, APIRouter, HTTPException
+from app.services import get_current_user, get_user_read_session, get_user_read_session_maker, format_receipt, \
+    calculate_receipt_totals, insert_receipts, encode_cursor, decode_cursor, INSUFFICIENT_PAYMENT
+from app.schemas import ReceiptCreate, ProductDisplay, PaymentInfo, ReceiptDisplay, BulkReceiptResult, CurrentUser, \
+    PrintBatchRequest
+from datetime import datetime
+from fastapi import Depends, Header, Query, APIRouter, HTTPException, Request, Response
+from sqlalchemy import tuple_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.future import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import User
-from app.database import get_async_session
-from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.database import get_async_session, get_read_session, read_router
+from app.export import export_query, stream_csv, stream_ndjson
+from app.filters import ReceiptFilters
+from app.receipt_cache import rendered_receipts, etag_matches
+from app.queries import receipt_listing_query, fetch_receipt_listing, receipt_listing_dicts
+from app.write_behind import receipt_writer, WriteBehindQueueFull
+from app.idempotency import find_receipt_response, claim_idempotency_key, cache_receipt_response
+from app.instrumentation import phase
+from app.metrics import receipts_created
+from app.money import from_minor, line_amount
+from app.search import receipt_search_condition
+from sqlalchemy.orm import joinedload, selectinload
 
 router = APIRouter()
 
+BULK_CHUNK_SIZE = 500
+RECEIPT_SEPARATOR = b"\n\f\n"
 
-@router.post("/receipts/", response_model=ReceiptDisplay)
-async def create_receipt(receipt_data: ReceiptCreate, db: AsyncSession = Depends(get_async_session),
-                         user: User = Depends(get_current_user)):
-    """
-        Creates a new receipt based on the products and payment details provided.
-        Calculates the total cost of the products and determines the change to be given back.
-        Ensures that the payment amount covers the total cost of products, otherwise raises an error.
-        Saves the new receipt to the database and returns detailed information about the created receipt.
-    """
-    # Calculate total and rest
-    total = Decimal('0.00')
-    for item in receipt_data.products:
-        total += Decimal(item.price) * Decimal(item.quantity)
-    rest = Decimal(receipt_data.payment.amount) - total
-
-    if rest < Decimal('0.00'):
-        raise HTTPException(status_code=400, detail="Payment amount is less than the total price of products.")
-
-    # Create the receipt entry in the database
-    new_receipt = Receipt(
-        user_id=user.id,
-        created_at=datetime.utcnow(),
-        payment_type=receipt_data.payment.type,
-        payment_amount=Decimal(receipt_data.payment.amount),
-        total=total,
-        change_given=rest
-    )
-    db.add(new_receipt)
-    await db.commit()
-    await db.refresh(new_receipt)
 
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in exc.errors())
+
+
+def _receipt_display(receipt_id: int, receipt_data: ReceiptCreate, total: int, rest: int,
+                     created_at: datetime) -> ReceiptDisplay:
     # Prepare products display information
     products_display = [
         ProductDisplay(
             name=item.name,
-            price=Decimal(item.price),
-            quantity=Decimal(item.quantity),
-            total=Decimal(item.price) * Decimal(item.quantity)
+            price=item.price,
+            quantity=item.quantity,
+            total=line_amount(item.price, item.quantity)
         ) for item in receipt_data.products
     ]
 
     # Create PaymentInfo
     payment_info = PaymentInfo(
         type=receipt_data.payment.type,
-        amount=Decimal(receipt_data.payment.amount)
+        amount=receipt_data.payment.amount
     )
 
-    # Create and return the final receipt display object
-    receipt_display = ReceiptDisplay(
-        id=new_receipt.id,
+    # Create the final receipt display object
+    return ReceiptDisplay(
+        id=receipt_id,
         products=products_display,
         payment=payment_info,
-        total=total,
-        rest=rest,
-        created_at=new_receipt.created_at
+        total=from_minor(total),
+        rest=from_minor(rest),
+        created_at=created_at
     )
 
+
+@router.post("/receipts/", response_model=ReceiptDisplay)
+async def create_receipt(receipt_data: ReceiptCreate, db: AsyncSession = Depends(get_async_session),
+                         user: CurrentUser = Depends(get_current_user),
+                         idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)):
+    """
+        Creates a new receipt based on the products and payment details provided.
+        Calculates the total cost of the products and determines the change to be given back.
+        Ensures that the payment amount covers the total cost of products, otherwise raises an error.
+        Saves the new receipt together with its items in one transaction and returns detailed information about it.
+        A request repeating an earlier `Idempotency-Key` returns the receipt created the first time.
+    """
+    if idempotency_key is not None:
+        previous = await find_receipt_response(db, user.id, idempotency_key)
+        if previous is not None:
+            return previous
+
+    # Calculate total and rest
+    total, rest = calculate_receipt_totals(receipt_data)
+
+    if rest < 0:
+        raise HTTPException(status_code=400, detail=INSUFFICIENT_PAYMENT)
+
+    created_at = datetime.utcnow()
+    if idempotency_key is None and receipt_writer is not None and receipt_writer.running:
+        # Write-behind mode: the receipt is written together with other queued receipts
+        try:
+            receipt_id = await receipt_writer.submit(user.id, receipt_data, total, rest, created_at)
+        except WriteBehindQueueFull:
+            raise HTTPException(status_code=503, detail="Too many receipts in flight, retry later",
+                                headers={"Retry-After": "1"})
+        receipt_display = _receipt_display(receipt_id, receipt_data, total, rest, created_at)
+    else:
+        # Store the receipt, its items and the idempotency key in a single transaction
+        receipt_ids = await insert_receipts(db, user.id, [receipt_data], [(total, rest)], created_at)
+        receipt_display = _receipt_display(receipt_ids[0], receipt_data, total, rest, created_at)
+        if idempotency_key is not None and not await claim_idempotency_key(db, user.id, idempotency_key,
+                                                                           receipt_display):
+            # A concurrent request with the same key committed first
+            await db.rollback()
+            previous = await find_receipt_response(db, user.id, idempotency_key)
+            if previous is None:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+            return previous
+        await db.commit()
+        if idempotency_key is not None:
+            cache_receipt_response(user.id, idempotency_key, receipt_display)
+    read_router.mark_write(user.id)
+    receipts_created.inc()
+
     return receipt_display
 
 
+@router.post("/receipts/bulk", response_model=List[BulkReceiptResult])
+async def create_receipts_bulk(request: Request, db: AsyncSession = Depends(get_async_session),
+                               user: CurrentUser = Depends(get_current_user)):
+    """
+        Creates many receipts in one call from a JSON array or an NDJSON body (`application/x-ndjson`).
+        Every receipt is validated on its own, valid receipts are inserted together with their items
+        in one transaction per chunk of receipts, and products are resolved once per chunk.
+        Returns the ID or the error of every submitted receipt, in submission order.
+    """
+    body = await request.body()
+    results: List[BulkReceiptResult] = []
+    payloads = []
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                payloads.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                payloads.append(None)
+    else:
+        try:
+            payloads = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+        if not isinstance(payloads, list):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON array of receipts")
+
+    # Validate every receipt up front so that a single bad entry does not reject the whole batch
+    valid = []
+    for index, payload in enumerate(payloads):
+        result = BulkReceiptResult(index=index)
+        results.append(result)
+        if payload is None:
+            result.error = "Line is not valid JSON"
+            continue
+        try:
+            receipt_data = ReceiptCreate.model_validate(payload)
+        except ValidationError as exc:
+            result.error = _format_validation_error(exc)
+            continue
+        total, rest = calculate_receipt_totals(receipt_data)
+        if rest < 0:
+            result.error = INSUFFICIENT_PAYMENT
+            continue
+        valid.append((result, receipt_data, (total, rest)))
+
+    created_at = datetime.utcnow()
+    for start in range(0, len(valid), BULK_CHUNK_SIZE):
+        chunk = valid[start:start + BULK_CHUNK_SIZE]
+        try:
+            receipt_ids = await insert_receipts(db, user.id, [receipt for _, receipt, _ in chunk],
+                                                [totals for _, _, totals in chunk], created_at)
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            for result, _, _ in chunk:
+                result.error = "Failed to store receipt"
+            continue
+        read_router.mark_write(user.id)
+        receipts_created.inc(len(receipt_ids))
+        for (result, _, _), receipt_id in zip(chunk, receipt_ids):
+            result.id = receipt_id
+
+    return results
+
+
 @router.get("/receipts/", response_model=List[ReceiptDisplay])
 async def get_receipts(
-        receipt_id: Optional[int] = Query(None, description="Filter by specific receipt ID"),
-        start_date: Optional[date] = Query(None, description="Start date for filtering receipts"),
-        end_date: Optional[date] = Query(None, description="End date for filtering receipts"),
-        min_total: Optional[float] = Query(None, description="Minimum total amount for filtering receipts"),
-        max_total: Optional[float] = Query(None, description="Maximum total amount for filtering receipts"),
-        payment_type: Optional[str] = Query(None, description="Filter receipts by payment type"),
-        limit: int = Query(10, description="Limit number of receipts returned"),
-        offset: int = Query(0, description="Offset for pagination"),
-        db: AsyncSession = Depends(get_async_session),
-        user=Depends(get_current_user)
+        request: Request,
+        filters: ReceiptFilters = Depends(),
+        limit: int = Query(10, ge=1, le=1000, description="Limit number of receipts returned"),
+        offset: int = Query(0, ge=0, description="Offset for pagination"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor of the next page, taken from the Link header"),
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_user_read_session)
 ) -> List[ReceiptDisplay]:
     """
     Retrieves a list of receipts for the authenticated user with optional filtering by receipt ID,
     date range, minimum and maximum total, payment type, and pagination.
+    Receipts are ordered by creation time and ID. When more receipts follow, a `Link: <...>; rel="next"`
+    header carries the cursor of the next page, whose cost does not depend on how deep it is.
     """
-    query = select(Receipt).where(Receipt.user_id == user.id).options(
-        selectinload(Receipt.items).selectinload(ReceiptItem.product)
-    )
+    query = filters.apply(receipt_listing_query(db), user.id)
+    return await _receipt_page(request, db, query, limit, cursor, offset)
+
+
+async def _receipt_page(request: Request, db: AsyncSession, query, limit: int, cursor: Optional[str],
+                        offset: int = 0) -> ORJSONResponse:
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(tuple_(Receipt.created_at, Receipt.id) > tuple_(*position))
+
+    # Fetch one extra row to learn whether a next page exists
+    query = query.order_by(Receipt.created_at, Receipt.id).offset(offset).limit(limit + 1)
+    with phase("fetch"):
+        receipts = await fetch_receipt_listing(db, query)
+
+    headers = {}
+    if len(receipts) > limit:
+        receipts = receipts[:limit]
+        last = receipts[-1]
+        next_url = request.url.remove_query_params("offset").include_query_params(
+            cursor=encode_cursor(last.created_at, last.id))
+        headers["Link"] = f'<{next_url}>; rel="next"'
 
-    # Apply filtering by receipt ID if provided
-    if receipt_id:
-        query = query.filter(Receipt.id == receipt_id)
-
-    if start_date:
-        query = query.filter(Receipt.created_at >= start_date)
-    if end_date:
-        query = query.filter(Receipt.created_at <= end_date)
-    if min_total:
-        query = query.filter(Receipt.total >= Decimal(min_total))
-    if max_total:
-        query = query.filter(Receipt.total <= Decimal(max_total))
-    if payment_type:
-        query = query.filter(Receipt.payment_type == payment_type)
-
-    query = query.offset(offset).limit(limit)
-    results = await db.execute(query)
-    receipts = results.scalars().all()
-
-    response = []
-    for receipt in receipts:
-        products_display = [
-            ProductDisplay(
-                name=item.product.name,
-                price=f"{item.product.price:.2f}",
-                quantity=f"{item.quantity:.2f}",
-                total=f"{item.quantity * item.product.price:.2f}"
-            ) for item in receipt.items
-        ]
-        total_products_cost = sum(Decimal(product.total) for product in products_display)
-        rest = Decimal(receipt.payment_amount) - total_products_cost
-
-        response.append(ReceiptDisplay(
-            id=receipt.id,
-            products=products_display,
-            payment=PaymentInfo(type=receipt.payment_type, amount=f"{receipt.payment_amount:.2f}"),
-            total=f"{receipt.total:.2f}",
-            rest=f"{rest:.2f}",
-            created_at=receipt.created_at.isoformat()
-        ))
-
-    if not response:
+    # Rows are turned into plain dicts and encoded by orjson once, instead of building
+    # `ReceiptDisplay` models that FastAPI would validate and serialize again
+    with phase("serialize"):
+        receipts_display = receipt_listing_dicts(db, receipts)
+
+    if not receipts_display:
         raise HTTPException(status_code=404, detail="No receipts found matching the criteria")
 
-    return response
+    with phase("encode"):
+        return ORJSONResponse(receipts_display, headers=headers)
+
+
+@router.get("/receipts/search", response_model=List[ReceiptDisplay])
+async def search_receipts(
+        request: Request,
+        q: str = Query(..., min_length=2, max_length=100, description="Product name, or a part of it, to look for"),
+        filters: ReceiptFilters = Depends(),
+        limit: int = Query(10, ge=1, le=1000, description="Limit number of receipts returned"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor of the next page, taken from the Link header"),
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_user_read_session)
+) -> List[ReceiptDisplay]:
+    """
+    Retrieves the receipts of the authenticated user containing a product whose name matches `q`:
+    contains it, contains all of its words in any order, or contains a word close to it, so small typos
+    still match. Accepts the same filters as `GET /receipts/` and pages the same way, through the cursor
+    of the `Link: <...>; rel="next"` header.
+    """
+    with phase("search"):
+        condition = await receipt_search_condition(db, q)
+    if condition is None:
+        raise HTTPException(status_code=404, detail="No receipts found matching the criteria")
+
+    query = filters.apply(receipt_listing_query(db), user.id).where(condition)
+    return await _receipt_page(request, db, query, limit, cursor)
+
+
+@router.get("/receipts/export", response_class=StreamingResponse)
+async def export_receipts(
+        filters: ReceiptFilters = Depends(),
+        export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="Export format"),
+        user: CurrentUser = Depends(get_current_user),
+        session_maker: async_sessionmaker = Depends(get_user_read_session_maker)
+):
+    """
+        Streams every receipt of the authenticated user matching the filters, oldest first.
+        NDJSON emits one receipt per line in the same shape as `GET /receipts/`,
+        CSV emits one line per receipt item. Rows are read through a server-side cursor,
+        so memory stays flat regardless of the number of receipts exported.
+    """
+    query = export_query(filters, user.id)
+    if export_format == "csv":
+        return StreamingResponse(stream_csv(session_maker, query), media_type="text/csv",
+                                 headers={"Content-Disposition": 'attachment; filename="receipts.csv"'})
+    return StreamingResponse(stream_ndjson(session_maker, query), media_type="application/x-ndjson")
+
+
+@router.post("/receipts/print-batch", response_class=PlainTextResponse)
+async def print_receipts_batch(batch: PrintBatchRequest, user: CurrentUser = Depends(get_current_user),
+                               db: AsyncSession = Depends(get_user_read_session)):
+    """
+        Renders many receipts of the authenticated user in one call, in the requested order.
+        Receipts are separated by a form feed line so printers start each one on a new page.
+        Already rendered receipts come from the rendered-receipt cache, the rest are loaded with one query
+        and rendered from shared line templates.
+        IDs that do not exist or belong to another user are listed in the `X-Missing-Receipt-Ids` header.
+    """
+    requested = set(batch.receipt_ids)
+    owned = await db.execute(select(Receipt.id).where(Receipt.user_id == user.id, Receipt.id.in_(requested)))
+    owned_ids = set(owned.scalars())
+
+    rendered = {}
+    for receipt_id in owned_ids:
+        cached = await rendered_receipts.get(receipt_id)
+        if cached is not None:
+            rendered[receipt_id] = cached[0]
+
+    uncached = [receipt_id for receipt_id in owned_ids if receipt_id not in rendered]
+    if uncached:
+        result = await db.execute(select(Receipt).where(Receipt.id.in_(uncached)).options(
+            selectinload(Receipt.items).selectinload(ReceiptItem.product)))
+        for receipt in result.scalars():
+            body = format_receipt(receipt).encode()
+            rendered[receipt.id] = body
+            await rendered_receipts.set(receipt.id, body)
+
+    bodies = [rendered[receipt_id] for receipt_id in batch.receipt_ids if receipt_id in owned_ids]
+    if not bodies:
+        raise HTTPException(status_code=404, detail="No receipts found")
+
+    headers = {}
+    not_found = sorted(requested - owned_ids)
+    if not_found:
+        headers["X-Missing-Receipt-Ids"] = ",".join(map(str, not_found))
+    return PlainTextResponse(RECEIPT_SEPARATOR.join(bodies), headers=headers)
 
 
 @router.get("/receipts/{user_id}", response_class=PlainTextResponse)
-async def get_receipt(user_id: int, db: AsyncSession = Depends(get_async_session)):
+async def get_receipt(user_id: int, if_none_match: Optional[str] = Header(None),
+                      db: AsyncSession = Depends(get_read_session)):
     """
         Retrieves a specific receipt by user ID.
         Includes joined loading of product details associated with the receipt items.
         Returns the formatted receipt details if found, or an error message if not found.
         This function is meant to provide detailed access to an individual receipt's contents.
+        Rendered receipts are cached by receipt ID and carry an ETag; a matching `If-None-Match`
+        gets an empty 304 response.
     """
-    result = await db.execute(select(Receipt).where(Receipt.user_id == user_id).options(
-        joinedload(Receipt.items).joinedload(ReceiptItem.product)))
-    receipt = result.scalars().first()
-    if not receipt:
+    result = await db.execute(select(Receipt.id).where(Receipt.user_id == user_id).order_by(
+        Receipt.created_at, Receipt.id).limit(1))
+    receipt_id = result.scalar()
+    if receipt_id is None:
         raise HTTPException(status_code=404, detail="Receipt not found")
 
-    return format_receipt(receipt)
+    cached = await rendered_receipts.get(receipt_id)
+    if cached is None:
+        result = await db.execute(select(Receipt).where(Receipt.id == receipt_id).options(
+            joinedload(Receipt.items).joinedload(ReceiptItem.product)))
+        receipt = result.unique().scalar_one()
+        with phase("render"):
+            rendered = format_receipt(receipt).encode()
+        cached = await rendered_receipts.set(receipt_id, rendered)
+
+    body, etag = cached
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return PlainTextResponse(body, headers={"ETag": etag})
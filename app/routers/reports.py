@@ -0,0 +1,36 @@
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models import DailySales
+from app.schemas import CurrentUser, DailySalesDisplay
+from app.services import get_current_user, get_user_read_session
+
+router = APIRouter()
+
+
+@router.get("/reports/daily", response_model=List[DailySalesDisplay])
+async def get_daily_sales(
+        start_date: Optional[date] = Query(None, description="First day of the report"),
+        end_date: Optional[date] = Query(None, description="Last day of the report"),
+        payment_type: Optional[str] = Query(None, description="Restrict the report to one payment type"),
+        user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_user_read_session)
+):
+    """
+    Returns the authenticated user's receipt count, total and change given per day and payment type.
+    Served from the `daily_sales` rollup, so the cost depends on the number of days, not of receipts.
+    """
+    query = select(DailySales).where(DailySales.user_id == user.id)
+    if start_date:
+        query = query.filter(DailySales.day >= start_date)
+    if end_date:
+        query = query.filter(DailySales.day <= end_date)
+    if payment_type:
+        query = query.filter(DailySales.payment_type == payment_type)
+
+    result = await db.execute(query.order_by(DailySales.day, DailySales.payment_type))
+    return result.scalars().all()
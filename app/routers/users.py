@@ -7,7 +7,8 @@ from sqlalchemy.future import select
 from app import schemas
 from app.database import get_async_session
 from app.models import User
-from app.services import authenticate_user, create_access_token, pwd_context
+from app.hashing import password_hasher
+from app.services import authenticate_user, create_access_token, invalidate_cached_user
 
 router = APIRouter()
 
@@ -28,11 +29,12 @@ async def create_user(user: schemas.UserCreate, db: Session = Depends(get_async_
         user_exists = result.scalars().first()
         if user_exists:
             raise HTTPException(status_code=400, detail="Login already registered")
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = await password_hasher.hash(user.password)
         new_user = User(username=user.username, login=user.login, hashed_password=hashed_password)
         session.add(new_user)
         await session.commit()
         await session.refresh(new_user)
+        invalidate_cached_user(new_user.id)
         return new_user
 
 
@@ -58,5 +60,6 @@ async def login_for_access_token(db: Session = Depends(get_async_session),
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     access_token_expires = timedelta(minutes=30)
-    access_token = create_access_token(user_id=user.id, expires_delta=access_token_expires)
+    access_token = create_access_token(user_id=user.id, expires_delta=access_token_expires,
+                                       username=user.username, login=user.login)
     return {"access_token": access_token, "token_type": "bearer"}
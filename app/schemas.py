@@ -1,8 +1,8 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List
+from typing import Any, Dict, List, Literal, Optional
 
-from pydantic import BaseModel, condecimal
+from pydantic import BaseModel, Field, condecimal
 
 
 class UserBase(BaseModel):
@@ -22,6 +22,17 @@ class UserInDB(UserBase):
         from_attributes = True
 
 
+class CurrentUser(BaseModel):
+    """The authenticated principal, detached from the database session."""
+    id: int
+    username: Optional[str] = None
+    login: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
 class ProductDisplay(BaseModel):
     name: str
     price: condecimal(decimal_places=2)
@@ -54,6 +65,64 @@ class ReceiptCreate(BaseModel):
     payment: PaymentInfo
 
 
+class BulkReceiptResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class PrintBatchRequest(BaseModel):
+    receipt_ids: List[int] = Field(..., min_length=1, max_length=10000)
+
+
+class DailySalesDisplay(BaseModel):
+    day: date
+    payment_type: str
+    receipt_count: int
+    total: Decimal
+    change_given: Decimal
+
+    class Config:
+        from_attributes = True
+
+
+class JobCreate(BaseModel):
+    kind: str
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+
+class JobDisplay(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    cancel_requested: bool
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class ExportReceiptsParams(BaseModel):
+    """Parameters of the `export_receipts` job: the filters of `GET /receipts/export` and its format."""
+    format: Literal["ndjson", "csv"] = "ndjson"
+    receipt_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    min_total: Optional[Decimal] = None
+    max_total: Optional[Decimal] = None
+    payment_type: Optional[str] = None
+
+
+class ImportReceiptsParams(BaseModel):
+    receipts: List[ReceiptCreate] = Field(..., min_length=1, max_length=100000)
+
+
+class RebuildDailySalesParams(BaseModel):
+    pass
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,137 @@
+"""
+Product name search behind `GET /receipts/search`.
+
+On PostgreSQL product names carry a pg_trgm GIN index, serving substring and typo-tolerant word matches,
+and a `simple` full-text index, serving whole words in any order. The few matching products are found
+through them first and receipts are then reached through `ix_receipt_items_product_id`, so the cost grows
+with the number of matches rather than with the number of line items.
+
+Other databases (SQLite test runs) use `ProductSearchIndex`, an in-process trigram index applying
+the same matching rules, loaded incrementally from the products table.
+"""
+import re
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from sqlalchemy import exists, func, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models import Product, Receipt, ReceiptItem, product_name_tsvector
+
+# pg_trgm's default `pg_trgm.word_similarity_threshold`
+WORD_SIMILARITY_THRESHOLD = 0.6
+WORD = re.compile(r"\w+")
+
+
+def trigrams(value: str) -> Set[str]:
+    """
+    The trigrams of `value` as pg_trgm extracts them: lowercased words padded with two spaces
+    in front and one behind.
+    """
+    result = set()
+    for word in WORD.findall(value.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def escape_like(value: str) -> str:
+    return value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+class ProductSearchIndex:
+    """
+    Inverted trigram index over product names. A product matches when its name contains the query,
+    contains every word of the query, or contains a word close to the query: the share of the query's
+    trigrams found in the name reaches `threshold`, which approximates pg_trgm's `word_similarity`.
+
+    Products are only ever inserted and never renamed, so `refresh` just loads the rows with a higher ID.
+    """
+
+    def __init__(self, threshold: float = WORD_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._names: Dict[int, str] = {}
+        self._words: Dict[int, Set[str]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._last_id = 0
+
+    def add(self, product_id: int, name: str) -> None:
+        self._names[product_id] = name.lower()
+        self._words[product_id] = set(WORD.findall(name.lower()))
+        for trigram in trigrams(name):
+            self._postings[trigram].add(product_id)
+        self._last_id = max(self._last_id, product_id)
+
+    def clear(self) -> None:
+        self._names.clear()
+        self._words.clear()
+        self._postings.clear()
+        self._last_id = 0
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    async def refresh(self, db: AsyncSession) -> None:
+        newest = (await db.execute(select(func.max(Product.id)))).scalar()
+        if newest is None or newest < self._last_id:
+            # The table was emptied or recreated
+            self.clear()
+        result = await db.execute(select(Product.id, Product.name).where(Product.id > self._last_id))
+        for product_id, name in result:
+            if name is not None:
+                self.add(product_id, name)
+
+    def match(self, query: str) -> List[int]:
+        """
+        Returns the IDs of the products matching `query`, in ascending order.
+        """
+        needle = query.lower().strip()
+        words = set(WORD.findall(needle))
+        query_trigrams = trigrams(needle)
+        if not needle:
+            return []
+
+        shared: Dict[int, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for product_id in self._postings.get(trigram, ()):
+                shared[product_id] += 1
+
+        # Substrings shorter than a trigram share none with the name, look at every product then
+        candidates = self._names if len(needle) < 3 else shared
+        matches = []
+        for product_id in candidates:
+            if (needle in self._names[product_id]
+                    or (words and words <= self._words[product_id])
+                    or (query_trigrams and shared.get(product_id, 0) / len(query_trigrams) >= self.threshold)):
+                matches.append(product_id)
+        return sorted(matches)
+
+
+product_index = ProductSearchIndex()
+
+
+async def receipt_search_condition(db: AsyncSession, query: str):
+    """
+    Returns a condition on `receipts` selecting the receipts with an item whose product matches `query`,
+    or None when no product matches.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        matching_products = select(Product.id).where(or_(
+            Product.name.ilike(f"%{escape_like(query)}%", escape="!"),
+            Product.name.op('%>')(query),
+            product_name_tsvector().op('@@')(func.plainto_tsquery(text("'simple'::regconfig"), query)),
+        ))
+        product_condition = ReceiptItem.product_id.in_(matching_products.scalar_subquery())
+    else:
+        await product_index.refresh(db)
+        product_ids = product_index.match(query)
+        if not product_ids:
+            return None
+        product_condition = ReceiptItem.product_id.in_(product_ids)
+
+    return exists().where(
+        ReceiptItem.receipt_id == Receipt.id,
+        ReceiptItem.receipt_created_at == Receipt.created_at,
+        product_condition,
+    )
@@ -0,0 +1,42 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, Optional, Tuple
+
+from app.money import Amount, format_amount, line_amount
+
+
+def receipt_dict(receipt_id: int, created_at: datetime, payment_type: str, payment_amount: Decimal,
+                 total: Decimal, change_given: Optional[Decimal],
+                 items: Iterable[Tuple[str, Amount, Amount, Optional[Amount]]]) -> dict:
+    """
+    Builds the JSON-ready shape of `ReceiptDisplay` straight from row values, skipping model validation.
+    Money is rendered with two decimals from the stored line totals, which are only recomputed, as
+    `app.money` rounds them, for items stored without one. The rest is the stored change, or for receipts
+    stored without it the payment minus the line totals.
+
+    Args:
+    items (Iterable[Tuple[str, Amount, Amount, Optional[Amount]]]): The (name, unit price, quantity, line total)
+        of every receipt item.
+    """
+    products = []
+    item_totals = []
+    for name, price, quantity, item_total in items:
+        if item_total is None:
+            item_total = line_amount(Decimal(price), Decimal(quantity))
+        item_totals.append(item_total)
+        products.append({
+            "name": name,
+            "price": format_amount(price),
+            "quantity": format_amount(quantity),
+            "total": format_amount(item_total),
+        })
+    if change_given is None:
+        change_given = Decimal(payment_amount) - sum(map(Decimal, item_totals))
+    return {
+        "id": receipt_id,
+        "products": products,
+        "payment": {"type": payment_type, "amount": format_amount(payment_amount)},
+        "total": format_amount(total),
+        "rest": format_amount(change_given),
+        "created_at": created_at,
+    }
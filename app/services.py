@@ -1,111 +1,302 @@
+import base64
+import binascii
+import time
 from datetime import datetime, timedelta
+from typing import AsyncGenerator, Dict, Iterable, List, Optional, Sequence, Tuple
+
 import jwt
-from jose import JWTError
-from sqlalchemy.ext.asyncio import AsyncSession
-from passlib.context import CryptContext
-from app.database import get_async_session
-from app.models import Product, User
-from app.schemas import ProductInfo
+import orjson
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.cache import TTLCache
+from app.database import get_async_session, read_router, upsert_insert
+from app.hashing import password_hasher
+from app.metrics import password_verify_duration, register_cache_metrics
+from app.money import ZERO, format_amount, from_minor, line_amount, receipt_totals
+from app.models import Product, Receipt, ReceiptItem, User, item_price
+from app.rollups import accumulate_daily_sales
+from app.schemas import CurrentUser, ProductInfo, ReceiptCreate
+from app.tokens import signing_keys, token_cache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.future import select
 
-from config import SECRET_KEY
+from config import USER_CACHE_TTL, USER_CACHE_MAX_SIZE, AUTH_TRUST_TOKEN
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# A USER_CACHE_MAX_SIZE of 0 disables the cache
+user_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL) if USER_CACHE_MAX_SIZE > 0 else None
+register_cache_metrics("user", lambda: user_cache.stats() if user_cache is not None else {})
 
 
-def create_access_token(user_id: int, expires_delta: timedelta = None):
+def create_access_token(user_id: int, expires_delta: timedelta = None, username: str = None, login: str = None):
     to_encode = {"sub": str(user_id)}
+    # Identity claims let AUTH_TRUST_TOKEN mode build the principal without a users lookup
+    if username is not None:
+        to_encode["username"] = username
+    if login is not None:
+        to_encode["login"] = login
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
-    return encoded_jwt
-
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return signing_keys.encode(to_encode)
 
 
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> User:
     result = await db.execute(select(User).where(User.username == username))
     user = result.scalars().first()
-    if user and verify_password(password, user.hashed_password):
-        return user
-    return None
+    if not user:
+        return None
+    started = time.perf_counter()
+    verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    password_verify_duration.observe(time.perf_counter() - started)
+    if not verified:
+        return None
+    if new_hash:
+        # The hashing parameters changed since the password was stored, upgrade it transparently
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_cached_user(user.id)
+    return user
 
 
-async def get_current_user(db: AsyncSession = Depends(get_async_session), token: str = Depends(oauth2_scheme)) -> User:
+def invalidate_cached_user(user_id: int) -> None:
+    """
+    Drops the cached principal of a user. Must be called whenever a user is created or updated.
+    """
+    if user_cache is not None:
+        user_cache.pop(user_id)
+
+
+async def get_current_user(db: AsyncSession = Depends(get_async_session),
+                           token: str = Depends(oauth2_scheme)) -> CurrentUser:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        payload = token_cache.decode(token)
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
         user_id = int(user_id)
-    except JWTError:
+    except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     except ValueError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid user ID format")
 
+    if AUTH_TRUST_TOKEN:
+        return CurrentUser(id=user_id, username=payload.get("username"), login=payload.get("login"))
+
+    if user_cache is not None:
+        current_user = user_cache.get(user_id)
+        if current_user is not None:
+            return current_user
+
     result = await db.execute(select(User).filter(User.id == user_id))
     user = result.scalars().first()
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    return user
+    current_user = CurrentUser.model_validate(user)
+    if user_cache is not None:
+        user_cache.set(user_id, current_user)
+    return current_user
+
+
+async def get_user_read_session_maker(user: CurrentUser = Depends(get_current_user)) -> async_sessionmaker:
+    """
+    Session maker for the read-only endpoints of the authenticated user, on the primary right after the user's
+    writes and on a replica otherwise. Streaming responses open their sessions from it.
+    """
+    return read_router.session_maker_for(user.id)
 
 
-async def create_new_product(db: AsyncSession, product_info: ProductInfo) -> int:
+async def get_user_read_session(
+        session_maker: async_sessionmaker = Depends(get_user_read_session_maker)
+) -> AsyncGenerator[AsyncSession, None]:
     """
-    Creates a new product in the database if it doesn't exist.
+    Session for the read-only endpoints of the authenticated user, from `get_user_read_session_maker`.
+    """
+    async with session_maker() as session:
+        yield session
+
+
+INSUFFICIENT_PAYMENT = "Payment amount is less than the total price of products."
+
+
+def calculate_receipt_totals(receipt_data: ReceiptCreate) -> Tuple[int, int]:
+    """
+    Calculates the total cost of the products and the change to be given back, following the
+    rounding rules of `app.money`.
+
+    Returns:
+    Tuple[int, int]: The total and the rest in kopecks, the rest being negative when the payment is insufficient.
+    """
+    return receipt_totals(receipt_data.products, receipt_data.payment.amount)
+
+
+async def resolve_product_ids(db: AsyncSession, products: Iterable[ProductInfo]) -> Dict[str, int]:
+    """
+    Maps product names to their IDs, creating the missing products on the way. Existing products keep
+    their price: what a receipt charged is stored on its items as `unit_price`.
+    Uses one INSERT ... ON CONFLICT (name) DO NOTHING RETURNING for all names, followed by
+    one lookup for the names that already existed. Nothing is committed.
 
     Args:
     db (AsyncSession): The database session.
-    product_info (ProductInfo): The product data.
+    products (Iterable[ProductInfo]): The products, possibly repeating the same name.
 
     Returns:
-    int: The ID of the created or existing product.
+    Dict[str, int]: The product ID for every distinct product name.
     """
-    # First check if the product already exists to avoid duplicates
-    existing_product = await db.execute(select(Product).filter(Product.name == product_info.name))
-    product = existing_product.scalars().first()
+    prices = {}
+    for product in products:
+        prices.setdefault(product.name, product.price)
+    if not prices:
+        return {}
 
-    if product:
-        return product.id  # Return existing product ID if product is found
-
-    # If not found, create a new product
-    new_product = Product(
-        name=product_info.name,
-        price=product_info.price
+    # Sorted names keep the row lock order stable between concurrent transactions
+    names = sorted(prices)
+    statement = upsert_insert(db, Product).values([{"name": name, "price": prices[name]} for name in names])
+    result = await db.execute(
+        statement.on_conflict_do_nothing(index_elements=[Product.name]).returning(Product.name, Product.id)
     )
-    db.add(new_product)
-    await db.commit()
-    await db.refresh(new_product)
+    product_ids = {name: product_id for name, product_id in result.all()}
+
+    existing = [name for name in names if name not in product_ids]
+    if existing:
+        result = await db.execute(select(Product.name, Product.id).where(Product.name.in_(existing)))
+        product_ids.update((name, product_id) for name, product_id in result.all())
+
+    return product_ids
+
+
+def receipt_row(user_id: int, receipt_data: ReceiptCreate, total: int, rest: int,
+                created_at: datetime, receipt_id: Optional[int] = None) -> dict:
+    """
+    Builds the `receipts` row of a validated receipt from its total and rest in kopecks.
+    `receipt_id` is only set for preallocated IDs.
+    """
+    row = {
+        "user_id": user_id,
+        "created_at": created_at,
+        "payment_type": receipt_data.payment.type,
+        "payment_amount": receipt_data.payment.amount,
+        "total": from_minor(total),
+        "change_given": from_minor(rest),
+    }
+    if receipt_id is not None:
+        row["id"] = receipt_id
+    return row
+
+
+async def insert_receipt_rows(db: AsyncSession, receipts: Sequence[ReceiptCreate],
+                              receipt_rows: Sequence[dict]) -> List[int]:
+    """
+    Inserts receipts together with their items using multi-row INSERT ... RETURNING statements
+    and adds them to the daily sales rollup. The caller owns the transaction and is expected to commit it.
+
+    Args:
+    db (AsyncSession): The database session.
+    receipts (Sequence[ReceiptCreate]): The validated receipts, possibly of several users.
+    receipt_rows (Sequence[dict]): The `receipt_row` of every receipt, in the same order.
+
+    Returns:
+    List[int]: The IDs of the inserted receipts, in the same order as `receipts`.
+    """
+    product_ids = await resolve_product_ids(db, (product for receipt in receipts for product in receipt.products))
+
+    result = await db.execute(insert(Receipt).returning(Receipt.id, sort_by_parameter_order=True), receipt_rows)
+    receipt_ids = list(result.scalars().all())
+
+    item_rows = [
+        {
+            "receipt_id": receipt_id,
+            "receipt_created_at": row["created_at"],
+            "product_id": product_ids[product.name],
+            "quantity": product.quantity,
+            "unit_price": product.price,
+            "total_price": line_amount(product.price, product.quantity),
+        } for receipt_id, row, receipt in zip(receipt_ids, receipt_rows, receipts) for product in receipt.products
+    ]
+    if item_rows:
+        await db.execute(insert(ReceiptItem), item_rows)
+
+    await accumulate_daily_sales(db, receipt_rows)
+
+    return receipt_ids
+
+
+async def insert_receipts(db: AsyncSession, user_id: int, receipts: Sequence[ReceiptCreate],
+                          totals: Sequence[Tuple[int, int]], created_at: datetime) -> List[int]:
+    """
+    Inserts receipts of one user, see `insert_receipt_rows`.
+
+    Args:
+    db (AsyncSession): The database session.
+    user_id (int): The owner of the receipts.
+    receipts (Sequence[ReceiptCreate]): The validated receipts.
+    totals (Sequence[Tuple[int, int]]): The total and rest in kopecks of every receipt, in the same order.
+    created_at (datetime): The creation time stamped on every receipt.
+
+    Returns:
+    List[int]: The IDs of the inserted receipts, in the same order as `receipts`.
+    """
+    receipt_rows = [
+        receipt_row(user_id, receipt, total, rest, created_at) for receipt, (total, rest) in zip(receipts, totals)
+    ]
+    return await insert_receipt_rows(db, receipts, receipt_rows)
+
+
+def encode_cursor(created_at: datetime, receipt_id: int) -> str:
+    """
+    Encodes the (created_at, id) position of a receipt into an opaque pagination cursor.
+    """
+    raw = orjson.dumps([created_at.isoformat(), receipt_id])
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """
+    Decodes a cursor produced by `encode_cursor`. Returns None when the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, receipt_id = orjson.loads(raw)
+        return datetime.fromisoformat(created_at), int(receipt_id)
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError):
+        return None
+
 
-    return new_product.id
+RECEIPT_HEADER = "ФОП Джонсонок Борис\n=======================\n"
+RECEIPT_ITEM_LINE = "{} {} x {} {}\n".format
+RECEIPT_FOOTER = (
+    "-----------------------\n"
+    "СУМА {}\n"
+    "Картка {}\n"
+    "Решта {}\n"
+    "=======================\n"
+    "{:%d.%m.%Y %H:%M}\n"
+    "Дякуємо за покупку!"
+).format
 
 
 def format_receipt(receipt):
-    lines = []
-    lines.append("ФОП Джонсонок Борис")
-    lines.append("=======================")
+    parts = [RECEIPT_HEADER]
 
-    total = 0
+    total = ZERO
     for item in receipt.items:
-        item_total = item.product.price * item.quantity
+        price = item_price(item)
+        item_total = item.total_price
+        if item_total is None:
+            item_total = line_amount(price, item.quantity)
         total += item_total
-        lines.append(f"{item.product.name} {item.quantity} x {item.product.price:.2f} {item_total:.2f}")
+        parts.append(RECEIPT_ITEM_LINE(item.product.name, item.quantity, format_amount(price),
+                                       format_amount(item_total)))
 
-    lines.append("-----------------------")
-    lines.append(f"СУМА {total:.2f}")
-    lines.append(f"Картка {receipt.payment_amount:.2f}")
-    lines.append(f"Решта {max(0.0, receipt.payment_amount - total):.2f}")
-    lines.append("=======================")
-    lines.append(datetime.now().strftime("%d.%m.%Y %H:%M"))
-    lines.append("Дякуємо за покупку!")
+    payment = receipt.payment_amount
+    # Receipts stored without their change get it recomputed from the items
+    rest = receipt.change_given if receipt.change_given is not None else max(ZERO, payment - total)
+    # The receipt's own timestamp keeps the rendering stable, so it can be cached
+    parts.append(RECEIPT_FOOTER(format_amount(total), format_amount(payment), format_amount(rest), receipt.created_at))
 
-    return "\n".join(lines)
+    return "".join(parts)
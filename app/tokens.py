@@ -0,0 +1,102 @@
+"""
+Access token signing and verification.
+
+Tokens are HS256 JWTs signed with the current key of a `SigningKeySet` and verified with the key named
+by their `kid` header, so keys can be rotated without logging everybody out: add the new key, make it
+current, and drop the old one once the tokens it signed have expired. Tokens without a `kid`, issued
+before rotation was configured, are verified with `SECRET_KEY`.
+
+Verified claims are kept in a bounded cache until the token expires, so the handful of tokens a client
+keeps sending are checked once rather than on every request.
+"""
+import time
+from typing import Dict, Optional
+
+import jwt
+
+from app.cache import TTLCache
+from config import SECRET_KEY, JWT_SIGNING_KEYS, JWT_CURRENT_KID, JWT_LEEWAY, TOKEN_CACHE_SIZE
+
+ALGORITHM = "HS256"
+
+
+class SigningKeySet:
+    """
+    Secrets by key ID. `None` is the key of tokens that carry no `kid` header.
+    """
+
+    def __init__(self, keys: Dict[Optional[str], str], current_kid: Optional[str] = None):
+        if keys and current_kid not in keys:
+            raise ValueError(f"Unknown current signing key {current_kid!r}")
+        self.keys = keys
+        self.current_kid = current_kid
+
+    @classmethod
+    def parse(cls, signing_keys: str, current_kid: Optional[str] = None,
+              legacy_key: Optional[str] = None) -> "SigningKeySet":
+        """
+        Builds a key set from `kid:secret` pairs separated by commas. Without `current_kid` the last pair
+        signs new tokens, and without any pair `legacy_key` does.
+        """
+        keys: Dict[Optional[str], str] = {}
+        if legacy_key:
+            keys[None] = legacy_key
+        kid = None
+        for pair in filter(None, (pair.strip() for pair in signing_keys.split(","))):
+            kid, separator, secret = pair.partition(":")
+            if not separator or not kid or not secret:
+                raise ValueError("Signing keys must be given as kid:secret pairs")
+            keys[kid] = secret
+        return cls(keys, current_kid or kid)
+
+    def encode(self, claims: dict) -> str:
+        secret = self.keys.get(self.current_kid)
+        if secret is None:
+            raise RuntimeError("No signing key configured, set SECRET_KEY or JWT_SIGNING_KEYS")
+        headers = {"kid": self.current_kid} if self.current_kid is not None else None
+        return jwt.encode(claims, secret, algorithm=ALGORITHM, headers=headers)
+
+    def decode(self, token: str, leeway: float = 0) -> dict:
+        """
+        Verifies the token's signature and expiry. Raises `jwt.PyJWTError` when the token is invalid.
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        secret = self.keys.get(kid) if kid is None or isinstance(kid, str) else None
+        if secret is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key {kid!r}")
+        return jwt.decode(token, secret, algorithms=[ALGORITHM], leeway=leeway)
+
+
+class TokenCache:
+    """
+    Claims of verified tokens, each kept until its `exp` (plus the allowed clock skew) has passed.
+    Tokens without `exp` never expire and are not cached. A `maxsize` of 0 disables the cache.
+    """
+
+    def __init__(self, key_set: SigningKeySet, maxsize: int = 10000, leeway: float = 0):
+        self.key_set = key_set
+        self.leeway = leeway
+        self._claims = TTLCache(maxsize=maxsize) if maxsize > 0 else None
+
+    def decode(self, token: str) -> dict:
+        if self._claims is None:
+            return self.key_set.decode(token, self.leeway)
+        claims = self._claims.get(token)
+        if claims is not None:
+            return claims
+        claims = self.key_set.decode(token, self.leeway)
+        expires_at = claims.get("exp")
+        if isinstance(expires_at, (int, float)):
+            self._claims.set(token, claims, ttl=expires_at + self.leeway - time.time())
+        return claims
+
+    def clear(self) -> None:
+        if self._claims is not None:
+            self._claims.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return self._claims.stats() if self._claims is not None else {}
+
+
+signing_keys = SigningKeySet.parse(JWT_SIGNING_KEYS, JWT_CURRENT_KID, legacy_key=SECRET_KEY)
+token_cache = TokenCache(signing_keys, maxsize=TOKEN_CACHE_SIZE, leeway=JWT_LEEWAY)
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.future import select
+
+from app.database import async_session_maker
+from app.models import Receipt
+from app.schemas import ReceiptCreate
+from app.services import insert_receipt_rows, receipt_row
+from config import WRITE_BEHIND_ENABLED, WRITE_BEHIND_ACK, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_MS, \
+    WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_ENQUEUE_TIMEOUT, WRITE_BEHIND_ID_BLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueueFull(Exception):
+    """Raised when a receipt could not be queued within the enqueue timeout."""
+
+
+class ReceiptIdAllocator:
+    """
+    Hands out receipt IDs from blocks reserved on the `receipts.id` sequence, one round trip per block.
+
+    Databases without sequences (SQLite) continue from the highest existing ID, which is only safe while
+    this allocator is the single writer of receipts.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, block_size: int = 1000):
+        self.session_maker = session_maker
+        self.block_size = block_size
+        self._ids: Deque[int] = deque()
+        self._next_local: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        if not self._ids:
+            async with self._lock:
+                if not self._ids:
+                    await self._reserve_block()
+        return self._ids.popleft()
+
+    async def _reserve_block(self) -> None:
+        async with self.session_maker() as db:
+            if db.get_bind().dialect.name == 'postgresql':
+                result = await db.execute(
+                    text("SELECT nextval(pg_get_serial_sequence('receipts', 'id')) FROM generate_series(1, :size)"),
+                    {"size": self.block_size},
+                )
+                self._ids.extend(result.scalars())
+                return
+            if self._next_local is None:
+                self._next_local = ((await db.execute(select(func.max(Receipt.id)))).scalar() or 0) + 1
+        self._ids.extend(range(self._next_local, self._next_local + self.block_size))
+        self._next_local += self.block_size
+
+
+@dataclass
+class PendingReceipt:
+    row: dict
+    receipt_data: ReceiptCreate
+    done: Optional[asyncio.Future] = None
+
+
+class ReceiptWriteBehind:
+    """
+    Queues validated receipts and writes them from a background task in grouped transactions,
+    flushing every `flush_interval_ms` milliseconds or every `batch_size` receipts, whichever comes first.
+
+    With `ack='flush'` a submission returns once its transaction committed. With `ack='enqueue'` it
+    returns as soon as the receipt is queued: faster, but queued receipts are lost if the process dies
+    and a failed flush is only logged. A full queue makes submissions wait up to `enqueue_timeout`
+    seconds before raising `WriteBehindQueueFull`.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker, ack: str = 'flush', batch_size: int = 500,
+                 flush_interval_ms: float = 20, queue_size: int = 10000, enqueue_timeout: float = 1.0,
+                 id_block_size: int = 1000):
+        if ack not in ('flush', 'enqueue'):
+            raise ValueError(f"Unknown write-behind acknowledgement mode: {ack}")
+        self.session_maker = session_maker
+        self.ack = ack
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout
+        self.ids = ReceiptIdAllocator(session_maker, id_block_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushes = 0
+        self.flushed_receipts = 0
+        self.failed_receipts = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Flushes everything queued so far and stops the background task.
+        """
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, user_id: int, receipt_data: ReceiptCreate, total: int, rest: int,
+                     created_at: datetime) -> int:
+        """
+        Queues a validated receipt and returns its preallocated ID, after the flush when `ack='flush'`.
+        """
+        receipt_id = await self.ids.next_id()
+        pending = PendingReceipt(receipt_row(user_id, receipt_data, total, rest, created_at, receipt_id), receipt_data)
+        if self.ack == 'flush':
+            pending.done = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._queue.put(pending), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise WriteBehindQueueFull("Receipt queue is full")
+        if pending.done is not None:
+            await pending.done
+        return receipt_id
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    pending = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        pending = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[PendingReceipt]) -> None:
+        try:
+            async with self.session_maker() as db:
+                await insert_receipt_rows(db, [pending.receipt_data for pending in batch],
+                                          [pending.row for pending in batch])
+                await db.commit()
+        except Exception as exc:
+            if len(batch) > 1:
+                # Isolate the offending receipts instead of failing the whole group
+                for pending in batch:
+                    await self._flush([pending])
+                return
+            self.failed_receipts += len(batch)
+            logger.exception("Failed to flush %d queued receipts", len(batch))
+            for pending in batch:
+                if pending.done is not None and not pending.done.done():
+                    pending.done.set_exception(exc)
+            return
+
+        self.flushes += 1
+        self.flushed_receipts += len(batch)
+        for pending in batch:
+            if pending.done is not None and not pending.done.done():
+                pending.done.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "flushes": self.flushes,
+            "flushed_receipts": self.flushed_receipts,
+            "failed_receipts": self.failed_receipts,
+        }
+
+
+def create_receipt_writer(session_maker: async_sessionmaker) -> ReceiptWriteBehind:
+    return ReceiptWriteBehind(session_maker, ack=WRITE_BEHIND_ACK, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                              flush_interval_ms=WRITE_BEHIND_FLUSH_MS, queue_size=WRITE_BEHIND_QUEUE_SIZE,
+                              enqueue_timeout=WRITE_BEHIND_ENQUEUE_TIMEOUT, id_block_size=WRITE_BEHIND_ID_BLOCK)
+
+
+receipt_writer = create_receipt_writer(async_session_maker) if WRITE_BEHIND_ENABLED else None
@@ -0,0 +1,2 @@
+# Local database used by the benchmarks when no --database-url is given
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///bench.db"
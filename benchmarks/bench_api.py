@@ -0,0 +1,273 @@
+"""
+Load-tests the API hot paths and reports requests per second and p50/p95/p99 latency per scenario:
+
+- create_receipt: `POST /receipts/`
+- get_receipts: `GET /receipts/?limit=20`
+- get_receipt: `GET /receipts/{user_id}` (text receipt)
+- token: `POST /token` (bcrypt verification)
+
+The API is driven either in-process through httpx `ASGITransport` (`--target asgi`) or over HTTP against
+uvicorn started as a subprocess (`--target uvicorn`). The database defaults to a local SQLite file; seed it
+first with `python -m benchmarks.seed` or pass `--seed`. Results are saved as JSON in `benchmarks/results/`
+so runs can be compared across commits with `--compare`.
+
+Run with `python -m benchmarks.bench_api [--target uvicorn] [--database-url ...] [--compare results/old.json]`.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import jwt
+import orjson
+from sqlalchemy.engine import make_url
+
+from benchmarks import DEFAULT_DATABASE_URL
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SCENARIOS = ["create_receipt", "get_receipts", "get_receipt", "token"]
+UVICORN_PORT = 8765
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    errors: int
+    seconds: float
+    rps: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+@dataclass
+class BenchContext:
+    logins: List[str]
+    password: str
+    payloads: List[dict]
+    tokens: List[str] = field(default_factory=list)
+    user_ids: List[int] = field(default_factory=list)
+
+
+def summarize(name: str, latencies: List[float], errors: int, seconds: float) -> ScenarioResult:
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return ScenarioResult(
+        name=name,
+        requests=len(latencies),
+        errors=errors,
+        seconds=round(seconds, 3),
+        rps=round(len(latencies) / seconds, 1),
+        mean_ms=round(statistics.fmean(latencies) * 1000, 3),
+        p50_ms=round(cuts[49] * 1000, 3),
+        p95_ms=round(cuts[94] * 1000, 3),
+        p99_ms=round(cuts[98] * 1000, 3),
+    )
+
+
+async def run_scenario(name: str, send: Callable[[int], Awaitable[httpx.Response]], requests: int,
+                       concurrency: int, warmup: int) -> ScenarioResult:
+    for n in range(warmup):
+        await send(n)
+
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for n in counter:
+            started = time.perf_counter()
+            response = await send(n)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, errors, time.perf_counter() - started)
+
+
+async def prepare(client: httpx.AsyncClient, context: BenchContext) -> None:
+    for login in context.logins:
+        response = await client.post("/token", data={"username": login, "password": context.password})
+        if response.status_code != 200:
+            raise SystemExit(f"Cannot log in as {login}; seed the database with `python -m benchmarks.seed`")
+        token = response.json()["access_token"]
+        context.tokens.append(token)
+        context.user_ids.append(int(jwt.decode(token, options={"verify_signature": False})["sub"]))
+
+
+def auth(token: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def scenario_senders(client: httpx.AsyncClient, context: BenchContext) -> Dict[str, Callable]:
+    tokens, user_ids, payloads, logins = context.tokens, context.user_ids, context.payloads, context.logins
+    return {
+        "create_receipt": lambda n: client.post("/receipts/", json=payloads[n % len(payloads)],
+                                                headers=auth(tokens[n % len(tokens)])),
+        "get_receipts": lambda n: client.get("/receipts/", params={"limit": 20},
+                                             headers=auth(tokens[n % len(tokens)])),
+        "get_receipt": lambda n: client.get(f"/receipts/{user_ids[n % len(user_ids)]}"),
+        "token": lambda n: client.post("/token", data={"username": logins[n % len(logins)],
+                                                       "password": context.password}),
+    }
+
+
+async def run_scenarios(client: httpx.AsyncClient, args: argparse.Namespace,
+                        context: BenchContext) -> List[ScenarioResult]:
+    await prepare(client, context)
+    senders = scenario_senders(client, context)
+
+    results = []
+    for name in args.scenarios:
+        # bcrypt makes logins orders of magnitude slower, so they get a tenth of the requests
+        requests = max(1, args.requests // 10) if name == "token" else args.requests
+        result = await run_scenario(name, senders[name], requests, args.concurrency, args.warmup)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+async def run_asgi(args: argparse.Namespace, context: BenchContext) -> List[ScenarioResult]:
+    from app.database import engine
+    from main import app
+
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                return await run_scenarios(client, args, context)
+    finally:
+        await engine.dispose()
+
+
+async def run_uvicorn(args: argparse.Namespace, context: BenchContext) -> List[ScenarioResult]:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(UVICORN_PORT),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{UVICORN_PORT}"
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            await wait_until_ready(client, server)
+            return await run_scenarios(client, args, context)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("uvicorn exited before accepting connections")
+        try:
+            await client.get("/openapi.json")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise SystemExit("uvicorn did not start in time")
+
+
+def print_result(result: ScenarioResult) -> None:
+    print(f"{result.name:>15} {result.requests:>8} {result.errors:>6} {result.rps:>9.1f} "
+          f"{result.p50_ms:>9.2f} {result.p95_ms:>9.2f} {result.p99_ms:>9.2f}")
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=Path(__file__).parent, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(args: argparse.Namespace, results: List[ScenarioResult]) -> Path:
+    commit = current_commit()
+    started = datetime.utcnow()
+    report = {
+        "commit": commit,
+        "created_at": started.isoformat(),
+        "target": args.target,
+        "database_url": make_url(args.database_url).render_as_string(hide_password=True),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "workers": args.workers if args.target == "uvicorn" else 1,
+        "scenarios": [asdict(result) for result in results],
+    }
+    RESULTS_DIR.mkdir(exist_ok=True)
+    path = RESULTS_DIR / f"{started:%Y%m%dT%H%M%S}-{commit}-{args.target}.json"
+    path.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    return path
+
+
+def compare(path: Path, results: List[ScenarioResult]) -> None:
+    previous = {scenario["name"]: scenario for scenario in orjson.loads(path.read_bytes())["scenarios"]}
+    print(f"\nCompared with {path.name}")
+    print(f"{'scenario':>15} {'rps':>14} {'p95 ms':>14} {'p99 ms':>14}")
+    for result in results:
+        old = previous.get(result.name)
+        if old is None:
+            continue
+        print(f"{result.name:>15} {change(old['rps'], result.rps):>14} {change(old['p95_ms'], result.p95_ms):>14} "
+              f"{change(old['p99_ms'], result.p99_ms):>14}")
+
+
+def change(old: float, new: float) -> str:
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URL))
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--users", type=int, default=10, help="Seeded users taking part in the load")
+    parser.add_argument("--seed", action="store_true",
+                        help="Empty the database and seed it before running (users x 200 receipts x 5 items)")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare with")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    # The application reads its settings on import, so it is imported once the environment is set
+    from benchmarks import seed
+
+    if args.seed:
+        asyncio.run(seed.clear(args.database_url))
+        asyncio.run(seed.seed(args.database_url, args.users, 200, 5))
+
+    print(f"{'scenario':>15} {'requests':>8} {'errors':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rng = random.Random(0)
+    context = BenchContext(
+        logins=[f"{seed.LOGIN_PREFIX}{n}" for n in range(args.users)],
+        password=seed.PASSWORD,
+        payloads=[seed.make_receipt(rng, 5).model_dump(mode="json") for _ in range(100)],
+    )
+    runner = run_uvicorn if args.target == "uvicorn" else run_asgi
+    results = asyncio.run(runner(args, context))
+    print(f"\nSaved {save_results(args, results)}")
+    if args.compare is not None:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
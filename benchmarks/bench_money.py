@@ -0,0 +1,61 @@
+"""
+Measures the receipt money paths on validated input:
+
+- totals: `calculate_receipt_totals` over every receipt, as the single, bulk, import and write-behind
+  paths run it before storing receipts;
+- items: the `receipt_items` money columns (`unit_price`, `total_price`) of every receipt.
+
+Run with `python -m benchmarks.bench_money`, and on an older commit to compare.
+"""
+import argparse
+import os
+import timeit
+from decimal import Decimal
+
+
+def make_receipts(count: int, items: int) -> list:
+    from app.schemas import ReceiptCreate
+
+    return [
+        ReceiptCreate(
+            products=[{"name": f"Product {n}", "price": f"{(receipt * items + n) % 5000 / 100 + 0.01:.2f}",
+                       "quantity": f"{n % 3 + 1}.{n % 4 * 25:02d}"} for n in range(items)],
+            payment={"type": "cash", "amount": "100000.00"},
+        ) for receipt in range(count)
+    ]
+
+
+def item_amounts(receipts: list) -> list:
+    try:
+        from app import money
+    except ImportError:
+        # Commits before app.money multiplied unrounded Decimals
+        return [(Decimal(product.price), Decimal(product.price) * Decimal(product.quantity))
+                for receipt in receipts for product in receipt.products]
+
+    return [(product.price, money.line_amount(product.price, product.quantity))
+            for receipt in receipts for product in receipt.products]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receipts", type=int, default=8000)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    # The application reads its configuration at import time
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    from app.services import calculate_receipt_totals
+
+    receipts = make_receipts(args.receipts, args.items)
+    totals = min(timeit.repeat(lambda: [calculate_receipt_totals(receipt) for receipt in receipts],
+                               number=1, repeat=args.repeat))
+    items = min(timeit.repeat(lambda: item_amounts(receipts), number=1, repeat=args.repeat))
+    print(f"{args.receipts} receipts x {args.items} items")
+    print(f"totals {totals * 1000:>8.2f} ms")
+    print(f"items  {items * 1000:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
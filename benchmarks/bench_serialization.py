@@ -0,0 +1,102 @@
+"""
+Compares the receipt listing serialization paths at 10/100/1000 receipts per page:
+
+- models: `ProductDisplay`/`PaymentInfo`/`ReceiptDisplay` built from f-strings, then validated and
+  dumped against `List[ReceiptDisplay]` the way FastAPI handles `response_model`;
+- fast: `app.serializers.receipt_dict` over the stored line totals, encoded once with orjson.
+
+Run with `python -m benchmarks.bench_serialization`.
+"""
+import argparse
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from types import SimpleNamespace
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+from app.schemas import PaymentInfo, ProductDisplay, ReceiptDisplay
+from app.serializers import receipt_dict
+
+ITEMS_PER_RECEIPT = 5
+CENT = Decimal('0.01')
+
+
+def make_receipts(count: int) -> list:
+    started = datetime(2024, 1, 1)
+    receipts = []
+    for receipt_id in range(1, count + 1):
+        items = [
+            SimpleNamespace(product=SimpleNamespace(name=f"Product {n}"), unit_price=Decimal(f"{n}.{n:02d}"),
+                            quantity=Decimal(f"{n % 3 + 1}.50"))
+            for n in range(1, ITEMS_PER_RECEIPT + 1)
+        ]
+        for item in items:
+            item.total_price = (item.unit_price * item.quantity).quantize(CENT, ROUND_HALF_UP)
+        receipts.append(SimpleNamespace(
+            id=receipt_id, created_at=started + timedelta(minutes=receipt_id), payment_type='cash',
+            payment_amount=Decimal('500.00'), total=Decimal('123.45'), items=items,
+            change_given=Decimal('500.00') - sum(item.total_price for item in items),
+        ))
+    return receipts
+
+
+receipts_adapter = TypeAdapter(List[ReceiptDisplay])
+
+
+def serialize_with_models(receipts: list) -> bytes:
+    response = []
+    for receipt in receipts:
+        products_display = [
+            ProductDisplay(
+                name=item.product.name,
+                price=f"{item.unit_price:.2f}",
+                quantity=f"{item.quantity:.2f}",
+                total=str((item.quantity * item.unit_price).quantize(CENT, ROUND_HALF_UP))
+            ) for item in receipt.items
+        ]
+        total_products_cost = sum(Decimal(product.total) for product in products_display)
+        rest = Decimal(receipt.payment_amount) - total_products_cost
+
+        response.append(ReceiptDisplay(
+            id=receipt.id,
+            products=products_display,
+            payment=PaymentInfo(type=receipt.payment_type, amount=f"{receipt.payment_amount:.2f}"),
+            total=f"{receipt.total:.2f}",
+            rest=f"{rest:.2f}",
+            created_at=receipt.created_at.isoformat()
+        ))
+    # FastAPI re-validates the returned objects against response_model before dumping them
+    validated = receipts_adapter.validate_python(response, from_attributes=True)
+    return receipts_adapter.dump_json(validated)
+
+
+def serialize_fast(receipts: list) -> bytes:
+    return orjson.dumps([
+        receipt_dict(receipt.id, receipt.created_at, receipt.payment_type, receipt.payment_amount, receipt.total,
+                     receipt.change_given,
+                     [(item.product.name, item.unit_price, item.quantity, item.total_price) for item in receipt.items])
+        for receipt in receipts
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'receipts':>8} {'models ms':>10} {'fast ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        receipts = make_receipts(size)
+        assert orjson.loads(serialize_with_models(receipts)) == orjson.loads(serialize_fast(receipts))
+        number = max(1, 2000 // size)
+        models = min(timeit.repeat(lambda: serialize_with_models(receipts), number=number, repeat=args.repeat))
+        fast = min(timeit.repeat(lambda: serialize_fast(receipts), number=number, repeat=args.repeat))
+        print(f"{size:>8} {models / number * 1000:>10.3f} {fast / number * 1000:>10.3f} {models / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
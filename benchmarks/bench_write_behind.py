@@ -0,0 +1,90 @@
+"""
+Compares receipt creation throughput with N concurrent writers:
+
+- direct: every receipt is inserted and committed in its own transaction, like `POST /receipts/`;
+- write-behind: receipts go through `app.write_behind.ReceiptWriteBehind` and are committed in groups.
+
+Both write into a fresh schema in the target database, SQLite by default.
+
+Run with `python -m benchmarks.bench_write_behind [--database-url postgresql+asyncpg://...]`.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models import Base, User
+from app.schemas import ReceiptCreate
+from app.services import calculate_receipt_totals, insert_receipts
+from app.write_behind import ReceiptWriteBehind
+
+RECEIPT = ReceiptCreate(
+    products=[{"name": "Bench Tea", "price": "1.50", "quantity": "2"},
+              {"name": "Bench Bread", "price": "0.80", "quantity": "1"}],
+    payment={"type": "cash", "amount": "10.00"},
+)
+
+
+async def create_direct(session_maker, user_id: int, count: int) -> None:
+    total, rest = calculate_receipt_totals(RECEIPT)
+    for _ in range(count):
+        async with session_maker() as db:
+            await insert_receipts(db, user_id, [RECEIPT], [(total, rest)], datetime.utcnow())
+            await db.commit()
+
+
+async def create_write_behind(writer: ReceiptWriteBehind, user_id: int, count: int) -> None:
+    total, rest = calculate_receipt_totals(RECEIPT)
+    for _ in range(count):
+        await writer.submit(user_id, RECEIPT, total, rest, datetime.utcnow())
+
+
+async def run(database_url: str, writers: int, receipts: int, ack: str) -> None:
+    # SQLite serializes writers, so direct mode needs a generous busy timeout
+    connect_args = {"timeout": 120} if database_url.startswith("sqlite") else {}
+    engine = create_async_engine(database_url, connect_args=connect_args)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as db:
+        user = User(username="bench", login="bench_write_behind", hashed_password="hashed_password")
+        db.add(user)
+        await db.commit()
+
+    per_writer = receipts // writers
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(create_direct(session_maker, user.id, per_writer) for _ in range(writers)))
+        direct = time.perf_counter() - started
+
+        writer = ReceiptWriteBehind(session_maker, ack=ack)
+        writer.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(create_write_behind(writer, user.id, per_writer) for _ in range(writers)))
+        await writer.stop()
+        grouped = time.perf_counter() - started
+    finally:
+        await engine.dispose()
+
+    created = per_writer * writers
+    print(f"{'mode':>12} {'seconds':>8} {'receipts/s':>11}")
+    print(f"{'direct':>12} {direct:>8.2f} {created / direct:>11.0f}")
+    print(f"{'write-behind':>12} {grouped:>8.2f} {created / grouped:>11.0f}  "
+          f"({writer.flushes} flushes, ack={ack})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///bench_write_behind.db")
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--receipts", type=int, default=2000)
+    parser.add_argument("--ack", choices=["flush", "enqueue"], default="flush")
+    args = parser.parse_args()
+    asyncio.run(run(args.database_url, args.writers, args.receipts, args.ack))
+
+
+if __name__ == "__main__":
+    main()
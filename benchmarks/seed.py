@@ -0,0 +1,122 @@
+"""
+Seeds a database with N users x M receipts x K items for the API benchmarks.
+
+Every user logs in with the username `bench_<n>` with the password `bench-password`. The schema is created when missing,
+so a fresh SQLite file works out of the box.
+
+Run with `python -m benchmarks.seed --users 20 --receipts 200 --items 5 [--database-url ...]`.
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.future import select
+
+from app.hashing import pwd_context
+from app.models import Base, User
+from app.schemas import ReceiptCreate
+from app.services import calculate_receipt_totals, insert_receipt_rows, receipt_row
+from benchmarks import DEFAULT_DATABASE_URL
+
+PASSWORD = "bench-password"
+LOGIN_PREFIX = "bench_"
+PRODUCT_COUNT = 200
+CHUNK_SIZE = 500
+
+
+def make_receipt(rng: random.Random, items: int) -> ReceiptCreate:
+    products = [
+        {"name": f"Bench product {rng.randrange(PRODUCT_COUNT)}",
+         "price": f"{rng.randint(10, 5000) / 100:.2f}",
+         "quantity": f"{rng.randint(1, 5)}.00"}
+        for _ in range(items)
+    ]
+    total = sum(Decimal(product["price"]) * Decimal(product["quantity"]) for product in products)
+    return ReceiptCreate(
+        products=products,
+        payment={"type": rng.choice(["cash", "card"]), "amount": f"{total + rng.randint(0, 20):.2f}"},
+    )
+
+
+async def seed(database_url: str, users: int, receipts: int, items: int, seed_value: int = 0) -> List[int]:
+    """
+    Creates the benchmark users and their receipts. Returns the IDs of the created users.
+    """
+    rng = random.Random(seed_value)
+    engine = create_async_engine(database_url)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with session_maker() as db:
+            existing = await db.execute(select(User.id).where(User.login.like(f"{LOGIN_PREFIX}%")))
+            if existing.first() is not None:
+                raise SystemExit("Benchmark users already exist, seed into an empty database")
+
+            hashed_password = pwd_context.hash(PASSWORD)
+            # /token looks users up by username, so it doubles as the login
+            bench_users = [
+                User(username=f"{LOGIN_PREFIX}{n}", login=f"{LOGIN_PREFIX}{n}", hashed_password=hashed_password)
+                for n in range(users)
+            ]
+            db.add_all(bench_users)
+            await db.flush()
+
+            started = datetime.utcnow() - timedelta(days=90)
+            pending_receipts, pending_rows = [], []
+            for user in bench_users:
+                for n in range(receipts):
+                    receipt_data = make_receipt(rng, items)
+                    total, rest = calculate_receipt_totals(receipt_data)
+                    created_at = started + timedelta(minutes=n * 30 + rng.randint(0, 29))
+                    pending_receipts.append(receipt_data)
+                    pending_rows.append(receipt_row(user.id, receipt_data, total, rest, created_at))
+                    if len(pending_rows) >= CHUNK_SIZE:
+                        await insert_receipt_rows(db, pending_receipts, pending_rows)
+                        pending_receipts, pending_rows = [], []
+            if pending_rows:
+                await insert_receipt_rows(db, pending_receipts, pending_rows)
+            await db.commit()
+            return [user.id for user in bench_users]
+    finally:
+        await engine.dispose()
+
+
+async def clear(database_url: str) -> None:
+    """
+    Removes everything from the benchmark database, keeping the schema.
+    """
+    engine = create_async_engine(database_url)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for table in reversed(Base.metadata.sorted_tables):
+                await conn.execute(delete(table))
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=DEFAULT_DATABASE_URL)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--receipts", type=int, default=200, help="Receipts per user")
+    parser.add_argument("--items", type=int, default=5, help="Items per receipt")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible data")
+    parser.add_argument("--clear", action="store_true", help="Empty the database before seeding")
+    args = parser.parse_args()
+
+    if args.clear:
+        asyncio.run(clear(args.database_url))
+    user_ids = asyncio.run(seed(args.database_url, args.users, args.receipts, args.items, args.seed))
+    print(f"Seeded {len(user_ids)} users with {args.receipts} receipts of {args.items} items each")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
+from typing import Optional
+
 from dotenv import load_dotenv
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 import os
 
@@ -9,11 +12,111 @@ DB_PORT = os.environ.get('DB_PORT')
 DB_NAME = os.environ.get('DB_NAME')
 DB_USER = os.environ.get('DB_USER')
 DB_PASS = os.environ.get('DB_PASS')
+# A complete SQLAlchemy URL, e.g. sqlite+aiosqlite:///bench.db, takes precedence over the DB_* parts
+DATABASE_URL = os.environ.get('DATABASE_URL') \
+    or f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 
+
+class DatabaseSettings(BaseSettings):
+    """
+    Engine, pool and driver tuning, read from DB_* environment variables (e.g. DB_POOL_SIZE).
+    Pools are per worker process, so size them for the number of uvicorn workers.
+    """
+    model_config = SettingsConfigDict(env_prefix='DB_', extra='ignore')
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    # Seconds after which a connection is replaced, -1 keeps connections forever
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = False
+    echo: bool = False
+    # asyncpg only: prepared statements cached per connection, 0 disables the cache (needed behind pgbouncer)
+    prepared_statement_cache_size: int = 100
+    # asyncpg only: server-side statement_timeout in milliseconds, 0 disables it
+    statement_timeout_ms: int = 0
+    # asyncpg only: client-side timeout of every command in seconds
+    command_timeout: Optional[float] = None
+    # Comma-separated DSNs of read replicas serving the read-only endpoints
+    replica_urls: str = ""
+    # Seconds during which a user's reads stay on the primary after one of their writes
+    read_your_writes_seconds: float = 5.0
+
+
+db_settings = DatabaseSettings()
+
 DB_HOST_TEST = os.environ.get('DB_HOST_TEST')
 DB_PORT_TEST = os.environ.get('DB_PORT_TEST')
 DB_NAME_TEST = os.environ.get('DB_NAME_TEST')
 DB_USER_TEST = os.environ.get('DB_USER_TEST')
 DB_PASS_TEST = os.environ.get('DB_PASS_TEST')
+
+# Password hashing runs in a worker pool ('thread' or 'process') so bcrypt never blocks the event loop
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', PASSWORD_HASH_WORKERS))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+# Resolved users are cached per worker (a max size of 0 disables the cache); with AUTH_TRUST_TOKEN the users
+# table is not consulted at all
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 10000))
+AUTH_TRUST_TOKEN = os.environ.get('AUTH_TRUST_TOKEN', 'false').lower() in ('1', 'true', 'yes')
+
+# Rotating JWT signing keys as comma-separated kid:secret pairs; new tokens are signed with JWT_CURRENT_KID
+# (the last pair by default) and SECRET_KEY keeps verifying tokens issued without a kid
+JWT_SIGNING_KEYS = os.environ.get('JWT_SIGNING_KEYS', '')
+JWT_CURRENT_KID = os.environ.get('JWT_CURRENT_KID') or None
+# Allowed clock skew in seconds when checking token expiry
+JWT_LEEWAY = float(os.environ.get('JWT_LEEWAY', 0))
+# Verified tokens cached per worker until they expire, 0 disables the cache
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+
+# Rendered text receipts kept in process, keyed by receipt ID
+RENDERED_RECEIPT_CACHE_SIZE = int(os.environ.get('RENDERED_RECEIPT_CACHE_SIZE', 10000))
+
+# Write-behind receipt creation: receipts are queued and flushed in grouped transactions.
+# WRITE_BEHIND_ACK is 'flush' (answer once committed) or 'enqueue' (answer once queued, may lose receipts on crash)
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+WRITE_BEHIND_ACK = os.environ.get('WRITE_BEHIND_ACK', 'flush')
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 500))
+WRITE_BEHIND_FLUSH_MS = float(os.environ.get('WRITE_BEHIND_FLUSH_MS', 20))
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', 10000))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.environ.get('WRITE_BEHIND_ENQUEUE_TIMEOUT', 1.0))
+WRITE_BEHIND_ID_BLOCK = int(os.environ.get('WRITE_BEHIND_ID_BLOCK', 1000))
+
+# Idempotency-Key support for receipt creation: keys are honoured for IDEMPOTENCY_KEY_TTL seconds and
+# pruned by a background sweeper every IDEMPOTENCY_SWEEP_INTERVAL seconds
+IDEMPOTENCY_KEY_TTL = float(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.environ.get('IDEMPOTENCY_SWEEP_INTERVAL', 300))
+
+# Opt-in request instrumentation: Server-Timing headers, SQL timings and one structured log line per request.
+# PROFILE_SAMPLE_RATE is the fraction of requests dumped with cProfile into PROFILE_DIR; with PROFILE_ON_HEADER
+# a request sending `X-Profile: 1` is profiled as well
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_ON_HEADER = os.environ.get('PROFILE_ON_HEADER', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Prometheus metrics served on /metrics. Under several uvicorn workers set METRICS_MULTIPROC_DIR to an empty
+# directory shared by the workers; each writes its snapshot there every METRICS_WRITE_INTERVAL seconds
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR')
+METRICS_WRITE_INTERVAL = float(os.environ.get('METRICS_WRITE_INTERVAL', 5))
+
+# Monthly partitions of receipts and receipt_items (PostgreSQL): the current and PARTITION_MONTHS_AHEAD next
+# months are created at startup and every PARTITION_MAINTENANCE_INTERVAL seconds
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+PARTITION_MAINTENANCE_INTERVAL = float(os.environ.get('PARTITION_MAINTENANCE_INTERVAL', 12 * 60 * 60))
+
+# In-process background jobs: every worker runs up to JOB_CONCURRENCY jobs, looks for queued jobs every
+# JOB_POLL_INTERVAL seconds and fails running jobs whose worker stopped heartbeating for JOB_STALE_AFTER seconds.
+# Export jobs write their files into JOB_RESULT_DIR, which every worker must be able to read
+JOBS_ENABLED = os.environ.get('JOBS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 60))
+JOB_RESULT_DIR = os.environ.get('JOB_RESULT_DIR', 'job_results')
@@ -1,9 +1,60 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.hashing import password_hasher
+from app.write_behind import receipt_writer
+from app.database import async_session_maker
+from app.idempotency import create_idempotency_sweeper
+from app.jobs import job_runner
+from app.instrumentation import InstrumentationMiddleware, install_sql_hooks
+from app.metrics import MetricsMiddleware, multiprocess_metrics
+from app.partitions import create_partition_maintainer
 from app.routers import users
 from app.routers import receipts
+from app.routers import reports
+from app.routers import metrics
+from app.routers import analytics
+from app.routers import jobs
+from config import INSTRUMENTATION_ENABLED, METRICS_ENABLED
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    idempotency_sweeper = create_idempotency_sweeper(async_session_maker)
+    idempotency_sweeper.start()
+    partition_maintainer = create_partition_maintainer(async_session_maker)
+    partition_maintainer.start()
+    if receipt_writer is not None:
+        receipt_writer.start()
+    if job_runner is not None:
+        job_runner.start()
+    if METRICS_ENABLED and multiprocess_metrics is not None:
+        multiprocess_metrics.start()
+    yield
+    if METRICS_ENABLED and multiprocess_metrics is not None:
+        await multiprocess_metrics.stop()
+    if job_runner is not None:
+        await job_runner.stop()
+    if receipt_writer is not None:
+        await receipt_writer.stop()
+    await idempotency_sweeper.stop()
+    await partition_maintainer.stop()
+    password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+if INSTRUMENTATION_ENABLED:
+    install_sql_hooks()
+    app.add_middleware(InstrumentationMiddleware)
 
-app = FastAPI()
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics.router)
 
 app.include_router(users.router)
 app.include_router(receipts.router)
+app.include_router(reports.router)
+app.include_router(analytics.router)
+app.include_router(jobs.router)
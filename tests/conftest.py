@@ -7,7 +7,8 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
-from app.database import get_async_session
+from app.database import get_async_session, get_read_session
+from app.services import get_user_read_session_maker
 from app.models import Base
 from config import DB_HOST_TEST, DB_PORT_TEST, DB_NAME_TEST, DB_USER_TEST, DB_PASS_TEST
 from main import app
@@ -26,7 +27,13 @@ async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def override_get_read_session_maker() -> sessionmaker:
+    return async_session_maker
+
+
 app.dependency_overrides[get_async_session] = override_get_async_session
+app.dependency_overrides[get_read_session] = override_get_async_session
+app.dependency_overrides[get_user_read_session_maker] = override_get_read_session_maker
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -0,0 +1,87 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from app.models import User, Receipt
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_sales_grouped_by_period_and_payment_type(client):
+    async with async_session_maker() as session:
+        user = User(username="analyst", login="analyticssales", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+        session.add_all([
+            Receipt(user_id=user.id, created_at=created_at, payment_type=payment_type, payment_amount=total,
+                    total=total, change_given=Decimal('0.00'))
+            for created_at, payment_type, total in [
+                (datetime.datetime(2023, 1, 5, 10), 'cash', Decimal('10.00')),
+                (datetime.datetime(2023, 1, 8, 23), 'cash', Decimal('1.00')),
+                (datetime.datetime(2023, 1, 20, 10), 'card', Decimal('5.00')),
+                (datetime.datetime(2023, 2, 1, 10), 'cash', Decimal('7.50')),
+            ]
+        ])
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+
+    response = await client.get("/analytics/receipts?group_by=month&group_by=payment_type", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"period": "2023-01-01", "payment_type": "card", "receipt_count": 1, "total": "5.00", "change_given": "0.00"},
+        {"period": "2023-01-01", "payment_type": "cash", "receipt_count": 2, "total": "11.00", "change_given": "0.00"},
+        {"period": "2023-02-01", "payment_type": "cash", "receipt_count": 1, "total": "7.50", "change_given": "0.00"},
+    ]
+
+    # Weeks start on Monday
+    response = await client.get("/analytics/receipts?group_by=week&format=columns", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        "period": ["2023-01-02", "2023-01-16", "2023-01-30"],
+        "receipt_count": [2, 1, 1],
+        "total": ["11.00", "5.00", "7.50"],
+        "change_given": ["0.00", "0.00", "0.00"],
+    }
+
+    response = await client.get("/analytics/receipts?group_by=payment_type&payment_type=cash&min_total=5",
+                                headers=headers)
+    assert response.json() == [
+        {"payment_type": "cash", "receipt_count": 2, "total": "17.50", "change_given": "0.00"},
+    ]
+
+    response = await client.get("/analytics/receipts?group_by=day&group_by=month", headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_top_products_by_revenue(client):
+    async with async_session_maker() as session:
+        user = User(username="analyst", login="analyticsproducts", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    for products in ([{"name": "AnalyticsCoffee", "price": "2.00", "quantity": "3"},
+                      {"name": "AnalyticsBun", "price": "1.15", "quantity": "1"}],
+                     [{"name": "AnalyticsBun", "price": "1.15", "quantity": "2"}]):
+        response = await client.post("/receipts/", headers=headers,
+                                     json={"products": products, "payment": {"type": "cash", "amount": "10.00"}})
+        assert response.status_code == 200
+
+    response = await client.get("/analytics/receipts?report=products&top=1", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"product": "AnalyticsCoffee", "quantity": "3.00", "revenue": "6.00", "receipt_count": 1},
+    ]
+
+    response = await client.get("/analytics/receipts?report=products&format=columns", headers=headers)
+    assert response.json() == {
+        "product": ["AnalyticsCoffee", "AnalyticsBun"],
+        "quantity": ["3.00", "3.00"],
+        "revenue": ["6.00", "3.45"],
+        "receipt_count": [1, 2],
+    }
@@ -1,5 +1,11 @@
 import pytest
 
+from app import services
+from app.models import User
+from app.services import user_cache, invalidate_cached_user
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
 
 @pytest.mark.asyncio(scope='session')
 async def test_create_user(client):
@@ -23,3 +29,39 @@ async def test_create_user_already_exists(client):
 
     response = await client.post("/users/", json=user_data)
     assert response.status_code == 400, 'Login already registered'
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_current_user_is_cached(client):
+    async with async_session_maker() as session:
+        user = User(username="CachedUser", login="cached_user", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    invalidate_cached_user(user.id)
+
+    await client.get("/receipts/", headers=headers)
+    hits = user_cache.stats()["hits"]
+    await client.get("/receipts/", headers=headers)
+    assert user_cache.stats()["hits"] == hits + 1
+
+    invalidate_cached_user(user.id)
+    misses = user_cache.stats()["misses"]
+    await client.get("/receipts/", headers=headers)
+    assert user_cache.stats()["misses"] == misses + 1
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_current_user_without_cache(client, monkeypatch):
+    async with async_session_maker() as session:
+        user = User(username="UncachedUser", login="uncached_user", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    # What USER_CACHE_MAX_SIZE=0 configures
+    monkeypatch.setattr(services, "user_cache", None)
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    response = await client.get("/reports/daily", headers=headers)
+    assert response.status_code == 200
+    invalidate_cached_user(user.id)
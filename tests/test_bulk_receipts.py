@@ -0,0 +1,73 @@
+import orjson
+import pytest
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app.models import User, ReceiptItem
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_create_receipts_bulk(client):
+    async with async_session_maker() as session:
+        user = User(username="bulkuser", login="bulklogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    receipts_data = [
+        {
+            "products": [{"name": "BulkApple", "price": "0.50", "quantity": "10"}],
+            "payment": {"type": "cash", "amount": "10.00"}
+        },
+        {
+            "products": [{"name": "BulkApple", "price": "0.50", "quantity": "2"},
+                         {"name": "BulkPear", "price": "1.20", "quantity": "1"}],
+            "payment": {"type": "card", "amount": "1.00"}
+        },
+        {
+            "products": [{"name": "BulkPear", "price": "1.20", "quantity": "1"}],
+        },
+    ]
+
+    response = await client.post("/receipts/bulk", headers=headers, json=receipts_data)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result['index'] for result in results] == [0, 1, 2]
+    assert results[0]['id'] is not None and results[0]['error'] is None
+    assert results[1]['id'] is None
+    assert results[1]['error'] == "Payment amount is less than the total price of products."
+    assert results[2]['id'] is None and 'payment' in results[2]['error']
+
+    async with async_session_maker() as session:
+        items = await session.execute(select(func.count()).where(ReceiptItem.receipt_id == results[0]['id']))
+        assert items.scalar() == 1
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_create_receipts_bulk_ndjson(client):
+    async with async_session_maker() as session:
+        user = User(username="bulkuser", login="bulkndjson", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {
+        "Authorization": f"Bearer {create_test_token(user_id=user.id)}",
+        "Content-Type": "application/x-ndjson",
+    }
+    receipt = {
+        "products": [{"name": "BulkPlum", "price": "2.00", "quantity": "3"}],
+        "payment": {"type": "cash", "amount": "6.00"}
+    }
+    body = b"\n".join([orjson.dumps(receipt), b"{not json", orjson.dumps(receipt)])
+
+    response = await client.post("/receipts/bulk", headers=headers, content=body)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == 3
+    assert results[0]['id'] is not None
+    assert results[1]['error'] == "Line is not valid JSON"
+    assert results[2]['id'] == results[0]['id'] + 1
@@ -2,7 +2,9 @@ import pytest
 import jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
-from app.models import User
+from sqlalchemy import func
+from sqlalchemy.future import select
+from app.models import User, Product, ReceiptItem
 from tests.conftest import async_session_maker
 
 SECRET_KEY = "test_secret_key"
@@ -73,3 +75,40 @@ async def test_create_receipt_when_user_not_exists(client):
     assert response.status_code == 404
 
 
+@pytest.mark.asyncio(scope='session')
+async def test_create_receipt_persists_items(client):
+    async with async_session_maker() as session:
+        test_user = User(username="ItemsUser", login='items_user', hashed_password="hashed_password")
+        session.add(test_user)
+        await session.commit()
+
+    token = create_test_token(user_id=test_user.id)
+    receipt_data = {
+        "products": [
+            {"name": "Apple1", "price": "0.50", "quantity": "2"},
+            {"name": "Cherry1", "price": "3.00", "quantity": "1"}
+        ],
+        "payment": {
+            "type": "card",
+            "amount": "4.00"
+        }
+    }
+
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post("/receipts/", headers=headers, json=receipt_data)
+    assert response.status_code == 200
+
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Product.name, ReceiptItem.quantity, ReceiptItem.total_price)
+            .join(ReceiptItem.product)
+            .where(ReceiptItem.receipt_id == response.json()['id'])
+            .order_by(ReceiptItem.id)
+        )
+        items = result.all()
+        assert [(name, f"{quantity:.2f}", f"{total:.2f}") for name, quantity, total in items] == [
+            ("Apple1", "2.00", "1.00"), ("Cherry1", "1.00", "3.00")
+        ]
+
+        products = await session.execute(select(func.count()).where(Product.name == "Apple1"))
+        assert products.scalar() == 1
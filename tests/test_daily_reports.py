@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import pytest
+
+from app.models import User
+from app.rollups import rebuild_daily_sales
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_daily_sales_report(client):
+    async with async_session_maker() as session:
+        user = User(username="reportuser", login="reportlogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    receipt = {
+        "products": [{"name": "ReportBread", "price": "1.50", "quantity": "2"}],
+        "payment": {"type": "cash", "amount": "5.00"}
+    }
+    response = await client.post("/receipts/", headers=headers, json=receipt)
+    assert response.status_code == 200
+    card_receipt = dict(receipt, payment={"type": "card", "amount": "3.00"})
+    response = await client.post("/receipts/bulk", headers=headers, json=[receipt, card_receipt])
+    assert response.status_code == 200
+
+    response = await client.get("/reports/daily", headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert [(row['payment_type'], row['receipt_count']) for row in report] == [('card', 1), ('cash', 2)]
+    assert Decimal(report[1]['total']) == Decimal('6.00')
+    assert Decimal(report[1]['change_given']) == Decimal('4.00')
+
+    response = await client.get("/reports/daily?payment_type=card", headers=headers)
+    assert len(response.json()) == 1
+
+    async with async_session_maker() as session:
+        assert await rebuild_daily_sales(session, user_id=user.id) == 2
+        await session.commit()
+
+    response = await client.get("/reports/daily", headers=headers)
+    assert response.json() == report
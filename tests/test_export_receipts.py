@@ -0,0 +1,66 @@
+import csv
+import io
+
+import orjson
+import pytest
+
+from app.export import CSV_HEADER, export_query, stream_csv
+from app.filters import ReceiptFilters
+from app.models import User
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_export_receipts(client):
+    async with async_session_maker() as session:
+        user = User(username="exportuser", login="exportlogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    receipts_data = [
+        {
+            "products": [{"name": "ExportTea", "price": "2.50", "quantity": "2"},
+                         {"name": "ExportCake", "price": "4.00", "quantity": "1"}],
+            "payment": {"type": "cash", "amount": "10.00"}
+        },
+        {
+            "products": [{"name": "ExportTea", "price": "2.50", "quantity": "1"}],
+            "payment": {"type": "card", "amount": "2.50"}
+        },
+    ]
+    response = await client.post("/receipts/bulk", headers=headers, json=receipts_data)
+    assert response.status_code == 200
+
+    response = await client.get("/receipts/export?format=ndjson", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    receipts = [orjson.loads(line) for line in response.text.splitlines()]
+    assert len(receipts) == 2
+    assert receipts[0]['total'] == '9.00'
+    assert receipts[0]['rest'] == '1.00'
+    assert [product['name'] for product in receipts[0]['products']] == ['ExportTea', 'ExportCake']
+
+    response = await client.get("/receipts/export?format=csv&payment_type=card", headers=headers)
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 1
+    assert rows[0]['product'] == 'ExportTea'
+    assert rows[0]['line_total'] == '2.50'
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_export_stream_closes_its_own_session():
+    sessions = []
+
+    def session_maker():
+        sessions.append(async_session_maker())
+        return sessions[-1]
+
+    filters = ReceiptFilters(receipt_id=None, start_date=None, end_date=None, min_total=None, max_total=None,
+                             payment_type=None)
+    chunks = [chunk async for chunk in stream_csv(session_maker, export_query(filters, user_id=-1))]
+    assert b"".join(chunks) == (",".join(CSV_HEADER) + "\n").encode()
+    assert len(sessions) == 1
+    assert not sessions[0].in_transaction()
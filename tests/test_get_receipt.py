@@ -1,6 +1,7 @@
 import pytest
 from httpx import AsyncClient
 from app.models import User, Receipt, ReceiptItem, Product
+from app.receipt_cache import RenderedReceiptCache
 from datetime import datetime
 
 from tests.conftest import async_session_maker
@@ -49,3 +50,50 @@ async def test_get_receipt(setup_receipt, client: AsyncClient):
     assert "=======================" in receipt_details
 
 
+class DictBackend:
+    """Local stand-in for a shared rendered-receipt backend."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, receipt_id):
+        return self.data.get(receipt_id)
+
+    async def set(self, receipt_id, body):
+        self.data[receipt_id] = body
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_receipt_etag(client: AsyncClient):
+    async with async_session_maker() as session:
+        user = User(username="etaguser", login="etaglogin", hashed_password="hashed_password")
+        product = Product(name="ETag Product", price=2.00)
+        receipt = Receipt(user=user, created_at=datetime(2024, 3, 1, 12, 30), payment_type='cash',
+                          payment_amount=10.00, total=4.00)
+        session.add_all([user, product, receipt, ReceiptItem(receipt=receipt, product=product, quantity=2)])
+        await session.commit()
+
+    response = await client.get(f"/receipts/{user.id}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert "ETag Product 2 x 2.00 4.00" in response.text
+    assert "01.03.2024 12:30" in response.text
+
+    response = await client.get(f"/receipts/{user.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.get(f"/receipts/{user.id}", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_rendered_receipt_cache_shared_backend():
+    backend = DictBackend()
+    first_worker = RenderedReceiptCache(maxsize=10, backend=backend)
+    body, etag = await first_worker.set(42, b"receipt text")
+
+    second_worker = RenderedReceiptCache(maxsize=10, backend=backend)
+    assert await second_worker.get(42) == (body, etag)
+    assert await second_worker.get(43) is None
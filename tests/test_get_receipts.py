@@ -1,7 +1,8 @@
 import datetime
+from decimal import Decimal
 
 import pytest
-from app.models import User, Receipt
+from app.models import User, Receipt, ReceiptItem, Product
 from tests.conftest import async_session_maker
 from tests.test_create_receipt import create_test_token
 
@@ -55,4 +56,136 @@ async def test_get_receipts(client):
     response = await client.get("/receipts/?max_total=200.0", headers=headers)
     assert response.status_code == 200
     receipts = response.json()
-    assert len(receipts) == 2
\ No newline at end of file
+    assert len(receipts) == 2
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_receipts_cursor_pagination(client):
+    async with async_session_maker() as session:
+        user = User(username="pageuser", login="pagelogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+        session.add_all([
+            Receipt(user_id=user.id, created_at=datetime.datetime(2022, 1, day), payment_type='cash',
+                    payment_amount=10.0, total=10.0)
+            for day in (3, 1, 2, 2, 5)
+        ])
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+
+    seen = []
+    url = "/receipts/?limit=2&payment_type=cash"
+    while url:
+        response = await client.get(url, headers=headers)
+        assert response.status_code == 200
+        seen.extend(receipt['created_at'][:10] for receipt in response.json())
+        url = response.links.get("next", {}).get("url")
+    assert seen == ['2022-01-01', '2022-01-02', '2022-01-02', '2022-01-03', '2022-01-05']
+
+    response = await client.get("/receipts/?cursor=not-a-cursor", headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_receipts_includes_items(client):
+    async with async_session_maker() as session:
+        user = User(username="itemsuser", login="itemslistlogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    receipt_data = {
+        "products": [{"name": "ListMilk", "price": "1.15", "quantity": "3"},
+                     {"name": "ListEggs", "price": "2.40", "quantity": "0.5"}],
+        "payment": {"type": "cash", "amount": "5.00"}
+    }
+    response = await client.post("/receipts/", headers=headers, json=receipt_data)
+    assert response.status_code == 200
+
+    response = await client.get("/receipts/", headers=headers)
+    assert response.status_code == 200
+    receipts = response.json()
+    assert len(receipts) == 1
+    assert receipts[0]['products'] == [
+        {"name": "ListMilk", "price": "1.15", "quantity": "3.00", "total": "3.45"},
+        {"name": "ListEggs", "price": "2.40", "quantity": "0.50", "total": "1.20"},
+    ]
+    assert receipts[0]['total'] == '4.65'
+    assert receipts[0]['rest'] == '0.35'
+    assert receipts[0]['payment'] == {"type": "cash", "amount": "5.00"}
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_receipts_returns_stored_change(client):
+    async with async_session_maker() as session:
+        user = User(username="changeuser", login="storedchangelogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+        # Change is what the till actually gave back, which need not be the payment minus the total
+        session.add(Receipt(user_id=user.id, created_at=datetime.datetime(2022, 3, 1), payment_type='cash',
+                            payment_amount=Decimal('20.00'), total=Decimal('17.48'), change_given=Decimal('2.50')))
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    response = await client.get("/receipts/", headers=headers)
+    assert response.status_code == 200
+    assert response.json()[0]['total'] == '17.48'
+    assert response.json()[0]['rest'] == '2.50'
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_receipts_keeps_the_price_of_every_receipt(client):
+    async with async_session_maker() as session:
+        user = User(username="priceuser", login="pricechangelogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    for products in ([{"name": "PriceMilk", "price": "1.00", "quantity": "1"}],
+                     [{"name": "PriceMilk", "price": "2.00", "quantity": "1"},
+                      {"name": "PriceMilk", "price": "2.50", "quantity": "2"}]):
+        response = await client.post("/receipts/", headers=headers,
+                                     json={"products": products, "payment": {"type": "cash", "amount": "10.00"}})
+        assert response.status_code == 200
+
+    response = await client.get("/receipts/", headers=headers)
+    assert response.status_code == 200
+    first, second = response.json()
+    assert first['products'] == [{"name": "PriceMilk", "price": "1.00", "quantity": "1.00", "total": "1.00"}]
+    assert second['products'] == [
+        {"name": "PriceMilk", "price": "2.00", "quantity": "1.00", "total": "2.00"},
+        {"name": "PriceMilk", "price": "2.50", "quantity": "2.00", "total": "5.00"},
+    ]
+    assert second['total'] == '7.00'
+
+    response = await client.get(f"/receipts/{user.id}")
+    assert "PriceMilk 1 x 1.00 1.00" in response.text
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_get_receipts_prices_items_without_unit_price(client):
+    async with async_session_maker() as session:
+        user = User(username="legacyuser", login="legacypricelogin", hashed_password="hashed_password")
+        product = Product(name="LegacyTea", price=Decimal("3.00"))
+        receipt = Receipt(user=user, created_at=datetime.datetime(2023, 5, 1), payment_type='cash',
+                          payment_amount=Decimal("10.00"), total=Decimal("6.00"))
+        # Stored before receipt items carried their own unit price
+        session.add_all([user, product, receipt, ReceiptItem(receipt=receipt, product=product, quantity=2)])
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    response = await client.get("/receipts/", headers=headers)
+    assert response.status_code == 200
+    assert response.json()[0]['products'] == [{"name": "LegacyTea", "price": "3.00", "quantity": "2.00",
+                                               "total": "6.00"}]
+    assert response.json()[0]['rest'] == '4.00'
+
+    response = await client.get("/receipts/export?format=csv", headers=headers)
+    assert response.text.splitlines()[1].endswith(",LegacyTea,3.00,2.00,6.00")
+
+    response = await client.get(f"/receipts/{user.id}")
+    assert response.status_code == 200
+    assert "СУМА 6.00" in response.text
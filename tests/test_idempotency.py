@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app.idempotency import idempotent_responses, prune_idempotency_keys
+from app.models import User, Receipt, IdempotencyKey
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+RECEIPT_DATA = {
+    "products": [{"name": "IdempotentTea", "price": "1.50", "quantity": "2"}],
+    "payment": {"type": "cash", "amount": "5.00"}
+}
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_retried_receipt_is_not_created_twice(client):
+    async with async_session_maker() as session:
+        user = User(username="idempotent", login="idempotentretry", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}", "Idempotency-Key": "till-1-42"}
+
+    first = await client.post("/receipts/", json=RECEIPT_DATA, headers=headers)
+    retry = await client.post("/receipts/", json=RECEIPT_DATA, headers=headers)
+    # Served from the idempotency_keys table rather than the in-process cache
+    idempotent_responses.clear()
+    late_retry = await client.post("/receipts/", json=RECEIPT_DATA, headers=headers)
+
+    assert first.status_code == 200
+    assert retry.json() == first.json()
+    assert late_retry.json() == first.json()
+
+    async with async_session_maker() as session:
+        count = await session.execute(select(func.count()).select_from(Receipt).where(Receipt.user_id == user.id))
+        assert count.scalar() == 1
+
+    other = await client.post("/receipts/", json=RECEIPT_DATA,
+                              headers={**headers, "Idempotency-Key": "till-1-43"})
+    assert other.json()['id'] != first.json()['id']
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_expired_idempotency_keys_are_pruned(client):
+    async with async_session_maker() as session:
+        user = User(username="idempotent", login="idempotentprune", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}", "Idempotency-Key": "till-2-1"}
+    response = await client.post("/receipts/", json=RECEIPT_DATA, headers=headers)
+    assert response.status_code == 200
+
+    async with async_session_maker() as session:
+        await prune_idempotency_keys(session, now=datetime.utcnow() + timedelta(days=365))
+        await session.commit()
+        remaining = await session.execute(
+            select(func.count()).select_from(IdempotencyKey).where(IdempotencyKey.user_id == user.id))
+        assert remaining.scalar() == 0
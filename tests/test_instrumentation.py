@@ -0,0 +1,63 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.instrumentation import InstrumentationMiddleware, install_sql_hooks, phase, uninstall_sql_hooks
+from app.models import User
+from main import app
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+RECEIPT_DATA = {
+    "products": [{"name": "TimedTea", "price": "1.50", "quantity": "2"}],
+    "payment": {"type": "cash", "amount": "5.00"}
+}
+
+
+@pytest.fixture
+def sql_hooks():
+    install_sql_hooks()
+    yield
+    uninstall_sql_hooks()
+
+
+def test_phase_is_a_no_op_outside_instrumented_requests():
+    with phase("serialize"):
+        pass
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_server_timing_and_profile(client, tmp_path, sql_hooks):
+    async with async_session_maker() as session:
+        user = User(username="instrumented", login="instrumented", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    await client.post("/receipts/", json=RECEIPT_DATA, headers=headers)
+
+    instrumented = InstrumentationMiddleware(app, profile_on_header=True, profile_dir=str(tmp_path))
+    async with AsyncClient(transport=ASGITransport(app=instrumented), base_url="http://testserver") as timed:
+        response = await timed.get("/receipts/", headers=headers)
+        profiled = await timed.get("/receipts/", headers={**headers, "X-Profile": "1"})
+
+    assert response.status_code == 200
+    server_timing = response.headers["Server-Timing"]
+    assert server_timing.startswith("total;dur=")
+    assert 'sql;desc="' in server_timing
+    assert "fetch;dur=" in server_timing
+    assert "serialize;dur=" in server_timing
+    assert "encode;dur=" in server_timing
+
+    assert profiled.status_code == 200
+    assert len(list(tmp_path.glob("*-GET-receipts.prof"))) == 1
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_failed_statements_are_not_left_timing(sql_hooks):
+    async with async_session_maker() as session:
+        connection = await session.connection()
+        with pytest.raises(DBAPIError):
+            await connection.execute(text("SELECT * FROM no_such_table"))
+        assert connection.sync_connection.info["query_started"] == []
@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+
+import pytest
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import app.jobs as jobs
+from app.database import read_router
+from app.jobs import JobRegistry, JobRunner, job_registry, new_job
+from app.models import Base, User
+from app.services import get_user_read_session_maker
+from main import app
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+class NoParams(BaseModel):
+    pass
+
+
+def receipt_paid(amount: str) -> dict:
+    return {"products": [{"name": "JobsTea", "price": "2.00", "quantity": "1"}],
+            "payment": {"type": "cash", "amount": amount}}
+
+
+async def wait_for_job(client, headers: dict, job_id: int, statuses=("succeeded", "failed", "cancelled")) -> dict:
+    for _ in range(200):
+        response = await client.get(f"/jobs/{job_id}", headers=headers)
+        assert response.status_code == 200
+        if response.json()["status"] in statuses:
+            return response.json()
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Job {job_id} is still {response.json()['status']}")
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_runner_bounds_concurrency_reports_progress_and_cancels(client):
+    async with async_session_maker() as session:
+        user = User(username="jobs", login="jobsrunner", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+
+    registry = JobRegistry()
+    release = asyncio.Event()
+
+    @registry.register("test_blocking", NoParams)
+    async def blocking(context, params):
+        await context.report_progress(1, 4)
+        await release.wait()
+        return {"done": True}
+
+    kind = registry.get("test_blocking")
+    async with async_session_maker() as session:
+        first, second, third = new_job(user.id, kind, NoParams()), new_job(user.id, kind, NoParams()), \
+            new_job(user.id, kind, NoParams())
+        session.add_all([first, second, third])
+        await session.commit()
+
+    # Queued jobs are cancelled before any runner sees them
+    response = await client.post(f"/jobs/{third.id}/cancel", headers=headers)
+    assert response.json()["status"] == "cancelled"
+
+    runner = JobRunner(async_session_maker, registry, concurrency=1, poll_interval=0.05)
+    runner.start()
+    try:
+        for _ in range(200):
+            job = (await client.get(f"/jobs/{first.id}", headers=headers)).json()
+            if job["progress"] == 25:
+                break
+            await asyncio.sleep(0.05)
+        assert job["status"] == "running"
+        assert job["progress"] == 25
+        assert (await client.get(f"/jobs/{second.id}", headers=headers)).json()["status"] == "queued"
+
+        # A running job is flagged, then cancelled by its runner at the next heartbeat
+        response = await client.post(f"/jobs/{first.id}/cancel", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["cancel_requested"] is True
+        job = await wait_for_job(client, headers, first.id)
+        assert job["status"] == "cancelled"
+
+        await wait_for_job(client, headers, second.id, statuses=("running",))
+        release.set()
+        job = await wait_for_job(client, headers, second.id)
+        assert job["status"] == "succeeded"
+        assert job["progress"] == 100
+        assert job["result"] == {"done": True}
+
+        release.clear()
+        async with async_session_maker() as session:
+            interrupted = new_job(user.id, kind, NoParams())
+            session.add(interrupted)
+            await session.commit()
+        await wait_for_job(client, headers, interrupted.id, statuses=("running",))
+    finally:
+        await runner.stop()
+
+    job = (await client.get(f"/jobs/{interrupted.id}", headers=headers)).json()
+    assert job["status"] == "failed"
+    assert job["error"] == "Interrupted: the worker shut down"
+
+    response = await client.post(f"/jobs/{second.id}/cancel", headers=headers)
+    assert response.status_code == 409
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_import_and_export_jobs(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RESULT_DIR", str(tmp_path))
+    async with async_session_maker() as session:
+        user = User(username="jobs", login="jobsimportexport", hashed_password="hashed_password")
+        other = User(username="jobs", login="jobsimportexportother", hashed_password="hashed_password")
+        session.add_all([user, other])
+        await session.commit()
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+
+    response = await client.post("/jobs", headers=headers, json={"kind": "unknown"})
+    assert response.status_code == 400
+    response = await client.post("/jobs", headers=headers, json={"kind": "import_receipts", "params": {"receipts": []}})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "params", "receipts"]
+
+    response = await client.post("/jobs", headers=headers, json={
+        "kind": "import_receipts",
+        "params": {"receipts": [receipt_paid("5.00"), receipt_paid("1.00"), receipt_paid("2.00")]},
+    })
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    import_id = response.json()["id"]
+
+    runner = JobRunner(async_session_maker, job_registry, concurrency=2, poll_interval=0.05)
+    runner.start()
+    try:
+        job = await wait_for_job(client, headers, import_id)
+        assert job["status"] == "succeeded"
+        assert job["result"] == {
+            "created": 2,
+            "errors": [{"index": 1, "error": "Payment amount is less than the total price of products."}],
+        }
+
+        response = await client.post("/jobs", headers=headers,
+                                     json={"kind": "export_receipts", "params": {"format": "csv"}})
+        job = await wait_for_job(client, headers, response.json()["id"])
+        assert job["status"] == "succeeded"
+        assert job["result"]["download"] == f"/jobs/{job['id']}/result"
+
+        response = await client.get(job["result"]["download"], headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert len(lines) == 3
+        assert lines[1].endswith(",cash,5.00,2.00,3.00,JobsTea,2.00,1.00,2.00")
+
+        response = await client.post("/jobs", headers=headers, json={"kind": "rebuild_daily_sales"})
+        job = await wait_for_job(client, headers, response.json()["id"])
+        assert job["result"] == {"rows": 1}
+    finally:
+        await runner.stop()
+
+    other_headers = {"Authorization": f"Bearer {create_test_token(user_id=other.id)}"}
+    response = await client.get(f"/jobs/{import_id}", headers=other_headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_job_is_read_from_the_primary_right_after_it_is_created(client, tmp_path, monkeypatch):
+    async with async_session_maker() as session:
+        user = User(username="jobs", login="jobsreadyourwrites", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+
+    # A replica that has not replicated any job yet
+    lagging_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'lagging.db'}")
+    async with lagging_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    lagging = async_sessionmaker(lagging_engine, expire_on_commit=False)
+    monkeypatch.setattr(read_router, "primary", async_session_maker)
+    monkeypatch.setattr(read_router, "replicas", [lagging])
+    monkeypatch.setattr(read_router, "_next_replica", itertools.cycle([lagging]))
+    override = app.dependency_overrides.pop(get_user_read_session_maker)
+    try:
+        response = await client.post("/jobs", headers=headers, json={"kind": "rebuild_daily_sales"})
+        assert response.status_code == 202
+        response = await client.get(f"/jobs/{response.json()['id']}", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["status"] == "queued"
+    finally:
+        app.dependency_overrides[get_user_read_session_maker] = override
+        await lagging_engine.dispose()
@@ -2,6 +2,7 @@ import pytest
 from fastapi import status
 from passlib.context import CryptContext
 from app.models import User
+from config import BCRYPT_ROUNDS
 from tests.conftest import async_session_maker
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -26,3 +27,20 @@ async def test_login_for_access_token(client):
     token_data = response.json()
     assert 'access_token' in token_data
     assert token_data['token_type'] == "bearer"
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_login_rehashes_outdated_password(client):
+    outdated_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+    async with async_session_maker() as session:
+        test_user = User(username="RehashUser", login='rehash_user', hashed_password=outdated_context.hash("Broo"))
+        session.add(test_user)
+        await session.commit()
+
+    response = await client.post("/token", data={"username": "RehashUser", "password": "Broo"})
+    assert response.status_code == status.HTTP_200_OK
+
+    async with async_session_maker() as session:
+        user = await session.get(User, test_user.id)
+        assert user.hashed_password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+        assert pwd_context.verify("Broo", user.hashed_password)
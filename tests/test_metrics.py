@@ -0,0 +1,80 @@
+import pytest
+
+import app.metrics
+from app.cache import TTLCache
+from app.metrics import MetricsRegistry, merge_snapshots, register_cache_metrics, render
+from app.models import User
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_metrics_endpoint(client):
+    async with async_session_maker() as session:
+        user = User(username="metrics", login="metricslogin", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    receipt_data = {
+        "products": [{"name": "MetricsTea", "price": "1.50", "quantity": "2"}],
+        "payment": {"type": "cash", "amount": "5.00"}
+    }
+    await client.post("/receipts/", json=receipt_data, headers=headers)
+    await client.get(f"/receipts/{user.id}")
+
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert "# TYPE receipts_created_total counter" in body
+    assert 'http_requests_total{method="GET",route="/receipts/{user_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/receipts/",le="+Inf"}' in body
+    assert "db_pool_checked_out" in body
+    assert "password_hash_busy_seconds_total" in body
+    # The authenticated POST above went through both caches
+    assert "# TYPE user_cache_hits_total counter" in body
+    assert "# TYPE token_cache_misses_total counter" in body
+    assert "user_cache_size" in body
+
+
+def test_cache_metrics(monkeypatch):
+    registry = MetricsRegistry()
+    cache = TTLCache(maxsize=1)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    cache.set("b", 2)
+    monkeypatch.setattr(app.metrics, "registry", registry)
+    register_cache_metrics("test", cache.stats)
+    register_cache_metrics("disabled", dict)
+    body = render(registry.snapshot())
+
+    assert "test_cache_hits_total 1" in body
+    assert "test_cache_misses_total 1" in body
+    assert "test_cache_evictions_total 1" in body
+    assert "test_cache_size 1" in body
+    assert "disabled_cache_hits_total 0" in body
+
+
+def test_merge_worker_snapshots():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    in_flight = registry.gauge("in_flight", "In flight")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.inc(route="/a")
+    in_flight.inc()
+    latency.observe(0.05)
+    latency.observe(5)
+    snapshot = registry.snapshot()
+
+    # The second worker exited: its counters and histograms still count, its gauges do not
+    body = render(merge_snapshots([(snapshot, True), (snapshot, False)]))
+
+    assert 'requests_total{route="/a"} 2' in body
+    assert "in_flight 1" in body
+    assert 'latency_seconds_bucket{le="0.1"} 2' in body
+    assert 'latency_seconds_bucket{le="1"} 2' in body
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in body
+    assert "latency_seconds_count 4" in body
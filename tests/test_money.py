@@ -0,0 +1,35 @@
+from decimal import Decimal
+
+import pytest
+
+from app.money import format_amount, from_minor, line_amount, receipt_totals, to_minor
+from app.schemas import ProductInfo
+
+
+def test_amounts_convert_exactly_and_round_half_away_from_zero():
+    assert to_minor(Decimal("12.34")) == 1234
+    assert to_minor("0.5") == 50
+    assert to_minor(7) == 700
+    assert to_minor("2.525") == 253
+    assert to_minor("-2.525") == -253
+    assert to_minor("2.52499") == 252
+    with pytest.raises(TypeError):
+        to_minor(0.1)
+
+    assert from_minor(650) == Decimal("6.50")
+    assert str(from_minor(0)) == "0.00"
+    assert format_amount(Decimal("6.5")) == "6.50"
+    assert format_amount(Decimal("2.525")) == "2.53"
+    assert format_amount("6.50") == "6.50"
+    assert format_amount("6.5") == "6.50"
+
+
+def test_line_totals_are_rounded_one_by_one():
+    # 1.01 x 2.5 = 2.525 and 3.03 x 1.5 = 4.545
+    assert line_amount(Decimal("1.01"), Decimal("2.5")) == Decimal("2.53")
+    assert line_amount(Decimal("3.03"), Decimal("1.5")) == Decimal("4.55")
+    assert line_amount(Decimal("-1.01"), Decimal("2.5")) == Decimal("-2.53")
+
+    items = [ProductInfo(name="A", price="1.01", quantity="2.5"), ProductInfo(name="B", price="3.03", quantity="1.5")]
+    assert receipt_totals(items, Decimal("10")) == (708, 292)
+    assert receipt_totals([ProductInfo(name="A", price="1.15", quantity="3")], Decimal("3.00")) == (345, -45)
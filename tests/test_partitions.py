@@ -0,0 +1,59 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.partitions import add_months, create_month_partitions, detach_partitions, list_partitions
+from tests.conftest import engine_test
+
+
+def test_add_months_crosses_years():
+    assert add_months(date(2024, 11, 1), 1) == date(2024, 12, 1)
+    assert add_months(date(2024, 12, 1), 1) == date(2025, 1, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert add_months(date(2024, 3, 1), 25) == date(2026, 4, 1)
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_date_bounded_queries_only_scan_their_months():
+    async with engine_test.connect() as conn:
+        # Partitions are created and detached inside a transaction that is rolled back
+        transaction = await conn.begin()
+        try:
+            db = AsyncSession(bind=conn)
+            created = await create_month_partitions(db, date(2099, 1, 15), 2)
+            assert created == ["receipts_y2099m01", "receipts_y2099m02",
+                               "receipt_items_y2099m01", "receipt_items_y2099m02"]
+            # Existing partitions are skipped
+            assert await create_month_partitions(db, date(2099, 1, 1), 2) == []
+
+            user_id = (await conn.execute(text(
+                "INSERT INTO users (username, login, hashed_password) "
+                "VALUES ('partitions', 'partitionsmonths', 'hashed_password') RETURNING id"
+            ))).scalar()
+            for created_at in (datetime(2099, 1, 15), datetime(2099, 2, 15)):
+                await conn.execute(text(
+                    "WITH receipt AS (INSERT INTO receipts (user_id, created_at, total) "
+                    "VALUES (:user_id, :created_at, 1) RETURNING id, created_at) "
+                    "INSERT INTO receipt_items (receipt_id, receipt_created_at, quantity, total_price) "
+                    "SELECT id, created_at, 1, 1 FROM receipt"
+                ), {"user_id": user_id, "created_at": created_at})
+
+            result = await conn.execute(text(
+                "EXPLAIN SELECT * FROM receipts WHERE user_id = :user_id "
+                "AND created_at >= :start AND created_at < :end"
+            ), {"user_id": user_id, "start": datetime(2099, 1, 1), "end": datetime(2099, 2, 1)})
+            plan = "\n".join(row[0] for row in result)
+            assert "receipts_y2099m01" in plan
+            assert "receipts_y2099m02" not in plan
+            assert "receipts_default" not in plan
+
+            detached = await detach_partitions(db, date(2099, 2, 1))
+            assert "receipt_items_y2099m01" in detached and "receipts_y2099m01" in detached
+            assert "receipts_y2099m02" in [name for name, _ in await list_partitions(db, "receipts")]
+            remaining = await conn.execute(text("SELECT count(*) FROM receipts WHERE user_id = :user_id"),
+                                           {"user_id": user_id})
+            assert remaining.scalar() == 1
+        finally:
+            await transaction.rollback()
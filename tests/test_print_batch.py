@@ -0,0 +1,43 @@
+import pytest
+
+from app.models import User
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_print_receipts_batch(client):
+    async with async_session_maker() as session:
+        user = User(username="printuser", login="printlogin", hashed_password="hashed_password")
+        other = User(username="printother", login="printother", hashed_password="hashed_password")
+        session.add_all([user, other])
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    receipts_data = [
+        {
+            "products": [{"name": f"PrintItem{n}", "price": "1.00", "quantity": "2"}],
+            "payment": {"type": "cash", "amount": "5.00"}
+        } for n in range(3)
+    ]
+    response = await client.post("/receipts/bulk", headers=headers, json=receipts_data)
+    receipt_ids = [result['id'] for result in response.json()]
+
+    other_headers = {"Authorization": f"Bearer {create_test_token(user_id=other.id)}"}
+    response = await client.post("/receipts/bulk", headers=other_headers, json=receipts_data[:1])
+    foreign_id = response.json()[0]['id']
+
+    requested = [receipt_ids[2], receipt_ids[0], foreign_id, receipt_ids[2]]
+    response = await client.post("/receipts/print-batch", headers=headers, json={"receipt_ids": requested})
+
+    assert response.status_code == 200
+    assert response.headers["x-missing-receipt-ids"] == str(foreign_id)
+    receipts = response.text.split("\n\f\n")
+    assert len(receipts) == 3
+    assert "PrintItem2 2 x 1.00 2.00" in receipts[0]
+    assert "PrintItem0 2 x 1.00 2.00" in receipts[1]
+    assert receipts[2] == receipts[0]
+    assert all("Решта 3.00" in receipt for receipt in receipts)
+
+    response = await client.post("/receipts/print-batch", headers=headers, json={"receipt_ids": [foreign_id]})
+    assert response.status_code == 404
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import app.database
+from app.database import ReadRouter, get_read_session
+from app.models import Base, User, Product, Receipt, ReceiptItem
+from app.receipt_cache import rendered_receipts
+from main import app as fastapi_app
+
+
+async def make_database(path, product_name):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        user = User(id=1, username="replicauser", login="replicalogin", hashed_password="hashed_password")
+        product = Product(name=product_name, price=2)
+        receipt = Receipt(user=user, created_at=datetime(2024, 1, 1), payment_type='cash',
+                          payment_amount=10, total=2)
+        session.add_all([user, product, receipt, ReceiptItem(receipt=receipt, product=product, quantity=1)])
+        await session.commit()
+    return engine, session_maker
+
+
+@pytest.fixture
+async def replica_router(tmp_path, monkeypatch):
+    primary_engine, primary = await make_database(tmp_path / "primary.db", "Primary Product")
+    replica_engine, replica = await make_database(tmp_path / "replica.db", "Replica Product")
+    router = ReadRouter(primary, [replica], window=60)
+    monkeypatch.setattr(app.database, "read_router", router)
+    # Receipt 1 renders differently on each database, so nothing rendered elsewhere may be served
+    rendered_receipts.clear()
+    # Route through the real dependency instead of the test database override
+    override = fastapi_app.dependency_overrides.pop(get_read_session)
+    yield router
+    fastapi_app.dependency_overrides[get_read_session] = override
+    rendered_receipts.clear()
+    await primary_engine.dispose()
+    await replica_engine.dispose()
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_reads_go_to_replica_until_the_user_writes(replica_router, client):
+    response = await client.get("/receipts/1")
+    assert response.status_code == 200
+    assert "Replica Product" in response.text
+
+    replica_router.mark_write(1)
+    rendered_receipts.clear()
+    response = await client.get("/receipts/1")
+    assert "Primary Product" in response.text
+
+    # Other users are not affected by the write
+    assert replica_router.session_maker_for(2) is replica_router.replicas[0]
+
+
+def test_reads_use_primary_without_replicas():
+    primary = async_sessionmaker()
+    router = ReadRouter(primary)
+    assert router.session_maker_for(1) is primary
+    assert router.session_maker_for(None) is primary
@@ -0,0 +1,77 @@
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from tests.conftest import engine_test
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (username, login, hashed_password)
+    SELECT 'explain', 'explain_' || g, 'hashed_password' FROM generate_series(1, 200) AS g
+    """,
+    """
+    INSERT INTO receipts (user_id, created_at, total, payment_type, payment_amount, change_given)
+    SELECT u.id, timestamp '2023-01-01' + g * interval '1 hour', g % 100,
+           CASE WHEN g % 3 = 0 THEN 'card' ELSE 'cash' END, 100, 100 - g % 100
+    FROM users AS u CROSS JOIN generate_series(1, 250) AS g
+    WHERE u.login LIKE 'explain\\_%'
+    """,
+    """
+    INSERT INTO receipt_items (receipt_id, receipt_created_at, quantity, total_price)
+    SELECT r.id, r.created_at, 1, 1 FROM receipts AS r CROSS JOIN generate_series(1, 3)
+    WHERE r.user_id IN (SELECT id FROM users WHERE login LIKE 'explain\\_%')
+    """,
+    "ANALYZE users",
+    "ANALYZE receipts",
+    "ANALYZE receipt_items",
+]
+
+
+async def explain(conn, statement: str, **params) -> str:
+    result = await conn.execute(text(f"EXPLAIN {statement}"), params)
+    return "\n".join(row[0] for row in result)
+
+
+def uses_index(plan: str, table: str, columns: str) -> bool:
+    # Partitions scan their own copy of the index, named <partition>_<columns>_idx by PostgreSQL
+    return re.search(rf"\b(ix_{table}_{columns}|{table}_\w+?_{columns}_idx)\b", plan) is not None
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_receipt_listing_uses_indexes():
+    async with engine_test.connect() as conn:
+        # Everything is seeded inside a transaction that is rolled back, so other tests never see it
+        transaction = await conn.begin()
+        try:
+            for statement in SEED_STATEMENTS:
+                await conn.execute(text(statement))
+            user_id = (await conn.execute(text("SELECT id FROM users WHERE login = 'explain_7'"))).scalar()
+
+            plan = await explain(
+                conn, "SELECT * FROM receipts WHERE user_id = :user_id ORDER BY created_at, id LIMIT 11",
+                user_id=user_id)
+            assert uses_index(plan, "receipts", "user_id_created_at_id")
+
+            plan = await explain(
+                conn, "SELECT * FROM receipts WHERE user_id = :user_id AND created_at >= :start "
+                      "AND created_at <= :end ORDER BY created_at, id LIMIT 11",
+                user_id=user_id, start=datetime(2023, 1, 3), end=datetime(2023, 1, 5))
+            assert uses_index(plan, "receipts", "user_id_created_at_id")
+
+            plan = await explain(
+                conn, "SELECT * FROM receipts WHERE user_id = :user_id AND payment_type = 'card' "
+                      "ORDER BY created_at, id LIMIT 11",
+                user_id=user_id)
+            assert uses_index(plan, "receipts", "user_id_payment_type_created_at_id")
+
+            receipt_ids = (await conn.execute(
+                text("SELECT id FROM receipts WHERE user_id = :user_id LIMIT 10"), {"user_id": user_id}
+            )).scalars().all()
+            plan = await explain(
+                conn, "SELECT * FROM receipt_items WHERE receipt_id = ANY(:receipt_ids)",
+                receipt_ids=list(receipt_ids))
+            assert uses_index(plan, "receipt_items", "receipt_id")
+        finally:
+            await transaction.rollback()
@@ -0,0 +1,71 @@
+import pytest
+
+from app.models import User
+from app.search import ProductSearchIndex
+from tests.conftest import async_session_maker
+from tests.test_create_receipt import create_test_token
+
+
+def receipt_with(*names: str) -> dict:
+    return {
+        "products": [{"name": name, "price": "2.00", "quantity": "1"} for name in names],
+        "payment": {"type": "card", "amount": "100.00"}
+    }
+
+
+def test_product_search_index_matching_rules():
+    index = ProductSearchIndex()
+    index.add(1, "Espresso Doppio")
+    index.add(2, "Green Tea Sencha")
+    index.add(3, "Teapot")
+
+    assert index.match("espreso") == [1]
+    assert index.match("sencha green") == [2]
+    assert index.match("TEA") == [2, 3]
+    assert index.match("oppi") == [1]
+    assert index.match("coffee") == []
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_search_receipts_by_product_name(client):
+    async with async_session_maker() as session:
+        user = User(username="searcher", login="searchreceipts", hashed_password="hashed_password")
+        other = User(username="searcher", login="searchreceiptsother", hashed_password="hashed_password")
+        session.add_all([user, other])
+        await session.commit()
+
+    headers = {"Authorization": f"Bearer {create_test_token(user_id=user.id)}"}
+    other_headers = {"Authorization": f"Bearer {create_test_token(user_id=other.id)}"}
+    created = []
+    for names in (["Searchable Espresso Doppio", "Searchable Croissant"], ["Searchable Green Tea Sencha"],
+                  ["Searchable Espresso Doppio"]):
+        response = await client.post("/receipts/", json=receipt_with(*names), headers=headers)
+        assert response.status_code == 200
+        created.append(response.json()["id"])
+    response = await client.post("/receipts/", json=receipt_with("Searchable Espresso Doppio"), headers=other_headers)
+    assert response.status_code == 200
+
+    # Typo, word order and substring matches
+    response = await client.get("/receipts/search", params={"q": "espreso"}, headers=headers)
+    assert response.status_code == 200
+    assert [receipt["id"] for receipt in response.json()] == [created[0], created[2]]
+
+    response = await client.get("/receipts/search", params={"q": "sencha green"}, headers=headers)
+    assert [receipt["id"] for receipt in response.json()] == [created[1]]
+
+    response = await client.get("/receipts/search", params={"q": "roissan"}, headers=headers)
+    assert [receipt["id"] for receipt in response.json()] == [created[0]]
+    assert len(response.json()[0]["products"]) == 2
+
+    response = await client.get("/receipts/search", params={"q": "espresso", "limit": 1}, headers=headers)
+    assert [receipt["id"] for receipt in response.json()] == [created[0]]
+    next_url = response.headers["Link"].split(";")[0].strip("<>")
+    response = await client.get(next_url, headers=headers)
+    assert [receipt["id"] for receipt in response.json()] == [created[2]]
+    assert "Link" not in response.headers
+
+    response = await client.get("/receipts/search", params={"q": "pumpernickel"}, headers=headers)
+    assert response.status_code == 404
+
+    response = await client.get("/receipts/search", params={"q": "e"}, headers=headers)
+    assert response.status_code == 422
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from app.tokens import SigningKeySet, TokenCache
+
+
+def claims(seconds: float = 60) -> dict:
+    return {"sub": "1", "exp": datetime.utcnow() + timedelta(seconds=seconds)}
+
+
+def test_rotated_keys_keep_verifying_their_tokens():
+    old = SigningKeySet.parse("2024a:old-secret", legacy_key="legacy-secret")
+    new = SigningKeySet.parse("2024a:old-secret,2024b:new-secret", legacy_key="legacy-secret")
+    legacy = SigningKeySet.parse("", legacy_key="legacy-secret")
+
+    assert jwt.get_unverified_header(new.encode(claims()))["kid"] == "2024b"
+    assert new.decode(old.encode(claims()))["sub"] == "1"
+    assert new.decode(legacy.encode(claims()))["sub"] == "1"
+
+    retired = SigningKeySet.parse("2024b:new-secret")
+    with pytest.raises(jwt.PyJWTError):
+        retired.decode(old.encode(claims()))
+    forged = jwt.encode(claims(), "guessed-secret", algorithm="HS256", headers={"kid": "2024b"})
+    with pytest.raises(jwt.PyJWTError):
+        new.decode(forged)
+
+
+def test_token_cache_serves_verified_claims_until_expiry():
+    key_set = SigningKeySet.parse("k1:secret")
+    cache = TokenCache(key_set, maxsize=10)
+    token = key_set.encode(claims(seconds=1))
+
+    assert cache.decode(token)["sub"] == "1"
+    assert cache.decode(token)["sub"] == "1"
+    assert cache.stats()["hits"] == 1
+
+    time.sleep(1.1)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        cache.decode(token)
+
+    skewed = TokenCache(key_set, maxsize=10, leeway=30)
+    assert skewed.decode(token)["sub"] == "1"
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_malformed_token_is_rejected(client):
+    response = await client.get("/receipts/", headers={"Authorization": "Bearer not-a-jwt"})
+    assert response.status_code == 401
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app.models import User, Receipt, ReceiptItem
+from app.schemas import ReceiptCreate
+from app.services import calculate_receipt_totals
+from app.write_behind import ReceiptWriteBehind
+from tests.conftest import async_session_maker
+
+
+def make_receipt(name: str, quantity: str) -> ReceiptCreate:
+    return ReceiptCreate(
+        products=[{"name": name, "price": "1.50", "quantity": quantity}],
+        payment={"type": "cash", "amount": "100.00"},
+    )
+
+
+async def submit(writer: ReceiptWriteBehind, user_id: int, receipt_data: ReceiptCreate) -> int:
+    total, rest = calculate_receipt_totals(receipt_data)
+    return await writer.submit(user_id, receipt_data, total, rest, datetime.utcnow())
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_write_behind_groups_receipts_into_one_flush():
+    async with async_session_maker() as session:
+        user = User(username="writebehind", login="writebehindflush", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    writer = ReceiptWriteBehind(async_session_maker, ack='flush', batch_size=50, flush_interval_ms=50)
+    writer.start()
+    try:
+        receipt_ids = await asyncio.gather(
+            *(submit(writer, user.id, make_receipt("WriteBehindTea", str(i + 1))) for i in range(10))
+        )
+    finally:
+        await writer.stop()
+
+    assert len(set(receipt_ids)) == 10
+    assert writer.stats()["flushes"] == 1
+    assert writer.stats()["flushed_receipts"] == 10
+
+    async with async_session_maker() as session:
+        count = await session.execute(select(func.count()).select_from(Receipt).where(Receipt.user_id == user.id))
+        assert count.scalar() == 10
+        items = await session.execute(select(func.count()).where(ReceiptItem.receipt_id.in_(receipt_ids)))
+        assert items.scalar() == 10
+
+
+@pytest.mark.asyncio(scope='session')
+async def test_write_behind_enqueue_ack_flushes_on_stop():
+    async with async_session_maker() as session:
+        user = User(username="writebehind", login="writebehindenqueue", hashed_password="hashed_password")
+        session.add(user)
+        await session.commit()
+
+    writer = ReceiptWriteBehind(async_session_maker, ack='enqueue', flush_interval_ms=1000)
+    writer.start()
+    receipt_id = await submit(writer, user.id, make_receipt("WriteBehindCoffee", "2"))
+    await writer.stop()
+
+    async with async_session_maker() as session:
+        receipt = await session.get(Receipt, receipt_id)
+        assert receipt is not None
+        assert receipt.user_id == user.id